@@ -1,23 +1,232 @@
 """Endpoints del chat"""
 
-from fastapi import APIRouter, HTTPException, Depends, Request, Query
+from fastapi import APIRouter, HTTPException, Depends, Request, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from contextlib import aclosing, nullcontext
 from datetime import datetime
-from typing import Optional
+from typing import AsyncIterator, Awaitable, Optional, TypeVar
+import asyncio
+import json
 
-from ...llm.agent import ChatFitAgent
+from ...llm.admission import AdmissionRejected, admission_controller
+from ...llm.agent_pool import agent_pool
 from ...llm.llm_factory import LLMFactory
+from ...llm.summarizer import conversation_summarizer
 from ...iot.xiaomi_client import xiaomi_client
 from ...database.chat_db import ChatMemoryDB
+from ...core.deadline import Deadline
+from ...core.executor import run_blocking
+from ...core.metrics import metrics
 from .models import ChatRequest, ChatResponse, ModelListResponse
 
 router = APIRouter()
 
+T = TypeVar("T")
+
 # Cache de datos del wearable
 _wearable_cache = {"data": None, "timestamp": None}
 
 # Cache de modelos por sesión
 _session_models = {}
 
+# Frases que piden recordar el primer mensaje de la conversación
+RECALL_TRIGGERS = [
+    'primer mensaje',
+    'mi primer mensaje',
+    'recordar mi primer mensaje',
+    'recuerda mi primer mensaje',
+    'cuál fue mi primer mensaje',
+    'que fue mi primer mensaje',
+    'primer mensaje de esta conversación'
+]
+
+
+def _resolve_model(request: ChatRequest, session_id: str):
+    """Proveedor y modelo para la petición (petición > sesión > configuración)"""
+    from ...config import settings
+
+    # Determinar proveedor y modelo
+    llm_provider = request.llm_provider or _session_models.get(session_id, {}).get("provider", settings.llm_provider)
+    
+    # Obtener modelo por defecto del proveedor seleccionado
+    default_model = getattr(settings, f"{llm_provider}_model", "")
+    model_name = request.model_name or _session_models.get(session_id, {}).get("model", default_model)
+    
+    print(f"🔧 PARÁMETROS RECIBIDOS:")
+    print(f"   - llm_provider: {request.llm_provider}")
+    print(f"   - model_name: {request.model_name}")
+    print(f"   - message: {request.message[:50]}...")
+    print(f"🔧 CONFIGURACIÓN FINAL:")
+    print(f"   - llm_provider: {llm_provider}")
+    print(f"   - model_name: {model_name}")
+    
+    # Guardar en caché de sesión
+    _session_models[session_id] = {
+        "provider": llm_provider,
+        "model": model_name
+    }
+    return llm_provider, model_name
+
+
+async def _get_wearable_data(include_wearable: bool) -> Optional[dict]:
+    """Datos del wearable, reutilizando la caché si es reciente (< 5 minutos)"""
+    if not include_wearable:
+        return None
+
+    from datetime import timedelta
+    now = datetime.now()
+    
+    if (_wearable_cache["data"] is None or 
+        _wearable_cache["timestamp"] is None or
+        now - _wearable_cache["timestamp"] > timedelta(minutes=5)):
+        
+        wearable_data = await xiaomi_client.get_daily_summary()
+        _wearable_cache["data"] = wearable_data
+        _wearable_cache["timestamp"] = now
+        return wearable_data
+
+    return _wearable_cache["data"]
+
+
+def _recall_first_message(message: str, chat_id: Optional[str], chat_history: list) -> Optional[str]:
+    """
+    Manejo especial: "¿cuál fue mi primer mensaje?"
+
+    Returns:
+        Respuesta ya guardada en el historial, o None si el mensaje no lo pide
+        (bloqueante: se ejecuta en el pool)
+    """
+    msg_lower = message.lower()
+    if not any(trigger in msg_lower for trigger in RECALL_TRIGGERS):
+        return None
+
+    # Intentar obtener el primer mensaje del chat guardado
+    first_msg_text = None
+    if chat_id:
+        chat_obj = ChatMemoryDB.get_chat(chat_id)
+        if chat_obj and chat_obj.messages:
+            for m in chat_obj.messages:
+                if m.role == 'user':
+                    first_msg_text = m.content
+                    break
+    # Fallback: buscar en chat_history enviado por el cliente
+    if not first_msg_text and chat_history:
+        for m in chat_history:
+            if m['role'] == 'user':
+                first_msg_text = m['content']
+                break
+
+    if first_msg_text:
+        response_text = f"¡Claro! Tu primer mensaje fue: \"{first_msg_text}\""
+    else:
+        response_text = "No encuentro el primer mensaje en esta conversación."
+
+    # Guardar la respuesta en el historial si corresponde
+    if chat_id:
+        try:
+            ChatMemoryDB.add_message(chat_id, role='assistant', content=response_text)
+        except Exception as e:
+            print(f"⚠️ Error guardando respuesta de 'recuerdo': {e}")
+
+    return response_text
+
+
+def _conversation_context(chat_id: Optional[str], chat_history: list):
+    """
+    Historial para el agente: (mensajes, resumen)
+
+    Si el chat guardado tiene resumen, resumen + mensajes posteriores del
+    historial guardado; si no, el historial enviado por el cliente.
+    """
+    from ...config import settings
+
+    if not chat_id or not settings.chat_summary_enabled:
+        return chat_history, None
+    return conversation_summarizer.context(chat_id, chat_history)
+
+
+def _save_turn(chat_id: str, user_message: str, result: dict, model_name: Optional[str]):
+    """Guarda pregunta y respuesta de un turno (bloqueante: se ejecuta en el pool)"""
+    try:
+        # Pregunta y respuesta quedan consecutivas aunque haya otra
+        # petición concurrente sobre el mismo chat
+        with ChatMemoryDB.lock_chat(chat_id):
+            # Guardar mensaje del usuario
+            ChatMemoryDB.add_message(
+                chat_id,
+                role="user",
+                content=user_message
+            )
+
+            # Guardar respuesta del asistente
+            ChatMemoryDB.add_message(
+                chat_id,
+                role="assistant",
+                content=result["response"],
+                model_used=model_name,
+                tools_used=result.get("tools_used", [])
+            )
+
+        print(f"✅ Mensajes guardados en chat {chat_id}")
+
+        from ...config import settings
+        if settings.chat_summary_enabled:
+            conversation_summarizer.maybe_schedule(chat_id)
+    except Exception as e:
+        print(f"⚠️ Error guardando mensajes: {e}")
+
+
+def _admission_slot(llm_provider: str, model_name: Optional[str], session_id: str, deadline: Deadline):
+    """Hueco en el control de admisión para ejecutar el agente (sin límite si está desactivado)"""
+    from ...config import settings
+
+    if not settings.admission_enabled:
+        return nullcontext()
+    return admission_controller.slot(llm_provider, model_name, session_id, deadline)
+
+
+def _rejection(e: AdmissionRejected) -> HTTPException:
+    return HTTPException(
+        status_code=e.status_code,
+        detail=f"Servidor ocupado: {e.reason}. Reintenta en {e.retry_after}s",
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+
+def _rejection_event(e: AdmissionRejected) -> dict:
+    return {
+        "type": "error",
+        "error": f"Servidor ocupado: {e.reason}",
+        "status": e.status_code,
+        "retry_after": e.retry_after
+    }
+
+
+async def _cancel_on_disconnect(request_obj: Request, awaitable: Awaitable[T]) -> T:
+    """
+    Espera `awaitable` vigilando la conexión
+
+    Si el cliente se desconecta se cancela la tarea (y con ella la generación
+    en curso en el proveedor) en lugar de terminar una respuesta que nadie leerá.
+    """
+    from ...config import settings
+
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=settings.disconnect_poll_interval)
+            if done:
+                return task.result()
+            if await request_obj.is_disconnected():
+                metrics.inc("cancel.client_disconnect")
+                print("🔌 Cliente desconectado: cancelando la generación")
+                raise HTTPException(status_code=499, detail="Cliente desconectado")
+    finally:
+        if not task.done():
+            task.cancel()
+
+
 @router.post("/", response_model=ChatResponse)
 async def chat(request: ChatRequest, request_obj: Request, chat_id: Optional[str] = Query(None)):
     """
@@ -28,117 +237,58 @@ async def chat(request: ChatRequest, request_obj: Request, chat_id: Optional[str
     - Usa agente LLM con herramientas
     - Retorna respuesta enriquecida
     - Guarda en historial de chats si se proporciona chat_id
+
+    Todo el trabajo bloqueante (creación del agente si no está en el pool,
+    RAG, LLM síncronos, historial) corre fuera del event loop, así las
+    peticiones concurrentes se solapan en lugar de esperar en cola.
+
+    El agente tiene `chat_deadline_seconds` desde que llega la petición
+    (respuesta parcial si se agota) y se cancela si el cliente se desconecta.
     """
+    from ...config import settings
+
+    deadline = Deadline(settings.chat_deadline_seconds)
     try:
         session_id = request_obj.client.host if request_obj.client else "default"
-        
-        # ✅ CORREGIDO: Usar configuración real en lugar de valores hardcodeados
-        from ...config import settings
-        
-        # Determinar proveedor y modelo
-        llm_provider = request.llm_provider or _session_models.get(session_id, {}).get("provider", settings.llm_provider)
-        
-        # Obtener modelo por defecto del proveedor seleccionado
-        default_model = getattr(settings, f"{llm_provider}_model", "")
-        model_name = request.model_name or _session_models.get(session_id, {}).get("model", default_model)
-        
-        # ✅ AGREGAR: Logs de depuración
-        print(f"🔧 PARÁMETROS RECIBIDOS:")
-        print(f"   - llm_provider: {request.llm_provider}")
-        print(f"   - model_name: {request.model_name}")
-        print(f"   - message: {request.message[:50]}...")
-        print(f"🔧 CONFIGURACIÓN FINAL:")
-        print(f"   - llm_provider: {llm_provider}")
-        print(f"   - model_name: {model_name}")
-        
-        # Guardar en caché de sesión
-        _session_models[session_id] = {
-            "provider": llm_provider,
-            "model": model_name
-        }
+        llm_provider, model_name = _resolve_model(request, session_id)
 
         # Obtener datos del wearable si se solicita
-        wearable_data = None
-        if request.include_wearable:
-            # Usar cache si es reciente (< 5 minutos)
-            from datetime import timedelta
-            now = datetime.now()
-            
-            if (_wearable_cache["data"] is None or 
-                _wearable_cache["timestamp"] is None or
-                now - _wearable_cache["timestamp"] > timedelta(minutes=5)):
-                
-                wearable_data = await xiaomi_client.get_daily_summary()
-                _wearable_cache["data"] = wearable_data
-                _wearable_cache["timestamp"] = now
-            else:
-                wearable_data = _wearable_cache["data"]
-        
-        # Crear agente con configuración
-        agent = ChatFitAgent(
-            wearable_data=wearable_data,
-            llm_provider=llm_provider,
-            model_name=model_name
-        )
+        wearable_data = await _get_wearable_data(request.include_wearable)
         
         # Convertir historial a formato dict
         chat_history = [msg.dict() for msg in request.chat_history]
-        
-        # ==================== Manejo especial: recordar primer mensaje ====================
-        msg_lower = request.message.lower()
-        recall_triggers = [
-            'primer mensaje',
-            'mi primer mensaje',
-            'recordar mi primer mensaje',
-            'recuerda mi primer mensaje',
-            'cuál fue mi primer mensaje',
-            'que fue mi primer mensaje',
-            'primer mensaje de esta conversación'
-        ]
-
-        if any(trigger in msg_lower for trigger in recall_triggers):
-            # Intentar obtener el primer mensaje del chat guardado
-            first_msg_text = None
-            if chat_id:
-                chat_obj = ChatMemoryDB.get_chat(chat_id)
-                if chat_obj and chat_obj.messages:
-                    for m in chat_obj.messages:
-                        if m.role == 'user':
-                            first_msg_text = m.content
-                            break
-            # Fallback: buscar en chat_history enviado por el cliente
-            if not first_msg_text and chat_history:
-                for m in chat_history:
-                    if m['role'] == 'user':
-                        first_msg_text = m['content']
-                        break
-
-            if first_msg_text:
-                response_text = f"¡Claro! Tu primer mensaje fue: \"{first_msg_text}\""
-            else:
-                response_text = "No encuentro el primer mensaje en esta conversación."
-
-            # Guardar la respuesta en el historial si corresponde
-            if chat_id:
-                try:
-                    ChatMemoryDB.add_message(chat_id, role='assistant', content=response_text)
-                except Exception as e:
-                    print(f"⚠️ Error guardando respuesta de 'recuerdo': {e}")
 
+        recalled = await run_blocking(_recall_first_message, request.message, chat_id, chat_history)
+        if recalled is not None:
             return ChatResponse(
-                response=response_text,
+                response=recalled,
                 tools_used=[],
                 wearable_data=wearable_data,
-                model_info={"provider": agent.llm_provider, "model": agent.model_name},
+                model_info={"provider": llm_provider, "model": model_name},
                 success=True,
                 error=None
             )
+        
+        # Agente reutilizado del pool (la primera vez se crea: bloqueante)
+        agent = await run_blocking(agent_pool.get, llm_provider, model_name)
+        agent_history, summary = await run_blocking(_conversation_context, chat_id, chat_history)
+
+        async def run_agent() -> dict:
+            # Espera su turno (o se rechaza con 429/503) antes de ocupar el LLM
+            async with _admission_slot(llm_provider, model_name, session_id, deadline):
+                return await agent.achat(
+                    message=request.message,
+                    chat_history=agent_history,
+                    wearable_data=wearable_data,
+                    summary=summary,
+                    deadline=deadline
+                )
 
         # Procesar mensaje normalmente
-        result = agent.chat(
-            message=request.message,
-            chat_history=chat_history
-        )
+        try:
+            result = await _cancel_on_disconnect(request_obj, run_agent())
+        except AdmissionRejected as e:
+            raise _rejection(e)
         
         response_data = ChatResponse(
             response=result["response"],
@@ -149,31 +299,14 @@ async def chat(request: ChatRequest, request_obj: Request, chat_id: Optional[str
             error=result.get("error")
         )
         
-        # ✅ AGREGAR: Guardar en historial si se proporciona chat_id
+        # Guardar en historial si se proporciona chat_id
         if chat_id:
-            try:
-                # Guardar mensaje del usuario
-                ChatMemoryDB.add_message(
-                    chat_id,
-                    role="user",
-                    content=request.message
-                )
-                
-                # Guardar respuesta del asistente
-                ChatMemoryDB.add_message(
-                    chat_id,
-                    role="assistant",
-                    content=result["response"],
-                    model_used=model_name,
-                    tools_used=result.get("tools_used", [])
-                )
-                
-                print(f"✅ Mensajes guardados en chat {chat_id}")
-            except Exception as e:
-                print(f"⚠️ Error guardando mensajes: {e}")
+            await run_blocking(_save_turn, chat_id, request.message, result, model_name)
         
         return response_data
         
+    except HTTPException:
+        raise
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -183,6 +316,173 @@ async def chat(request: ChatRequest, request_obj: Request, chat_id: Optional[str
             detail=f"Error en el chat: {str(e)}"
         )
 
+
+# ==================== STREAMING ====================
+
+async def _stream_chat_events(
+    request: ChatRequest,
+    session_id: str,
+    chat_id: Optional[str],
+    llm_provider: str,
+    model_name: Optional[str],
+    deadline: Deadline
+) -> AsyncIterator[dict]:
+    """
+    Eventos de un turno de chat a medida que se producen
+
+    start → retrieval → (tool_start / tool_end)* → token* → done.
+    El turno se guarda en el historial al completarse, antes de "done".
+    Si el consumidor deja de iterar (cliente desconectado), se cancela el agente.
+
+    Raises:
+        AdmissionRejected: no hay hueco para el agente (cola llena o plazo)
+    """
+    yield {"type": "start", "model_info": {"provider": llm_provider, "model": model_name}}
+
+    wearable_data = await _get_wearable_data(request.include_wearable)
+    chat_history = [msg.dict() for msg in request.chat_history]
+
+    recalled = await run_blocking(_recall_first_message, request.message, chat_id, chat_history)
+    if recalled is not None:
+        result = {
+            "response": recalled,
+            "tools_used": [],
+            "model_info": {"provider": llm_provider, "model": model_name},
+            "success": True
+        }
+        yield {"type": "token", "content": recalled}
+    else:
+        agent = await run_blocking(agent_pool.get, llm_provider, model_name)
+        agent_history, summary = await run_blocking(_conversation_context, chat_id, chat_history)
+
+        result = None
+        # aclosing: al salir antes de tiempo se cierra ya el generador del
+        # agente (y se cancela su tarea), sin esperar al recolector
+        async with _admission_slot(llm_provider, model_name, session_id, deadline):
+            async with aclosing(agent.astream_chat(
+                message=request.message,
+                chat_history=agent_history,
+                wearable_data=wearable_data,
+                summary=summary,
+                deadline=deadline
+            )) as events:
+                async for event in events:
+                    if event["type"] == "done":
+                        result = event["result"]
+                    else:
+                        yield event
+
+        if chat_id:
+            await run_blocking(_save_turn, chat_id, request.message, result, model_name)
+
+    response = ChatResponse(
+        response=result["response"],
+        tools_used=result.get("tools_used", []),
+        wearable_data=wearable_data,
+        model_info=result.get("model_info", {}),
+        success=result["success"],
+        error=result.get("error")
+    )
+    yield {"type": "done", **response.model_dump()}
+
+
+def _sse(event: dict) -> str:
+    """Formatea un evento como Server-Sent Event"""
+    data = json.dumps(event, ensure_ascii=False, default=str)
+    return f"event: {event['type']}\ndata: {data}\n\n"
+
+
+@router.post("/stream")
+async def chat_stream(request: ChatRequest, request_obj: Request, chat_id: Optional[str] = Query(None)):
+    """
+    Chat con streaming (Server-Sent Events)
+
+    Mismo cuerpo y parámetros que POST /chat/. Emite eventos `start`,
+    `retrieval`, `tool_start`, `tool_end`, `token` (fragmentos de la respuesta
+    final) y `done` (respuesta completa, mismo formato que ChatResponse).
+    Si algo falla se emite `error`.
+
+    Si el agente no puede admitir la petición se responde 429/503 con
+    Retry-After antes de abrir el stream.
+    """
+    from ...config import settings
+
+    deadline = Deadline(settings.chat_deadline_seconds)
+    session_id = request_obj.client.host if request_obj.client else "default"
+    llm_provider, model_name = _resolve_model(request, session_id)
+    if settings.admission_enabled:
+        try:
+            admission_controller.check(llm_provider, model_name, session_id, deadline)
+        except AdmissionRejected as e:
+            raise _rejection(e)
+
+    async def event_source():
+        try:
+            async with aclosing(_stream_chat_events(request, session_id, chat_id, llm_provider, model_name, deadline)) as events:
+                async for event in events:
+                    yield _sse(event)
+        except AdmissionRejected as e:
+            # Se llenó la cola entre la comprobación y el turno del agente
+            yield _sse(_rejection_event(e))
+        except (asyncio.CancelledError, GeneratorExit):
+            # Starlette cancela el stream cuando el cliente se desconecta
+            metrics.inc("cancel.client_disconnect")
+            print("🔌 Cliente SSE desconectado: cancelando la generación")
+            raise
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            yield _sse({"type": "error", "error": f"Error en el chat: {str(e)}"})
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.websocket("/ws")
+async def chat_websocket(websocket: WebSocket):
+    """
+    Chat con streaming por WebSocket
+
+    Cada mensaje del cliente es un JSON con los campos de ChatRequest más
+    `chat_id` opcional; el servidor responde con los mismos eventos que
+    /chat/stream, uno por mensaje. La conexión admite varios turnos.
+    """
+    await websocket.accept()
+    session_id = websocket.client.host if websocket.client else "default"
+
+    try:
+        while True:
+            payload = await websocket.receive_json()
+            chat_id = payload.pop("chat_id", None) if isinstance(payload, dict) else None
+            try:
+                request = ChatRequest(**payload)
+            except (TypeError, ValidationError) as e:
+                await websocket.send_text(json.dumps({"type": "error", "error": str(e)}, ensure_ascii=False))
+                continue
+
+            from ...config import settings
+
+            deadline = Deadline(settings.chat_deadline_seconds)
+            llm_provider, model_name = _resolve_model(request, session_id)
+            try:
+                async with aclosing(_stream_chat_events(request, session_id, chat_id, llm_provider, model_name, deadline)) as events:
+                    async for event in events:
+                        await websocket.send_text(json.dumps(event, ensure_ascii=False, default=str))
+            except AdmissionRejected as e:
+                await websocket.send_text(json.dumps(_rejection_event(e), ensure_ascii=False))
+            except WebSocketDisconnect:
+                metrics.inc("cancel.client_disconnect")
+                raise
+            except Exception as e:
+                import traceback
+                traceback.print_exc()
+                await websocket.send_text(json.dumps({"type": "error", "error": f"Error en el chat: {str(e)}"}, ensure_ascii=False))
+    except WebSocketDisconnect:
+        print("🔌 WebSocket de chat desconectado")
+
 @router.get("/models", response_model=list)
 async def list_available_models():
     """
@@ -191,6 +491,7 @@ async def list_available_models():
     try:
         from ...config import settings
         
+        # Estado cacheado de los proveedores (no espera a la red)
         available_models = LLMFactory.get_available_models()
         
         response = []
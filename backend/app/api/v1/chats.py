@@ -1,7 +1,7 @@
 """Endpoints para gestión de chats e historial"""
 
 from fastapi import APIRouter, HTTPException, Query
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, time, timedelta, timezone
 try:
     from zoneinfo import ZoneInfo
 except Exception:
@@ -10,6 +10,7 @@ from typing import List, Optional
 from pydantic import BaseModel
 
 from ...database.chat_db import ChatMemoryDB
+from ...database.summary_index import iso_to_epoch
 
 router = APIRouter()
 
@@ -47,6 +48,9 @@ class ChatGrouped(BaseModel):
     this_week: List[ChatListItem] = []
     this_month: List[ChatListItem] = []
     older: List[ChatListItem] = []
+    has_more: bool = False
+    next_cursor: Optional[str] = None
+    next_cursor_id: Optional[str] = None
 
 
 class ChatDetailResponse(BaseModel):
@@ -105,9 +109,8 @@ async def create_sample_chat(days_ago: int = 7, title: Optional[str] = None):
         chat_id = ChatMemoryDB.create_chat(title)
 
         # Ajustar timestamps del chat
-        chats = ChatMemoryDB._load_chats()
-        if chat_id in chats:
-            chat = chats[chat_id]
+        chat = ChatMemoryDB.get_chat(chat_id)
+        if chat:
             chat.created_at = created_at
             chat.updated_at = created_at
 
@@ -132,7 +135,7 @@ async def create_sample_chat(days_ago: int = 7, title: Optional[str] = None):
                 })
 
             # Guardar cambios
-            ChatMemoryDB._save_chats(chats)
+            ChatMemoryDB.save_chat(chat)
 
             return {"success": True, "chat_id": chat_id, "days_ago": days_ago}
         else:
@@ -158,43 +161,64 @@ async def create_sample_chats():
 @router.get("/chats", response_model=ChatGrouped)
 async def list_chats_grouped(
     user_tz: Optional[str] = Query(None, description="IANA timezone (e.g. Europe/Madrid). If provided, grouping by days will use this timezone."),
-    user_tz_offset: Optional[int] = Query(None, description="Timezone offset in minutes as returned by new Date().getTimezoneOffset() (e.g. 300 for UTC-5)")
+    user_tz_offset: Optional[int] = Query(None, description="Timezone offset in minutes as returned by new Date().getTimezoneOffset() (e.g. 300 for UTC-5)"),
+    before: Optional[str] = Query(None, description="Cursor: updated_at (ISO or epoch seconds) of the last chat of the previous page (next_cursor)"),
+    before_id: Optional[str] = Query(None, description="Cursor tie-breaker: chat_id of the last chat of the previous page (next_cursor_id)"),
+    limit: int = Query(1000, ge=1, le=1000, description="Maximum number of chats in this page")
 ):
     """
-    Lista todos los chats agrupados por período
+    Lista los chats agrupados por período, paginados por cursor
 
     - Hoy (según la hora local del usuario)
     - Esta semana (últimos 7 días)
     - Este mes (últimos 30 días)
     - Anterior (más de 30 días)
+
+    Para la siguiente página se pasan `next_cursor` y `next_cursor_id` como
+    `before` y `before_id`.
     """
     try:
-        # Hora base en UTC y lista de chats
-        now_utc = datetime.now(timezone.utc)
-        chats = ChatMemoryDB.list_chats(limit=1000)
-
-        # Preparar variables
-        offset_minutes = None
-        use_offset = False
-        user_tzinfo = None
-
-        # Preferimos IANA tz si viene; si no, usamos offset si viene
+        before_ts = None
+        if before:
+            try:
+                before_ts = float(before)
+            except ValueError:
+                try:
+                    before_ts = iso_to_epoch(before)
+                except ValueError:
+                    raise HTTPException(status_code=400, detail="Cursor 'before' inválido")
+
+        # Se pide uno más para saber si hay otra página
+        summaries = ChatMemoryDB.list_chat_summaries(limit=limit + 1, before_ts=before_ts, before_id=before_id)
+        has_more = len(summaries) > limit
+        summaries = summaries[:limit]
+
+        # Zona horaria del usuario: preferimos IANA tz si viene; si no, el
+        # offset (minutos, como getTimezoneOffset); si no, UTC
+        user_tzinfo = timezone.utc
         if user_tz and ZoneInfo is not None:
             try:
                 user_tzinfo = ZoneInfo(user_tz)
-                now_user = now_utc.astimezone(user_tzinfo)
             except Exception:
-                now_user = now_utc
-                user_tzinfo = None
+                pass
         elif user_tz_offset is not None:
             try:
-                offset_minutes = int(user_tz_offset)
-                now_user = now_utc - timedelta(minutes=offset_minutes)
-                use_offset = True
+                user_tzinfo = timezone(-timedelta(minutes=int(user_tz_offset)))
             except Exception:
-                now_user = now_utc
-        else:
-            now_user = now_utc
+                pass
+
+        # Inicio (epoch) de cada día local, calculado una vez por petición
+        local_today = datetime.now(timezone.utc).astimezone(user_tzinfo).date()
+
+        def day_start(days_back: int) -> float:
+            day = local_today - timedelta(days=days_back)
+            return datetime.combine(day, time(), tzinfo=user_tzinfo).timestamp()
+
+        tomorrow_ts = day_start(-1)
+        today_ts = day_start(0)
+        yesterday_ts = day_start(1)
+        week_ts = day_start(7)
+        month_ts = day_start(30)
 
         today = []
         yesterday = []
@@ -202,40 +226,35 @@ async def list_chats_grouped(
         this_month = []
         older = []
 
-        for chat in chats:
-            # Parse updated_at e interpretar como UTC si no tiene tz
-            updated = datetime.fromisoformat(chat["updated_at"])
-            if updated.tzinfo is None:
-                updated = updated.replace(tzinfo=timezone.utc)
-
-            # Calcular la hora "local" del usuario según la preferencia
-            if use_offset and offset_minutes is not None:
-                updated_user = (updated.astimezone(timezone.utc) - timedelta(minutes=offset_minutes))
-            elif user_tzinfo is not None:
-                updated_user = updated.astimezone(user_tzinfo)
-            else:
-                updated_user = updated.astimezone(timezone.utc)
-
-            days_ago = (now_user.date() - updated_user.date()).days
+        for summary in summaries:
+            ts = summary.updated_ts
+            chat = summary.to_dict()
 
-            if days_ago == 0:
+            if today_ts <= ts < tomorrow_ts:
                 today.append(chat)
-            elif days_ago == 1:
+            elif yesterday_ts <= ts < today_ts:
                 yesterday.append(chat)
-            elif 1 < days_ago <= 7:
+            elif week_ts <= ts < yesterday_ts:
                 this_week.append(chat)
-            elif 7 < days_ago <= 30:
+            elif month_ts <= ts < week_ts:
                 this_month.append(chat)
             else:
                 older.append(chat)
 
+        last = summaries[-1] if summaries and has_more else None
+
         return ChatGrouped(
             today=today,
             yesterday=yesterday,
             this_week=this_week,
             this_month=this_month,
-            older=older
+            older=older,
+            has_more=has_more,
+            next_cursor=str(last.updated_ts) if last else None,
+            next_cursor_id=last.chat_id if last else None
         )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -433,31 +452,38 @@ async def get_all_session_memory(session_id: str):
 
 # ==================== RAG / Vector Store ====================
 @router.post("/rag/reindex", response_model=dict)
-async def rag_reindex_all():
-    """Resetea y reindexa la colección de RAG con los mensajes actuales"""
-    try:
-        from ..rag.vector_store import vector_store
-        if not vector_store:
-            raise HTTPException(status_code=500, detail="Vector store no inicializado")
+async def rag_reindex_all(
+    resume: bool = Query(False, description="Continuar desde el último checkpoint"),
+    full: bool = Query(False, description="Resetear la colección y recalcular todo")
+):
+    """
+    Lanza el reindexado de la colección de RAG con los mensajes actuales
 
-        # Resetear (incluye re-poblar conocimiento inicial)
-        vector_store.reset()
+    Se ejecuta en segundo plano; el progreso se consulta en /rag/reindex/status.
+    Por defecto es incremental: solo se codifican los mensajes nuevos o
+    modificados y se borran los vectores de mensajes que ya no existen. Con
+    `full` la colección se resetea (incluye re-poblar el conocimiento inicial).
+    """
+    from ...rag.indexer import reindex_job
 
-        chats = ChatMemoryDB._load_chats()
-        added = 0
-        for chat_id, chat in chats.items():
-            for msg in chat.messages:
-                try:
-                    vector_store.add_documents(
-                        texts=[msg.content],
-                        metadatas=[{"chat_id": chat_id, "role": msg.role, "timestamp": msg.timestamp}]
-                    )
-                    added += 1
-                except Exception as ie:
-                    print(f"⚠️ No se pudo indexar mensaje {chat_id}: {ie}")
-
-        return {"success": True, "added": added}
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    try:
+        job = reindex_job.start(resume=resume, incremental=not full)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"success": True, "job": job}
+
+
+@router.get("/rag/reindex/status", response_model=dict)
+async def rag_reindex_status():
+    """Progreso y velocidad (docs/s) del reindexado"""
+    from ...rag.indexer import reindex_job
+    return reindex_job.status()
+
+
+@router.post("/rag/reindex/cancel", response_model=dict)
+async def rag_reindex_cancel():
+    """Detiene el reindexado tras el lote actual (se puede reanudar con resume=true)"""
+    from ...rag.indexer import reindex_job
+    if not reindex_job.cancel():
+        raise HTTPException(status_code=409, detail="No hay ningún reindexado en curso")
+    return {"success": True}
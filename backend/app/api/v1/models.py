@@ -14,7 +14,7 @@ class ChatRequest(BaseModel):
     message: str = Field(..., description="Mensaje del usuario")
     chat_history: Optional[List[Message]] = Field(default=[], description="Historial de conversación")
     include_wearable: bool = Field(default=True, description="Incluir datos del wearable")
-    llm_provider: Optional[str] = Field(default=None, description="Proveedor LLM (openai, ollama, huggingface)")
+    llm_provider: Optional[str] = Field(default=None, description="Proveedor LLM (openai, ollama, huggingface, groq, router)")
     model_name: Optional[str] = Field(default=None, description="Nombre del modelo específico")
 
 class ChatResponse(BaseModel):
@@ -1,6 +1,6 @@
 from pydantic_settings import BaseSettings
 from functools import lru_cache
-from typing import Literal, List
+from typing import Dict, Literal, List
 
 class Settings(BaseSettings):
     """Configuración centralizada de la aplicación"""
@@ -17,7 +17,10 @@ class Settings(BaseSettings):
     # ============================================
     # LLM PROVIDER
     # ============================================
-    llm_provider: Literal['openai', 'ollama', 'huggingface', 'groq'] = 'ollama'
+    llm_provider: Literal['openai', 'ollama', 'huggingface', 'groq', 'router'] = 'ollama'
+    # Modo del agente: "react" (texto Thought/Action), "tools" (tool calling
+    # nativo del proveedor) o "auto" (tools si el modelo lo soporta)
+    agent_mode: Literal['auto', 'react', 'tools'] = 'auto'
     
     # OpenAI
     openai_api_key: str = ""
@@ -29,6 +32,7 @@ class Settings(BaseSettings):
     ollama_model: str = "llama3.1:8b"
     ollama_temperature: float = 0.3
     ollama_num_ctx: int = 4096
+    ollama_keep_alive: str = "30m"  # tiempo que el modelo (y su caché KV) sigue cargado tras una petición
     
     # HuggingFace
     huggingface_model: str = "meta-llama/Llama-2-7b-chat-hf"
@@ -37,11 +41,24 @@ class Settings(BaseSettings):
     huggingface_load_in_8bit: bool = True
     huggingface_temperature: float = 0.3
     huggingface_max_length: int = 2048
+    huggingface_max_new_tokens: int = 512  # tope de tokens generados por respuesta
+    huggingface_batch_size: int = 8  # prompts concurrentes agrupados en un mismo generate
+    huggingface_batch_wait_ms: int = 20  # espera máxima para completar un lote
+    huggingface_prefix_cache_size: int = 2  # cachés KV de prompts recientes para reutilizar prefijos (0 = desactivado)
+    huggingface_prefix_min_tokens: int = 64  # prefijo común mínimo para reutilizar una caché KV
     
     # Groq
     groq_api_key: str = ""
     groq_model: str = "llama3-70b-8192"
     groq_temperature: float = 0.3
+    
+    # Enrutado entre proveedores (llm_provider="router"): cada petición va al
+    # backend sano más rápido, con failover ante 429/5xx y hedging si tarda
+    llm_routing_backends: List[str] = ["groq/llama-3.3-70b-versatile", "ollama/llama3.1:8b"]  # "proveedor/modelo@peso", por preferencia
+    llm_routing_hedge_seconds: float = 2.0  # sin primer token en este tiempo se lanza a otro backend (0 = sin hedging)
+    llm_routing_error_window: int = 20  # respuestas recientes para calcular la tasa de errores
+    llm_routing_max_error_rate: float = 0.5  # por encima, el backend deja de recibir tráfico un tiempo
+    llm_routing_cooldown_seconds: float = 30.0  # tiempo sin tráfico tras un 429 (sin Retry-After) o demasiados errores
 
     # ============================================
     # EMBEDDINGS
@@ -50,6 +67,10 @@ class Settings(BaseSettings):
     openai_embedding_model: str = "text-embedding-3-small"
     embedding_model: str = "sentence-transformers/all-MiniLM-L6-v2"
     embedding_device: str = "auto"
+    embedding_cache_size: int = 10000  # vectores en memoria (LRU)
+    embedding_cache_path: str = "./data/embeddings/cache.db"  # caché en disco ("" = desactivada)
+    embedding_batch_size: int = 32  # textos máximos por llamada al modelo
+    embedding_batch_wait_ms: int = 5  # espera para agrupar peticiones concurrentes
     
     # ============================================
     # CHROMADB
@@ -57,6 +78,93 @@ class Settings(BaseSettings):
     chroma_persist_dir: str = "./data/chroma"
     chroma_collection_name: str = "fitness_knowledge"
     rag_k: int = 4
+    rag_retrieval_mode: Literal['hybrid', 'dense'] = 'hybrid'  # hybrid = Chroma + BM25 fusionados (RRF)
+    rag_fetch_k: int = 20  # candidatos de cada recuperador antes de fusionar
+    rag_rrf_k: int = 60  # constante de reciprocal-rank fusion
+    rag_reindex_batch_size: int = 2000  # chunks por lote (un embed + un upsert)
+    rag_reindex_checkpoint_path: str = "./data/rag/reindex_checkpoint.json"
+    rag_index_queue_size: int = 10000  # mensajes pendientes de indexar (al llenarse se descartan los más antiguos)
+    rag_index_batch_size: int = 64
+    rag_index_batch_wait_ms: int = 200
+    
+    # ============================================
+    # PRESUPUESTO DE CONTEXTO
+    # ============================================
+    context_max_tokens: int = 8192  # tokens de prompt para OpenAI/Groq (Ollama: num_ctx; HF: max_length)
+    context_reserved_tokens: int = 1024  # respuesta + scratchpad ReAct (como mucho 1/4 de la ventana)
+    context_rag_share: float = 0.4  # fracción del espacio libre para documentos RAG (el resto, historial)
+    context_message_max_tokens: int = 300  # mensajes del historial más largos se recortan
+    context_estimate_margin: float = 1.1  # inflado del recuento cuando no hay tokenizador exacto (Ollama, Groq)
+    
+    # ============================================
+    # CACHÉ DE RESPUESTAS
+    # ============================================
+    response_cache_enabled: bool = True  # solo preguntas sin historial
+    response_cache_threshold: float = 0.93  # similitud coseno mínima entre preguntas
+    response_cache_ttl: float = 3600.0  # segundos de validez de una respuesta
+    response_cache_max_entries: int = 1000
+    
+    # ============================================
+    # RUTA RÁPIDA (calculadoras sin agente)
+    # ============================================
+    fast_path_enabled: bool = True
+    fast_path_phrasing: bool = False  # redactar el resultado con el LLM (una llamada) en vez de devolverlo tal cual
+    fast_path_max_chars: int = 200  # preguntas más largas van siempre al agente
+    
+    # ============================================
+    # HISTORIAL DE CHATS
+    # ============================================
+    chat_storage_backend: Literal['sqlite', 'json'] = 'sqlite'
+    chat_flush_interval: float = 2.0  # segundos entre flushes de la caché (<= 0: escritura inmediata)
+    chat_cache_max_chats: int = 256  # chats completos mantenidos en memoria
+    chat_journal_compact_bytes: int = 1024 * 1024  # backend json: tamaño del journal que dispara la compactación
+    chat_summary_enabled: bool = True  # plegar los mensajes antiguos en Chat.summary
+    chat_summary_keep_messages: int = 6  # mensajes recientes que siempre van literales
+    chat_summary_batch_messages: int = 6  # mensajes sin resumir (además de los recientes) que disparan un resumen
+    chat_summary_max_words: int = 200
+    chat_summary_provider: str = ""  # proveedor del modelo barato ("" = llm_provider)
+    chat_summary_model: str = ""  # "" = modelo por defecto del proveedor
+    
+    # ============================================
+    # CONCURRENCIA
+    # ============================================
+    blocking_pool_size: int = 16  # hilos para trabajo bloqueante (LLM síncronos, Chroma, disco)
+    agent_pool_max_resident: int = 4  # agentes (LLM + executor) reutilizados en memoria
+    agent_pool_idle_ttl: float = 900.0  # segundos sin uso antes de liberar un agente
+    chat_deadline_seconds: float = 60.0  # plazo por petición de chat (agente, herramientas y proveedor)
+    disconnect_poll_interval: float = 0.5  # cada cuánto se comprueba si el cliente sigue conectado
+    
+    # ============================================
+    # CONTROL DE ADMISIÓN (peticiones al agente)
+    # ============================================
+    admission_enabled: bool = True
+    # Ejecuciones simultáneas del agente por proveedor (un backend local rinde
+    # lo mismo con más peticiones a la vez, solo que todas más lentas)
+    admission_concurrency_ollama: int = 2
+    admission_concurrency_huggingface: int = 1
+    admission_concurrency_groq: int = 8
+    admission_concurrency_openai: int = 8
+    admission_concurrency_default: int = 4
+    admission_model_limits: Dict[str, int] = {}  # por modelo: {"ollama/llama3.1:8b": 1}
+    admission_max_queue: int = 32  # peticiones en espera por proveedor/modelo (más → 503)
+    admission_max_queue_per_session: int = 4  # en espera por sesión (más → 429)
+    admission_initial_service_seconds: float = 10.0  # estimación inicial para Retry-After
+    
+    # ============================================
+    # CLIENTES HTTP (proveedores LLM)
+    # ============================================
+    http_timeout: float = 120.0  # segundos de lectura (las generaciones largas tardan)
+    http_connect_timeout: float = 5.0
+    http_max_connections: int = 100
+    http_max_keepalive: int = 20
+    http_keepalive_expiry: float = 30.0
+    http2_enabled: bool = True  # solo si el paquete h2 está instalado
+    
+    # Estado de proveedores (caché de sondeos)
+    provider_status_ttl: float = 30.0  # segundos que se considera válido un sondeo
+    provider_status_refresh_interval: float = 15.0  # sondeo en segundo plano (0 = desactivado)
+    provider_circuit_failures: int = 3  # fallos seguidos para abrir el circuito
+    provider_circuit_open_seconds: float = 60.0  # tiempo sin sondear con el circuito abierto
     
     # ============================================
     # XIAOMI WEARABLE
@@ -0,0 +1,70 @@
+"""Plazo máximo por petición, propagado por contextvars hasta las llamadas a los proveedores"""
+
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from .metrics import metrics
+
+
+class DeadlineExceeded(TimeoutError):
+    """Se agotó el plazo de la petición en curso"""
+
+
+class Deadline:
+    """Instante límite (reloj monotónico) para responder una petición"""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+
+_current: "contextvars.ContextVar[Optional[Deadline]]" = contextvars.ContextVar("request_deadline", default=None)
+
+
+@contextmanager
+def deadline_scope(deadline: Optional[Deadline]) -> Iterator[Optional[Deadline]]:
+    """
+    Fija el plazo para el código que se ejecute dentro (y las tareas e hilos
+    que lance: asyncio y `run_blocking` copian el contexto)
+    """
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current.get()
+
+
+def remaining_timeout(default: Optional[float]) -> Optional[float]:
+    """Timeout para una llamada: el menor entre `default` y lo que queda del plazo"""
+    deadline = _current.get()
+    if deadline is None:
+        return default
+    remaining = max(0.1, deadline.remaining())
+    return remaining if default is None else min(default, remaining)
+
+
+def check_deadline(where: str):
+    """
+    Lanza DeadlineExceeded si el plazo ya pasó
+
+    Para los bucles síncronos (streams HTTP en hilos del pool) que no se
+    pueden cancelar desde fuera: al salir se cierra la conexión y el
+    proveedor deja de generar.
+    """
+    deadline = _current.get()
+    if deadline is not None and deadline.expired:
+        metrics.inc(f"cancel.provider.{where}")
+        raise DeadlineExceeded(f"plazo de {deadline.seconds:g}s agotado ({where})")
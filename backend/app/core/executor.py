@@ -0,0 +1,48 @@
+"""Ejecución de trabajo bloqueante fuera del event loop"""
+
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from ..config import settings
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """
+    Pool de hilos acotado para llamadas bloqueantes (LLM síncronos, Chroma,
+    embeddings, disco). El tamaño (`blocking_pool_size`) limita cuántas de
+    estas operaciones corren a la vez; el resto espera sin bloquear el loop.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.blocking_pool_size,
+                    thread_name_prefix="chatfit-blocking"
+                )
+    return _executor
+
+
+async def run_blocking(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """Ejecuta `func(*args, **kwargs)` en el pool y espera el resultado sin bloquear el loop"""
+    loop = asyncio.get_running_loop()
+    # Se propaga el contexto (contextvars) igual que asyncio.to_thread
+    ctx = contextvars.copy_context()
+    call = functools.partial(ctx.run, func, *args, **kwargs)
+    return await loop.run_in_executor(get_executor(), call)
+
+
+def shutdown_executor():
+    """Cierra el pool (sin esperar a las tareas en curso)"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
@@ -0,0 +1,78 @@
+"""Clientes HTTP compartidos (keep-alive) para los proveedores de LLM"""
+
+import importlib.util
+import threading
+from typing import Dict, Optional
+
+import httpx
+
+from ..config import settings
+
+_clients: Dict[str, httpx.Client] = {}
+_async_clients: Dict[str, httpx.AsyncClient] = {}
+_clients_lock = threading.Lock()
+
+
+def http2_available() -> bool:
+    """HTTP/2 requiere el paquete `h2` (httpx[http2])"""
+    return settings.http2_enabled and importlib.util.find_spec("h2") is not None
+
+
+def _client_options(base_url: Optional[str]) -> dict:
+    options = {
+        "limits": httpx.Limits(
+            max_connections=settings.http_max_connections,
+            max_keepalive_connections=settings.http_max_keepalive,
+            keepalive_expiry=settings.http_keepalive_expiry
+        ),
+        "timeout": httpx.Timeout(settings.http_timeout, connect=settings.http_connect_timeout),
+        "http2": http2_available()
+    }
+    if base_url:
+        options["base_url"] = base_url
+    return options
+
+
+def get_http_client(base_url: Optional[str] = None) -> httpx.Client:
+    """
+    Cliente síncrono compartido para `base_url`
+
+    Reutiliza conexiones (keep-alive) entre peticiones y agentes; los límites
+    y timeouts salen de la sección HTTP de settings.
+    """
+    key = base_url or ""
+    client = _clients.get(key)
+    if client is None or client.is_closed:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None or client.is_closed:
+                client = httpx.Client(**_client_options(base_url))
+                _clients[key] = client
+    return client
+
+
+def get_async_http_client(base_url: Optional[str] = None) -> httpx.AsyncClient:
+    """Cliente asíncrono compartido para `base_url` (usar desde el event loop de la app)"""
+    key = base_url or ""
+    client = _async_clients.get(key)
+    if client is None or client.is_closed:
+        with _clients_lock:
+            client = _async_clients.get(key)
+            if client is None or client.is_closed:
+                client = httpx.AsyncClient(**_client_options(base_url))
+                _async_clients[key] = client
+    return client
+
+
+async def close_http_clients():
+    """Cierra todos los clientes (shutdown de la app)"""
+    with _clients_lock:
+        clients = list(_clients.values())
+        async_clients = list(_async_clients.values())
+        _clients.clear()
+        _async_clients.clear()
+
+    for client in clients:
+        client.close()
+    for client in async_clients:
+        await client.aclose()
@@ -0,0 +1,95 @@
+"""Métricas en memoria del proceso (contadores y distribuciones) para /metrics"""
+
+import threading
+from collections import deque
+from typing import Deque, Dict, Optional
+
+
+class Distribution:
+    """Valores observados: totales acumulados y percentiles sobre una ventana reciente"""
+
+    def __init__(self, window: int = 1024):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._recent: Deque[float] = deque(maxlen=window)
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self._recent.append(value)
+
+    @staticmethod
+    def _percentile(values: list, q: float) -> float:
+        index = min(len(values) - 1, int(round(q * (len(values) - 1))))
+        return values[index]
+
+    def to_dict(self) -> Dict:
+        recent = sorted(self._recent)
+        if not recent:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "avg": round(self.total / self.count, 3),
+            "max": round(self.max, 3),
+            "p50": round(self._percentile(recent, 0.5), 3),
+            "p95": round(self._percentile(recent, 0.95), 3),
+            "p99": round(self._percentile(recent, 0.99), 3)
+        }
+
+
+class Metrics:
+    """
+    Registro de métricas con nombre ("embeddings.batch_size", ...)
+
+    Sin dependencias externas: los valores viven en memoria y se sirven como
+    JSON en /metrics. Seguro entre hilos.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+        self._gauges: Dict[str, float] = {}
+        self._distributions: Dict[str, Distribution] = {}
+
+    def inc(self, name: str, value: float = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set(self, name: str, value: float):
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, value: float):
+        with self._lock:
+            distribution = self._distributions.get(name)
+            if distribution is None:
+                distribution = self._distributions[name] = Distribution()
+            distribution.observe(value)
+
+    def counter(self, name: str) -> float:
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def snapshot(self, prefix: Optional[str] = None) -> Dict:
+        """Todas las métricas (o las que empiezan por `prefix`)"""
+        def keep(name: str) -> bool:
+            return prefix is None or name.startswith(prefix)
+
+        with self._lock:
+            return {
+                "counters": {k: v for k, v in sorted(self._counters.items()) if keep(k)},
+                "gauges": {k: v for k, v in sorted(self._gauges.items()) if keep(k)},
+                "distributions": {k: d.to_dict() for k, d in sorted(self._distributions.items()) if keep(k)}
+            }
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._distributions.clear()
+
+
+# Instancia global
+metrics = Metrics()
@@ -0,0 +1,288 @@
+"""Caché en proceso (write-back) delante del backend de chats"""
+
+import asyncio
+import copy
+import threading
+from collections import OrderedDict
+from dataclasses import replace
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from .locks import ChatLockManager
+from .models import Chat, Message
+from .summary_index import ChatSummary, ChatSummaryIndex
+
+
+class ChatCache:
+    """
+    Caché compartida por el proceso para ChatMemoryDB
+
+    - Mantiene los chats usados recientemente (LRU) y la memoria ya deserializados
+    - Mantiene el índice de resúmenes (ChatSummaryIndex) de todos los chats,
+      actualizado en cada escritura, para listar sin cargar mensajes
+    - Cada mutación se aplica en memoria, marca el chat como sucio y encola la
+      operación equivalente para el backend
+    - flush() persiste las operaciones pendientes en lote (una transacción en
+      SQLite, una escritura atómica por archivo en JSON)
+
+    Concurrencia: cada chat se lee y modifica bajo su propio lock
+    (ChatLockManager); `_index_lock` es global pero solo protege el LRU, el
+    índice y la cola de operaciones, y nunca se mantiene durante E/S del backend
+    salvo en la primera carga del índice. Orden de adquisición: lock del chat
+    (o `_memory_lock`) → `_index_lock`.
+    """
+
+    def __init__(self, store, max_chats: int = 256, write_through: bool = False, locks: Optional[ChatLockManager] = None):
+        self.store = store
+        self.max_chats = max_chats
+        self.write_through = write_through
+        self.locks = locks or ChatLockManager()
+
+        self._index_lock = threading.Lock()
+        self._memory_lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._chats: "OrderedDict[str, Chat]" = OrderedDict()
+        self._deleted: Set[str] = set()
+        self._memory: Optional[Dict] = None
+        self._index: Optional[ChatSummaryIndex] = None
+
+        # Operaciones pendientes: (nombre, kwargs, chat_id)
+        self._pending: List[Tuple[str, Dict, Optional[str]]] = []
+        self._dirty: Set[str] = set()
+
+    # ==================== INTERNOS ====================
+
+    def _record(self, name: str, dirty_chat: Optional[str], **kwargs):
+        """Encola una operación para el backend y marca el chat como sucio (con `_index_lock`)"""
+        self._pending.append((name, kwargs, dirty_chat))
+        if dirty_chat:
+            self._dirty.add(dirty_chat)
+
+    def _after_write(self):
+        if self.write_through:
+            self.flush()
+
+    def _load(self, chat_id: str) -> Optional[Chat]:
+        """
+        Obtiene un chat desde la caché o, si no está, desde el backend
+
+        El llamador debe tener el lock del chat: así nadie más puede cargarlo ni
+        modificarlo mientras se lee del backend.
+        """
+        with self._index_lock:
+            chat = self._chats.get(chat_id)
+            if chat is not None:
+                self._chats.move_to_end(chat_id)
+                return chat
+            if chat_id in self._deleted:
+                return None
+
+        chat = self.store.get_chat(chat_id)
+        if chat is not None:
+            with self._index_lock:
+                self._remember(chat)
+        return chat
+
+    def _remember(self, chat: Chat):
+        """Guarda el chat como más reciente en el LRU (con `_index_lock`)"""
+        self._chats[chat.chat_id] = chat
+        self._chats.move_to_end(chat.chat_id)
+        self._deleted.discard(chat.chat_id)
+
+        # Expulsar los menos usados que no tengan cambios pendientes
+        if len(self._chats) > self.max_chats:
+            for chat_id in list(self._chats):
+                if len(self._chats) <= self.max_chats:
+                    break
+                if chat_id not in self._dirty:
+                    del self._chats[chat_id]
+
+    def _commit(self, current: Chat, name: str, **kwargs):
+        """
+        Publica un chat ya modificado: encola la operación, lo fija en el LRU
+        (otro hilo pudo expulsarlo mientras se modificaba) y actualiza el índice
+        """
+        summary = ChatSummary.from_chat(current)
+        with self._index_lock:
+            self._record(name, current.chat_id, **kwargs)
+            self._remember(current)
+            self._index_state().put(summary)
+
+    def _memory_state(self) -> Dict:
+        if self._memory is None:
+            self._memory = self.store.load_memory()
+            self._memory.setdefault("global", {})
+            self._memory.setdefault("sessions", {})
+        return self._memory
+
+    def _index_state(self) -> ChatSummaryIndex:
+        if self._index is None:
+            self._index = ChatSummaryIndex(
+                ChatSummary.from_dict(row) for row in self.store.list_summaries()
+            )
+        return self._index
+
+    @staticmethod
+    def _copy(chat: Chat) -> Chat:
+        """Copia independiente de la lista de mensajes para devolver al llamador"""
+        return replace(chat, messages=list(chat.messages))
+
+    @staticmethod
+    def _snapshot(chat: Chat) -> Chat:
+        """Copia profunda normalizada (los mensajes en dict pasan a Message)"""
+        return Chat.from_dict(chat.to_dict())
+
+    # ==================== CHATS ====================
+
+    def insert_chat(self, chat: Chat):
+        with self.locks.lock(chat.chat_id):
+            self._commit(self._snapshot(chat), "insert_chat", chat=self._snapshot(chat))
+        self._after_write()
+
+    def save_chat(self, chat: Chat):
+        with self.locks.lock(chat.chat_id):
+            self._commit(self._snapshot(chat), "save_chat", chat=self._snapshot(chat))
+        self._after_write()
+
+    def append_message(self, chat_id: str, message: Message, updated_at: str) -> bool:
+        with self.locks.lock(chat_id):
+            chat = self._load(chat_id)
+            if chat is None:
+                return False
+            chat.messages.append(message)
+            chat.updated_at = updated_at
+            self._commit(chat, "append_message", chat_id=chat_id, message=message, updated_at=updated_at)
+        self._after_write()
+        return True
+
+    def get_chat(self, chat_id: str) -> Optional[Chat]:
+        with self.locks.lock(chat_id):
+            chat = self._load(chat_id)
+            return self._copy(chat) if chat else None
+
+    def iter_chats(self) -> Iterator[Chat]:
+        """Itera sobre todos los chats (persiste antes los cambios pendientes)"""
+        self.flush()
+        return self.store.iter_chats()
+
+    def list_chats(self, limit: int = 100) -> List[Dict]:
+        """Resúmenes más recientes primero, servidos desde el índice en memoria"""
+        return [summary.to_dict() for summary in self.list_chat_summaries(limit=limit)]
+
+    def list_chat_summaries(
+        self,
+        limit: int = 100,
+        before_ts: Optional[float] = None,
+        before_id: Optional[str] = None
+    ) -> List[ChatSummary]:
+        """Página de resúmenes por cursor (ver ChatSummaryIndex.page)"""
+        with self._index_lock:
+            return self._index_state().page(limit=limit, before_ts=before_ts, before_id=before_id)
+
+    def update_chat(self, chat_id: str, **fields) -> bool:
+        with self.locks.lock(chat_id):
+            chat = self._load(chat_id)
+            if chat is None:
+                return False
+            for key, value in fields.items():
+                setattr(chat, key, value)
+            self._commit(chat, "update_chat", chat_id=chat_id, **fields)
+        self._after_write()
+        return True
+
+    def delete_chat(self, chat_id: str) -> bool:
+        with self.locks.lock(chat_id):
+            if self._load(chat_id) is None:
+                return False
+            with self._index_lock:
+                self._chats.pop(chat_id, None)
+                self._deleted.add(chat_id)
+                self._index_state().remove(chat_id)
+                self._record("delete_chat", chat_id, chat_id=chat_id)
+        self._after_write()
+        return True
+
+    # ==================== MEMORIA ====================
+
+    def load_memory(self) -> Dict:
+        with self._memory_lock:
+            return copy.deepcopy(self._memory_state())
+
+    def get_global_memory(self, key: str, default=None):
+        with self._memory_lock:
+            memory = self._memory_state()
+            if key not in memory["global"]:
+                return default
+            return copy.deepcopy(memory["global"][key])
+
+    def set_global_memory(self, key: str, value):
+        with self._memory_lock:
+            value = copy.deepcopy(value)
+            self._memory_state()["global"][key] = value
+            with self._index_lock:
+                self._record("set_global_memory", None, key=key, value=value)
+        self._after_write()
+
+    def get_session_memory(self, session_id: str) -> Dict:
+        with self._memory_lock:
+            return copy.deepcopy(self._memory_state()["sessions"].get(session_id, {}))
+
+    def set_session_memory(self, session_id: str, key: str, value):
+        with self._memory_lock:
+            value = copy.deepcopy(value)
+            self._memory_state()["sessions"].setdefault(session_id, {})[key] = value
+            with self._index_lock:
+                self._record("set_session_memory", None, session_id=session_id, key=key, value=value)
+        self._after_write()
+
+    def clear_session_memory(self, session_id: str) -> bool:
+        with self._memory_lock:
+            sessions = self._memory_state()["sessions"]
+            if session_id not in sessions:
+                return False
+            del sessions[session_id]
+            with self._index_lock:
+                self._record("clear_session_memory", None, session_id=session_id)
+        self._after_write()
+        return True
+
+    # ==================== PERSISTENCIA ====================
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    def flush(self) -> int:
+        """
+        Persiste las operaciones pendientes en el backend
+
+        Returns:
+            Número de operaciones escritas (0 si no había o si falló; en caso
+            de error las operaciones vuelven a la cola para el siguiente intento)
+        """
+        with self._flush_lock:
+            with self._index_lock:
+                ops, self._pending = self._pending, []
+            if not ops:
+                return 0
+
+            try:
+                self.store.apply([(name, kwargs) for name, kwargs, _ in ops])
+            except Exception as e:
+                print(f"❌ Error persistiendo historial de chats: {e}")
+                with self._index_lock:
+                    self._pending = ops + self._pending
+                return 0
+
+            with self._index_lock:
+                self._dirty = {chat_id for _, _, chat_id in self._pending if chat_id}
+                self._deleted &= self._dirty
+            return len(ops)
+
+    async def flush_periodically(self, interval: float):
+        """Tarea de fondo: persiste los cambios cada `interval` segundos"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception as e:
+                print(f"⚠️ Error en flush periódico: {e}")
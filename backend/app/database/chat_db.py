@@ -1,11 +1,16 @@
 """Sistema de almacenamiento de chats y memoria"""
 
-import json
-import os
+import atexit
+import threading
+import uuid
 from datetime import datetime
 from pathlib import Path
-from typing import List, Optional, Dict
-from dataclasses import dataclass, asdict, field
+from typing import List, Optional, Dict, Iterator
+
+from .cache import ChatCache
+from .locks import ChatLockManager
+from .models import Chat, Message
+from .summary_index import ChatSummary
 
 # Directorio de datos
 DATA_DIR = Path(__file__).parent.parent.parent / "data" / "chats"
@@ -13,124 +18,85 @@ DATA_DIR.mkdir(parents=True, exist_ok=True)
 
 CHATS_FILE = DATA_DIR / "chats.json"
 MEMORY_FILE = DATA_DIR / "memory.json"
-
-
-@dataclass
-class Message:
-    """Mensaje individual en el chat"""
-    role: str  # "user" o "assistant"
-    content: str
-    timestamp: str = field(default_factory=lambda: datetime.now().isoformat())
-    model_used: Optional[str] = None
-    tools_used: List[Dict] = field(default_factory=list)
-
-    def to_dict(self):
-        return asdict(self)
-
-    @staticmethod
-    def from_dict(data):
-        return Message(**data)
-
-
-@dataclass
-class Chat:
-    """Registro de un chat completo"""
-    chat_id: str
-    title: str  # Título generado o personalizado
-    created_at: str
-    updated_at: str
-    messages: List[Message] = field(default_factory=list)
-    wearable_data_snapshot: Optional[Dict] = None  # Snapshot de datos wearable al crear
-    summary: Optional[str] = None  # Resumen del chat
-
-    def to_dict(self):
-        return {
-            "chat_id": self.chat_id,
-            "title": self.title,
-            "created_at": self.created_at,
-            "updated_at": self.updated_at,
-            "messages": [msg.to_dict() if isinstance(msg, Message) else msg for msg in self.messages],
-            "wearable_data_snapshot": self.wearable_data_snapshot,
-            "summary": self.summary
-        }
-
-    @staticmethod
-    def from_dict(data):
-        messages = [
-            Message.from_dict(msg) if isinstance(msg, dict) else msg
-            for msg in data.get("messages", [])
-        ]
-        return Chat(
-            chat_id=data["chat_id"],
-            title=data["title"],
-            created_at=data["created_at"],
-            updated_at=data["updated_at"],
-            messages=messages,
-            wearable_data_snapshot=data.get("wearable_data_snapshot"),
-            summary=data.get("summary")
+CHATS_DB_FILE = DATA_DIR / "chats.db"
+CHATS_JOURNAL_FILE = DATA_DIR / "chats.journal.jsonl"
+
+# Backend de almacenamiento y caché write-back (se crean en el primer uso)
+_store = None
+_cache = None
+_store_lock = threading.Lock()
+
+# Locks por chat compartidos por la caché y los endpoints
+chat_locks = ChatLockManager()
+
+
+def _create_store():
+    """Crea el backend configurado en settings.chat_storage_backend"""
+    from ..config import settings
+
+    backend = getattr(settings, "chat_storage_backend", "sqlite")
+    if backend == "json":
+        from .json_store import JSONChatStore
+        print("🗂️ Historial de chats: backend JSON (snapshot + journal)")
+        return JSONChatStore(
+            CHATS_FILE,
+            MEMORY_FILE,
+            journal_file=CHATS_JOURNAL_FILE,
+            compact_threshold=getattr(settings, "chat_journal_compact_bytes", 1024 * 1024)
         )
 
+    from .sqlite_store import SQLiteChatStore
+    from .migrate import migrate_json_to_sqlite, MIGRATED_FLAG
 
-class ChatMemoryDB:
-    """Base de datos de chats y memoria conversacional"""
+    store = SQLiteChatStore(CHATS_DB_FILE)
+    print(f"🗂️ Historial de chats: SQLite ({CHATS_DB_FILE.name})")
 
-    @staticmethod
-    def _load_chats() -> Dict[str, Chat]:
-        """Carga todos los chats desde archivo"""
-        if not CHATS_FILE.exists():
-            return {}
-        
+    # Migración única desde los archivos JSON legados
+    if store.get_meta(MIGRATED_FLAG) is None and store.is_empty() and (CHATS_FILE.exists() or MEMORY_FILE.exists()):
         try:
-            with open(CHATS_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                return {chat_id: Chat.from_dict(chat) for chat_id, chat in data.items()}
+            stats = migrate_json_to_sqlite(store, CHATS_FILE, MEMORY_FILE)
+            print(f"✅ Migrados {stats['chats']} chats y {stats['messages']} mensajes desde JSON")
         except Exception as e:
+            print(f"⚠️ Error migrando historial JSON: {e}")
+    return store
+
+
+def get_store():
+    """Devuelve el backend de almacenamiento compartido por el proceso"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = _create_store()
+    return _store
+
+
+def get_cache() -> ChatCache:
+    """Devuelve la caché write-back que ChatMemoryDB usa para leer y escribir"""
+    global _cache
+    if _cache is None:
+        store = get_store()
+        with _store_lock:
+            if _cache is None:
+                from ..config import settings
+                interval = getattr(settings, "chat_flush_interval", 2.0)
+                _cache = ChatCache(
+                    store,
+                    max_chats=getattr(settings, "chat_cache_max_chats", 256),
+                    write_through=interval <= 0,
+                    locks=chat_locks
+                )
+                # Último flush al terminar el proceso (scripts, reload de uvicorn...)
+                atexit.register(_cache.flush)
+    return _cache
 
 
-
-            
-            print(f"⚠️ Error cargando chats: {e}")
-            return {}
-
-    @staticmethod
-    def _save_chats(chats: Dict[str, Chat]):
-        """Guarda todos los chats en archivo"""
-        try:
-            with open(CHATS_FILE, 'w', encoding='utf-8') as f:
-                data = {chat_id: chat.to_dict() for chat_id, chat in chats.items()}
-                json.dump(data, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            print(f"❌ Error guardando chats: {e}")
-
-    @staticmethod
-    def _load_memory() -> Dict:
-        """Carga memoria global y por sesión"""
-        if not MEMORY_FILE.exists():
-            return {
-                "global": {"user_preferences": {}, "learned_habits": []},
-                "sessions": {}
-            }
-        
-        try:
-            with open(MEMORY_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception as e:
-            print(f"⚠️ Error cargando memoria: {e}")
-            return {"global": {}, "sessions": {}}
-
-    @staticmethod
-    def _save_memory(memory: Dict):
-        """Guarda memoria en archivo"""
-        try:
-            with open(MEMORY_FILE, 'w', encoding='utf-8') as f:
-                json.dump(memory, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            print(f"❌ Error guardando memoria: {e}")
+class ChatMemoryDB:
+    """Base de datos de chats y memoria conversacional"""
 
     @staticmethod
     def create_chat(title: str, wearable_data: Optional[Dict] = None) -> str:
         """Crea nuevo chat y retorna su ID"""
-        import uuid
         chat_id = str(uuid.uuid4())[:8]
         
         now = datetime.now().isoformat()
@@ -142,22 +108,19 @@ class ChatMemoryDB:
             wearable_data_snapshot=wearable_data
         )
         
-        chats = ChatMemoryDB._load_chats()
-        chats[chat_id] = chat
-        ChatMemoryDB._save_chats(chats)
+        get_cache().insert_chat(chat)
         
         print(f"✅ Chat creado: {chat_id}")
         return chat_id
 
+    @staticmethod
+    def save_chat(chat: Chat):
+        """Crea o reemplaza un chat completo (útil para importaciones y datos de prueba)"""
+        get_cache().save_chat(chat)
+
     @staticmethod
     def add_message(chat_id: str, role: str, content: str, model_used: Optional[str] = None, tools_used: Optional[List[Dict]] = None) -> bool:
         """Añade mensaje a un chat"""
-        chats = ChatMemoryDB._load_chats()
-        
-        if chat_id not in chats:
-            print(f"❌ Chat {chat_id} no encontrado")
-            return False
-        
         message = Message(
             role=role,
             content=content,
@@ -165,29 +128,28 @@ class ChatMemoryDB:
             tools_used=tools_used or []
         )
         
-        chats[chat_id].messages.append(message)
-        chats[chat_id].updated_at = datetime.now().isoformat()
-        
-        ChatMemoryDB._save_chats(chats)
+        if not get_cache().append_message(chat_id, message, datetime.now().isoformat()):
+            print(f"❌ Chat {chat_id} no encontrado")
+            return False
 
-        # Intentar indexar el mensaje en el Vector Store (RAG) para futuras recuperaciones
+        # Indexar en el Vector Store (RAG) en segundo plano: no se espera a los embeddings
         try:
-            from ..rag.vector_store import vector_store
-            if vector_store:
-                vector_store.add_documents(
-                    texts=[content],
-                    metadatas=[{"chat_id": chat_id, "role": role, "timestamp": message.timestamp}]
-                )
+            from ..rag.index_queue import index_queue
+            index_queue.enqueue(chat_id, role, content, message.timestamp)
         except Exception as e:
-            print(f"⚠️ Error indexando mensaje en RAG: {e}")
+            print(f"⚠️ Error encolando mensaje para RAG: {e}")
 
         return True
 
     @staticmethod
     def get_chat(chat_id: str) -> Optional[Chat]:
         """Obtiene un chat completo"""
-        chats = ChatMemoryDB._load_chats()
-        return chats.get(chat_id)
+        return get_cache().get_chat(chat_id)
+
+    @staticmethod
+    def iter_chats() -> Iterator[Chat]:
+        """Itera sobre todos los chats almacenados"""
+        return get_cache().iter_chats()
 
     @staticmethod
     def get_chat_history(chat_id: str) -> List[Dict]:
@@ -201,34 +163,35 @@ class ChatMemoryDB:
     @staticmethod
     def list_chats(limit: int = 100) -> List[Dict]:
         """Lista todos los chats ordenados por fecha (más recientes primero)"""
-        chats = ChatMemoryDB._load_chats()
-        sorted_chats = sorted(
-            chats.values(),
-            key=lambda x: x.updated_at,
-            reverse=True
-        )[:limit]
-        
-        return [
-            {
-                "chat_id": chat.chat_id,
-                "title": chat.title,
-                "created_at": chat.created_at,
-                "updated_at": chat.updated_at,
-                "message_count": len(chat.messages),
-                "preview": chat.messages[0].content[:100] if chat.messages else ""
-            }
-            for chat in sorted_chats
-        ]
+        return get_cache().list_chats(limit=limit)
+
+    @staticmethod
+    def list_chat_summaries(
+        limit: int = 100,
+        before_ts: Optional[float] = None,
+        before_id: Optional[str] = None
+    ) -> List[ChatSummary]:
+        """
+        Página de resúmenes de chats (más recientes primero) sin cargar mensajes
+
+        Args:
+            limit: Máximo de resultados
+            before_ts: updated_ts del último chat de la página anterior
+            before_id: chat_id del último chat de la página anterior
+        """
+        return get_cache().list_chat_summaries(limit=limit, before_ts=before_ts, before_id=before_id)
 
     @staticmethod
     def delete_chat(chat_id: str) -> bool:
         """Elimina un chat"""
-        chats = ChatMemoryDB._load_chats()
-        
-        if chat_id in chats:
-            del chats[chat_id]
-            ChatMemoryDB._save_chats(chats)
+        if get_cache().delete_chat(chat_id):
             print(f"✅ Chat {chat_id} eliminado")
+            # Sus vectores de RAG se borran en segundo plano (misma cola que el indexado)
+            try:
+                from ..rag.index_queue import index_queue
+                index_queue.delete_chat(chat_id)
+            except Exception as e:
+                print(f"⚠️ Error encolando borrado de RAG del chat {chat_id}: {e}")
             return True
         
         return False
@@ -236,72 +199,79 @@ class ChatMemoryDB:
     @staticmethod
     def update_chat_title(chat_id: str, new_title: str) -> bool:
         """Actualiza título del chat"""
-        chats = ChatMemoryDB._load_chats()
-        
-        if chat_id not in chats:
-            return False
-        
-        chats[chat_id].title = new_title
-        chats[chat_id].updated_at = datetime.now().isoformat()
-        ChatMemoryDB._save_chats(chats)
-        return True
+        return get_cache().update_chat(
+            chat_id,
+            title=new_title,
+            updated_at=datetime.now().isoformat()
+        )
 
     @staticmethod
-    def update_chat_summary(chat_id: str, summary: str) -> bool:
-        """Actualiza resumen del chat"""
-        chats = ChatMemoryDB._load_chats()
-        
-        if chat_id not in chats:
-            return False
-        
-        chats[chat_id].summary = summary
-        ChatMemoryDB._save_chats(chats)
-        return True
+    def update_chat_summary(chat_id: str, summary: str, message_count: Optional[int] = None) -> bool:
+        """Actualiza resumen del chat (y, si se indica, cuántos mensajes iniciales cubre)"""
+        if message_count is None:
+            return get_cache().update_chat(chat_id, summary=summary)
+        return get_cache().update_chat(chat_id, summary=summary, summary_message_count=message_count)
 
     # ==================== MEMORIA ====================
 
     @staticmethod
     def save_global_memory(key: str, value):
         """Guarda valor en memoria global"""
-        memory = ChatMemoryDB._load_memory()
-        memory["global"][key] = value
-        ChatMemoryDB._save_memory(memory)
+        get_cache().set_global_memory(key, value)
+        if key == 'user_profile':
+            # Las respuestas cacheadas se generaron con el perfil anterior
+            from ..llm.response_cache import response_cache
+            response_cache.invalidate("perfil de usuario actualizado")
 
     @staticmethod
     def get_global_memory(key: str, default=None):
         """Obtiene valor de memoria global"""
-        memory = ChatMemoryDB._load_memory()
-        return memory["global"].get(key, default)
+        return get_cache().get_global_memory(key, default)
 
     @staticmethod
     def save_session_memory(session_id: str, key: str, value):
         """Guarda valor en memoria de sesión"""
-        memory = ChatMemoryDB._load_memory()
-        if session_id not in memory["sessions"]:
-            memory["sessions"][session_id] = {}
-        memory["sessions"][session_id][key] = value
-        ChatMemoryDB._save_memory(memory)
+        get_cache().set_session_memory(session_id, key, value)
 
     @staticmethod
     def get_session_memory(session_id: str, key: str, default=None):
         """Obtiene valor de memoria de sesión"""
-        memory = ChatMemoryDB._load_memory()
-        if session_id not in memory["sessions"]:
-            return default
-        return memory["sessions"][session_id].get(key, default)
+        return get_cache().get_session_memory(session_id).get(key, default)
 
     @staticmethod
     def get_all_session_memory(session_id: str) -> Dict:
         """Obtiene toda la memoria de una sesión"""
-        memory = ChatMemoryDB._load_memory()
-        return memory["sessions"].get(session_id, {})
+        return get_cache().get_session_memory(session_id)
 
     @staticmethod
     def clear_session_memory(session_id: str) -> bool:
         """Limpia memoria de una sesión"""
-        memory = ChatMemoryDB._load_memory()
-        if session_id in memory["sessions"]:
-            del memory["sessions"][session_id]
-            ChatMemoryDB._save_memory(memory)
-            return True
-        return False
+        return get_cache().clear_session_memory(session_id)
+
+    # ==================== CONCURRENCIA ====================
+
+    @staticmethod
+    def lock_chat(chat_id: str):
+        """
+        Bloquea un chat para agrupar varias operaciones (p. ej. pregunta y
+        respuesta de un turno) sin que se intercalen escrituras de otros hilos.
+        Es reentrante: dentro se puede seguir usando ChatMemoryDB normalmente.
+        """
+        return chat_locks.lock(chat_id)
+
+    @staticmethod
+    def lock_chat_async(chat_id: str):
+        """Versión asyncio de lock_chat para mantener el chat bloqueado entre awaits"""
+        return chat_locks.async_lock(chat_id)
+
+    # ==================== PERSISTENCIA ====================
+
+    @staticmethod
+    def flush() -> int:
+        """Persiste en disco los cambios pendientes de la caché"""
+        return get_cache().flush()
+
+    @staticmethod
+    async def flush_periodically(interval: float):
+        """Bucle de fondo que persiste la caché cada `interval` segundos"""
+        await get_cache().flush_periodically(interval)
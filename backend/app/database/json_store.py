@@ -0,0 +1,446 @@
+"""Almacenamiento de chats en archivos JSON: snapshot (chats.json / memory.json) + journal"""
+
+import json
+import os
+import tempfile
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from .models import Chat, Message
+
+
+def default_memory() -> Dict:
+    """Estructura inicial de la memoria global y por sesión"""
+    return {
+        "global": {"user_preferences": {}, "learned_habits": []},
+        "sessions": {}
+    }
+
+
+def atomic_write_json(path: Path, data) -> None:
+    """
+    Escribe JSON de forma atómica: archivo temporal en el mismo directorio,
+    fsync y os.replace. Un fallo a mitad de escritura nunca deja el archivo truncado.
+    """
+    path = Path(path)
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=str(path.parent))
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            if isinstance(data, str):
+                f.write(data)
+            else:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except Exception:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+_MISSING = object()
+
+
+def _noop():
+    pass
+
+
+def _restore(target: Dict, previous: Dict):
+    """Devuelve a `target` los valores anteriores (quitando las claves que no existían)"""
+    for key, value in previous.items():
+        if value is _MISSING:
+            target.pop(key, None)
+        else:
+            target[key] = value
+
+
+class JSONChatStore:
+    """
+    Backend JSON con journal de solo-anexado
+
+    - Cada operación (crear, añadir mensaje, renombrar, borrar, memoria...) se
+      escribe como una línea JSON en el journal: el coste es proporcional al
+      cambio, no al tamaño del historial
+    - Cuando el journal supera `compact_threshold` bytes, un hilo de fondo lo
+      pliega en el snapshot (chats.json / memory.json) y lo vacía
+    - Al arrancar se carga el snapshot y se reproduce el journal encima; la
+      reproducción es idempotente, así que una caída durante la compactación
+      no duplica mensajes
+    """
+
+    def __init__(
+        self,
+        chats_file: Path,
+        memory_file: Path,
+        journal_file: Optional[Path] = None,
+        compact_threshold: int = 1024 * 1024
+    ):
+        self.chats_file = Path(chats_file)
+        self.memory_file = Path(memory_file)
+        self.journal_file = Path(journal_file) if journal_file else self.chats_file.with_suffix(".journal.jsonl")
+        self.rotated_journal_file = self.journal_file.with_name(self.journal_file.name + ".old")
+        self.compact_threshold = compact_threshold
+
+        self._lock = threading.RLock()
+        self._compact_lock = threading.Lock()
+        self._chats: Optional[Dict[str, dict]] = None
+        self._memory: Optional[Dict] = None
+
+        # Dentro de apply() las líneas del journal se escriben en bloque al final
+        self._deferred = False
+        self._buffer: List[str] = []
+        self._undo: List[Callable[[], None]] = []  # cómo deshacer lo que está en _buffer
+        self._compacting = False
+
+    # ==================== CARGA ====================
+
+    def _ensure_loaded(self):
+        """Carga el snapshot y reproduce el journal (una sola vez por proceso)"""
+        if self._chats is not None:
+            return
+
+        chats, memory = {}, default_memory()
+        if self.chats_file.exists():
+            try:
+                with open(self.chats_file, 'r', encoding='utf-8') as f:
+                    chats = json.load(f)
+            except Exception as e:
+                print(f"⚠️ Error cargando chats: {e}")
+        if self.memory_file.exists():
+            try:
+                with open(self.memory_file, 'r', encoding='utf-8') as f:
+                    memory = json.load(f)
+            except Exception as e:
+                print(f"⚠️ Error cargando memoria: {e}")
+                memory = {"global": {}, "sessions": {}}
+        memory.setdefault("global", {})
+        memory.setdefault("sessions", {})
+
+        self._chats, self._memory = chats, memory
+
+        replayed = 0
+        for journal in (self.rotated_journal_file, self.journal_file):
+            replayed += self._replay(journal)
+        if replayed:
+            print(f"🔁 Journal de chats reproducido: {replayed} operaciones")
+
+    def _replay(self, journal: Path) -> int:
+        if not journal.exists():
+            return 0
+
+        count = 0
+        with open(journal, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Última línea a medio escribir tras una caída: se descarta
+                    print(f"⚠️ Registro de journal incompleto ignorado en {journal.name}")
+                    continue
+                self._apply_record(record["op"], record["args"])
+                count += 1
+        return count
+
+    def _load_chats(self) -> Dict[str, dict]:
+        self._ensure_loaded()
+        return self._chats
+
+    def _load_memory(self) -> Dict:
+        self._ensure_loaded()
+        return self._memory
+
+    # ==================== JOURNAL ====================
+
+    def _apply_record(self, op: str, args: Dict) -> Callable[[], None]:
+        """
+        Aplica un registro sobre los datos en memoria (idempotente)
+
+        Devuelve cómo deshacerlo, por si luego falla la escritura del journal.
+        """
+        chats, memory = self._chats, self._memory
+
+        if op == "insert_chat":
+            chat_id = args["chat"]["chat_id"]
+            if chat_id in chats:
+                return _noop
+            chats[chat_id] = args["chat"]
+            return lambda: chats.pop(chat_id, None)
+        elif op == "save_chat":
+            chat_id = args["chat"]["chat_id"]
+            previous = chats.get(chat_id)
+            chats[chat_id] = args["chat"]
+            return lambda: chats.pop(chat_id, None) if previous is None else chats.__setitem__(chat_id, previous)
+        elif op == "append_message":
+            chat = chats.get(args["chat_id"])
+            # `index` evita duplicar el mensaje si el snapshot ya lo contiene
+            if chat is None or len(chat["messages"]) != args["index"]:
+                return _noop
+            previous_updated_at = chat["updated_at"]
+            chat["messages"].append(args["message"])
+            chat["updated_at"] = args["updated_at"]
+
+            def undo():
+                del chat["messages"][args["index"]:]
+                chat["updated_at"] = previous_updated_at
+            return undo
+        elif op == "update_chat":
+            chat = chats.get(args["chat_id"])
+            if chat is None:
+                return _noop
+            previous = {key: chat.get(key, _MISSING) for key in args["fields"]}
+            chat.update(args["fields"])
+            return lambda: _restore(chat, previous)
+        elif op == "delete_chat":
+            chat = chats.pop(args["chat_id"], None)
+            return _noop if chat is None else lambda: chats.__setitem__(args["chat_id"], chat)
+        elif op == "set_global_memory":
+            previous = {args["key"]: memory["global"].get(args["key"], _MISSING)}
+            memory["global"][args["key"]] = args["value"]
+            return lambda: _restore(memory["global"], previous)
+        elif op == "set_session_memory":
+            created = args["session_id"] not in memory["sessions"]
+            session = memory["sessions"].setdefault(args["session_id"], {})
+            previous = {args["key"]: session.get(args["key"], _MISSING)}
+            session[args["key"]] = args["value"]
+            if created:
+                return lambda: memory["sessions"].pop(args["session_id"], None)
+            return lambda: _restore(session, previous)
+        elif op == "clear_session_memory":
+            session = memory["sessions"].pop(args["session_id"], None)
+            return _noop if session is None else lambda: memory["sessions"].__setitem__(args["session_id"], session)
+        else:
+            print(f"⚠️ Operación de journal desconocida: {op}")
+            return _noop
+
+    def _log(self, op: str, args: Dict):
+        """Aplica la operación en memoria y la añade al journal"""
+        self._undo.append(self._apply_record(op, args))
+        self._buffer.append(json.dumps(
+            {"op": op, "args": args, "ts": datetime.now().isoformat()},
+            ensure_ascii=False
+        ))
+        if not self._deferred:
+            self._write_journal()
+
+    def _rollback(self, journal_size: Optional[int] = None):
+        """
+        Deshace en memoria las operaciones pendientes de escribir (y lo que
+        llegara a escribirse de ellas en el journal): quien las reintente, p.
+        ej. ChatCache.flush, parte del estado anterior y no las duplica
+        """
+        for undo in reversed(self._undo):
+            undo()
+        self._undo, self._buffer = [], []
+        if journal_size is not None:
+            try:
+                os.truncate(self.journal_file, journal_size)
+            except OSError:
+                pass
+
+    def _write_journal(self):
+        """
+        Anexa las líneas pendientes al journal con un único fsync
+
+        Las líneas solo se descartan tras el fsync; si la escritura falla se
+        deshacen los cambios en memoria y se propaga el error.
+        """
+        if not self._buffer:
+            return
+
+        journal_size = None
+        try:
+            journal_size = self.journal_file.stat().st_size if self.journal_file.exists() else 0
+            with open(self.journal_file, 'a', encoding='utf-8') as f:
+                f.write("\n".join(self._buffer) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        except Exception:
+            self._rollback(journal_size)
+            raise
+        self._buffer, self._undo = [], []
+
+        if not self._compacting and self.journal_file.stat().st_size >= self.compact_threshold:
+            self._compacting = True
+            threading.Thread(target=self.compact, name="chat-journal-compactor", daemon=True).start()
+
+    def compact(self):
+        """
+        Pliega el journal en el snapshot
+
+        Con el lock solo se serializa el estado y se rota el journal; la escritura
+        del snapshot ocurre fuera del lock para no bloquear nuevas operaciones.
+        """
+        try:
+            with self._compact_lock:
+                self._compact()
+        except Exception as e:
+            print(f"❌ Error compactando journal de chats: {e}")
+        finally:
+            self._compacting = False
+
+    def _compact(self):
+        with self._lock:
+            self._ensure_loaded()
+            self._write_journal()
+            if not self.journal_file.exists():
+                return
+            chats_data = json.dumps(self._chats, ensure_ascii=False, indent=2)
+            memory_data = json.dumps(self._memory, ensure_ascii=False, indent=2)
+            # Si quedó un journal rotado de una compactación interrumpida, ya está
+            # incluido en el estado serializado: se reemplaza sin perder nada
+            os.replace(self.journal_file, self.rotated_journal_file)
+
+        atomic_write_json(self.chats_file, chats_data)
+        atomic_write_json(self.memory_file, memory_data)
+        self.rotated_journal_file.unlink(missing_ok=True)
+        print("🗜️ Journal de chats compactado en el snapshot")
+
+    def apply(self, ops: List[Tuple[str, Dict]]):
+        """Aplica un lote de operaciones con una sola escritura al journal"""
+        with self._lock:
+            self._deferred = True
+            try:
+                for name, kwargs in ops:
+                    getattr(self, name)(**kwargs)
+            except Exception:
+                # El lote se aplica entero o no se aplica
+                self._rollback()
+                raise
+            finally:
+                self._deferred = False
+            self._write_journal()
+
+    # ==================== CHATS ====================
+
+    def insert_chat(self, chat: Chat):
+        """Registra un chat nuevo"""
+        with self._lock:
+            if chat.chat_id not in self._load_chats():
+                self._log("insert_chat", {"chat": chat.to_dict()})
+
+    def save_chat(self, chat: Chat):
+        """Crea o reemplaza un chat completo (metadatos y mensajes)"""
+        with self._lock:
+            self._load_chats()
+            self._log("save_chat", {"chat": chat.to_dict()})
+
+    def append_message(self, chat_id: str, message: Message, updated_at: str) -> bool:
+        """Añade un mensaje al final del chat"""
+        with self._lock:
+            chat = self._load_chats().get(chat_id)
+            if chat is None:
+                return False
+
+            self._log("append_message", {
+                "chat_id": chat_id,
+                "index": len(chat["messages"]),
+                "message": message.to_dict(),
+                "updated_at": updated_at
+            })
+            return True
+
+    def get_chat(self, chat_id: str) -> Optional[Chat]:
+        """Obtiene un chat completo"""
+        with self._lock:
+            data = self._load_chats().get(chat_id)
+            return Chat.from_dict(data) if data else None
+
+    def iter_chats(self) -> Iterator[Chat]:
+        """Itera sobre todos los chats almacenados"""
+        with self._lock:
+            chat_ids = list(self._load_chats())
+        for chat_id in chat_ids:
+            chat = self.get_chat(chat_id)
+            if chat:
+                yield chat
+
+    def list_chats(self, limit: int = 100) -> List[Dict]:
+        """Resumen de chats ordenados por fecha de actualización"""
+        with self._lock:
+            sorted_chats = sorted(
+                self._load_chats().values(),
+                key=lambda x: x["updated_at"],
+                reverse=True
+            )[:limit]
+
+            return [
+                {
+                    "chat_id": chat["chat_id"],
+                    "title": chat["title"],
+                    "created_at": chat["created_at"],
+                    "updated_at": chat["updated_at"],
+                    "message_count": len(chat["messages"]),
+                    "preview": chat["messages"][0]["content"][:100] if chat["messages"] else ""
+                }
+                for chat in sorted_chats
+            ]
+
+    def list_summaries(self) -> Iterator[Dict]:
+        """Resúmenes de todos los chats (sin mensajes)"""
+        with self._lock:
+            chats = list(self._load_chats().values())
+        for chat in chats:
+            yield {
+                "chat_id": chat["chat_id"],
+                "title": chat["title"],
+                "created_at": chat["created_at"],
+                "updated_at": chat["updated_at"],
+                "message_count": len(chat["messages"]),
+                "preview": chat["messages"][0]["content"][:100] if chat["messages"] else ""
+            }
+
+    def update_chat(self, chat_id: str, **fields) -> bool:
+        """Actualiza campos simples del chat (title, summary, updated_at...)"""
+        with self._lock:
+            if chat_id not in self._load_chats():
+                return False
+            self._log("update_chat", {"chat_id": chat_id, "fields": fields})
+            return True
+
+    def delete_chat(self, chat_id: str) -> bool:
+        """Elimina un chat"""
+        with self._lock:
+            if chat_id not in self._load_chats():
+                return False
+            self._log("delete_chat", {"chat_id": chat_id})
+            return True
+
+    # ==================== MEMORIA ====================
+
+    def load_memory(self) -> Dict:
+        """Copia completa de la memoria global y por sesión"""
+        with self._lock:
+            return json.loads(json.dumps(self._load_memory()))
+
+    def get_global_memory(self, key: str, default=None):
+        with self._lock:
+            return self._load_memory()["global"].get(key, default)
+
+    def set_global_memory(self, key: str, value):
+        with self._lock:
+            self._load_memory()
+            self._log("set_global_memory", {"key": key, "value": value})
+
+    def get_session_memory(self, session_id: str) -> Dict:
+        with self._lock:
+            return self._load_memory()["sessions"].get(session_id, {})
+
+    def set_session_memory(self, session_id: str, key: str, value):
+        with self._lock:
+            self._load_memory()
+            self._log("set_session_memory", {"session_id": session_id, "key": key, "value": value})
+
+    def clear_session_memory(self, session_id: str) -> bool:
+        with self._lock:
+            if session_id not in self._load_memory()["sessions"]:
+                return False
+            self._log("clear_session_memory", {"session_id": session_id})
+            return True
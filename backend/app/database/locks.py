@@ -0,0 +1,66 @@
+"""Locks por chat para serializar escrituras concurrentes sobre el mismo chat"""
+
+import asyncio
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, List
+
+
+class ChatLockManager:
+    """
+    Registro de locks por chat
+
+    - `lock(chat_id)`: RLock de hilo; lo usa ChatCache en cada lectura/escritura
+      de un chat, así dos chats distintos nunca se esperan entre sí
+    - `async_lock(chat_id)`: asyncio.Lock para código async que necesita
+      mantener el chat bloqueado entre varios `await`
+    - El lock global solo protege el registro (crear/liberar entradas) y se
+      mantiene durante unas pocas operaciones de diccionario
+    - Las entradas se cuentan por referencias y se eliminan al quedar libres,
+      por lo que el registro no crece con el número de chats históricos
+    """
+
+    def __init__(self):
+        self._registry_lock = threading.Lock()
+        self._locks: Dict[str, List] = {}
+        self._async_locks: Dict[str, List] = {}
+
+    def _acquire_entry(self, registry: Dict[str, List], chat_id: str, factory):
+        with self._registry_lock:
+            entry = registry.get(chat_id)
+            if entry is None:
+                entry = registry[chat_id] = [factory(), 0]
+            entry[1] += 1
+            return entry[0]
+
+    def _release_entry(self, registry: Dict[str, List], chat_id: str):
+        with self._registry_lock:
+            entry = registry[chat_id]
+            entry[1] -= 1
+            if entry[1] == 0:
+                del registry[chat_id]
+
+    @contextmanager
+    def lock(self, chat_id: str):
+        """Bloquea un chat en el hilo actual (reentrante)"""
+        chat_lock = self._acquire_entry(self._locks, chat_id, threading.RLock)
+        try:
+            with chat_lock:
+                yield
+        finally:
+            self._release_entry(self._locks, chat_id)
+
+    @asynccontextmanager
+    async def async_lock(self, chat_id: str):
+        """Bloquea un chat entre corrutinas del event loop (no reentrante)"""
+        chat_lock = self._acquire_entry(self._async_locks, chat_id, asyncio.Lock)
+        try:
+            async with chat_lock:
+                yield
+        finally:
+            self._release_entry(self._async_locks, chat_id)
+
+    def active_count(self) -> int:
+        """Número de chats con algún lock tomado o en espera"""
+        with self._registry_lock:
+            return len(self._locks) + len(self._async_locks)
@@ -0,0 +1,73 @@
+"""Migración única de chats.json / memory.json a la base SQLite
+
+Uso:
+    python -m app.database.migrate [--chats RUTA] [--memory RUTA] [--db RUTA]
+"""
+
+import argparse
+import json
+from pathlib import Path
+from typing import Dict
+
+from .models import Chat
+from .sqlite_store import SQLiteChatStore
+
+MIGRATED_FLAG = "json_migrated_at"
+
+
+def migrate_json_to_sqlite(store: SQLiteChatStore, chats_file: Path, memory_file: Path) -> Dict[str, int]:
+    """
+    Copia chats y memoria desde los archivos JSON legados al store SQLite
+
+    La operación es idempotente: los chats existentes se reemplazan por su
+    versión en JSON y las claves de memoria se sobrescriben.
+
+    Returns:
+        dict con el número de chats, mensajes y claves de memoria migrados
+    """
+    from datetime import datetime
+
+    stats = {"chats": 0, "messages": 0, "memory_keys": 0}
+
+    chats_file = Path(chats_file)
+    if chats_file.exists():
+        with open(chats_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        chats = [Chat.from_dict(chat) for chat in data.values()]
+        store.save_chats(chats)
+        stats["chats"] = len(chats)
+        stats["messages"] = sum(len(chat.messages) for chat in chats)
+
+    memory_file = Path(memory_file)
+    if memory_file.exists():
+        with open(memory_file, 'r', encoding='utf-8') as f:
+            memory = json.load(f)
+        for key, value in memory.get("global", {}).items():
+            store.set_global_memory(key, value)
+            stats["memory_keys"] += 1
+        for session_id, values in memory.get("sessions", {}).items():
+            for key, value in values.items():
+                store.set_session_memory(session_id, key, value)
+                stats["memory_keys"] += 1
+
+    store.set_meta(MIGRATED_FLAG, datetime.now().isoformat())
+    return stats
+
+
+def main():
+    from .chat_db import CHATS_FILE, MEMORY_FILE, CHATS_DB_FILE
+
+    parser = argparse.ArgumentParser(description="Migra el historial JSON de CHATFIT AI a SQLite")
+    parser.add_argument("--chats", type=Path, default=CHATS_FILE, help="Ruta de chats.json")
+    parser.add_argument("--memory", type=Path, default=MEMORY_FILE, help="Ruta de memory.json")
+    parser.add_argument("--db", type=Path, default=CHATS_DB_FILE, help="Ruta de la base SQLite")
+    args = parser.parse_args()
+
+    store = SQLiteChatStore(args.db)
+    stats = migrate_json_to_sqlite(store, args.chats, args.memory)
+    print(f"✅ Migración completada en {args.db}")
+    print(f"   Chats: {stats['chats']} | Mensajes: {stats['messages']} | Claves de memoria: {stats['memory_keys']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Modelos de datos del historial de chats"""
+
+from datetime import datetime
+from typing import List, Optional, Dict
+from dataclasses import dataclass, asdict, field
+
+
+@dataclass
+class Message:
+    """Mensaje individual en el chat"""
+    role: str  # "user" o "assistant"
+    content: str
+    timestamp: str = field(default_factory=lambda: datetime.now().isoformat())
+    model_used: Optional[str] = None
+    tools_used: List[Dict] = field(default_factory=list)
+
+    def to_dict(self):
+        return asdict(self)
+
+    @staticmethod
+    def from_dict(data):
+        return Message(**data)
+
+
+@dataclass
+class Chat:
+    """Registro de un chat completo"""
+    chat_id: str
+    title: str  # Título generado o personalizado
+    created_at: str
+    updated_at: str
+    messages: List[Message] = field(default_factory=list)
+    wearable_data_snapshot: Optional[Dict] = None  # Snapshot de datos wearable al crear
+    summary: Optional[str] = None  # Resumen del chat
+    summary_message_count: int = 0  # Mensajes iniciales ya incluidos en el resumen
+
+    def to_dict(self):
+        return {
+            "chat_id": self.chat_id,
+            "title": self.title,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+            "messages": [msg.to_dict() if isinstance(msg, Message) else msg for msg in self.messages],
+            "wearable_data_snapshot": self.wearable_data_snapshot,
+            "summary": self.summary,
+            "summary_message_count": self.summary_message_count
+        }
+
+    @staticmethod
+    def from_dict(data):
+        messages = [
+            Message.from_dict(msg) if isinstance(msg, dict) else msg
+            for msg in data.get("messages", [])
+        ]
+        return Chat(
+            chat_id=data["chat_id"],
+            title=data["title"],
+            created_at=data["created_at"],
+            updated_at=data["updated_at"],
+            messages=messages,
+            wearable_data_snapshot=data.get("wearable_data_snapshot"),
+            summary=data.get("summary"),
+            summary_message_count=data.get("summary_message_count", 0)
+        )
@@ -0,0 +1,423 @@
+"""Almacenamiento de chats en SQLite (modo WAL, tablas indexadas)"""
+
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .models import Chat, Message
+from .summary_index import safe_epoch
+
+# Versión del esquema (PRAGMA user_version)
+SCHEMA_VERSION = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chats (
+    chat_id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    wearable_data_snapshot TEXT,
+    summary TEXT,
+    summary_message_count INTEGER NOT NULL DEFAULT 0,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    preview TEXT NOT NULL DEFAULT '',
+    created_ts REAL,
+    updated_ts REAL
+);
+
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id TEXT NOT NULL REFERENCES chats(chat_id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    model_used TEXT,
+    tools_used TEXT NOT NULL DEFAULT '[]'
+);
+CREATE INDEX IF NOT EXISTS idx_messages_chat_id ON messages(chat_id, seq);
+
+CREATE TABLE IF NOT EXISTS global_memory (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+
+CREATE TABLE IF NOT EXISTS session_memory (
+    session_id TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT,
+    PRIMARY KEY (session_id, key)
+);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+PREVIEW_LENGTH = 100
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _loads(value):
+    return json.loads(value) if value is not None else None
+
+
+class SQLiteChatStore:
+    """Backend SQLite: añadir y consultar mensajes no depende del tamaño del historial"""
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._init_schema()
+
+    # ==================== CONEXIÓN ====================
+
+    def _conn(self) -> sqlite3.Connection:
+        """Conexión por hilo (sqlite3 no comparte conexiones entre hilos)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _write(self):
+        """Transacción de escritura (BEGIN IMMEDIATE evita deadlocks al promover el lock)"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _init_schema(self):
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version < 2:
+            self._migrate_v2(conn)
+        if version < 3:
+            self._migrate_v3(conn)
+        conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+
+    def _migrate_v2(self, conn: sqlite3.Connection):
+        """v2: epochs created_ts/updated_ts indexados para listados por cursor"""
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(chats)")}
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for column in ("created_ts", "updated_ts"):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE chats ADD COLUMN {column} REAL")
+            rows = conn.execute(
+                "SELECT chat_id, created_at, updated_at FROM chats "
+                "WHERE created_ts IS NULL OR updated_ts IS NULL"
+            ).fetchall()
+            conn.executemany(
+                "UPDATE chats SET created_ts = ?, updated_ts = ? WHERE chat_id = ?",
+                [(safe_epoch(r["created_at"]), safe_epoch(r["updated_at"]), r["chat_id"]) for r in rows]
+            )
+            conn.execute("DROP INDEX IF EXISTS idx_chats_updated_at")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_chats_updated_ts ON chats(updated_ts)")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _migrate_v3(self, conn: sqlite3.Connection):
+        """v3: summary_message_count (mensajes ya plegados en el resumen del chat)"""
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(chats)")}
+        if "summary_message_count" not in columns:
+            conn.execute("ALTER TABLE chats ADD COLUMN summary_message_count INTEGER NOT NULL DEFAULT 0")
+
+    def close(self):
+        """Cierra la conexión del hilo actual"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    # ==================== META ====================
+
+    def get_meta(self, key: str) -> Optional[str]:
+        row = self._conn().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else None
+
+    def set_meta(self, key: str, value: str):
+        with self._write() as conn:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def is_empty(self) -> bool:
+        """True si no hay chats ni memoria almacenados"""
+        conn = self._conn()
+        return (
+            conn.execute("SELECT 1 FROM chats LIMIT 1").fetchone() is None
+            and conn.execute("SELECT 1 FROM global_memory LIMIT 1").fetchone() is None
+        )
+
+    # ==================== CHATS ====================
+
+    @staticmethod
+    def _chat_row(chat: Chat) -> tuple:
+        messages = chat.messages
+        first = messages[0] if messages else None
+        if isinstance(first, dict):
+            first = Message.from_dict(first)
+        return (
+            chat.chat_id,
+            chat.title,
+            chat.created_at,
+            chat.updated_at,
+            _dumps(chat.wearable_data_snapshot) if chat.wearable_data_snapshot is not None else None,
+            chat.summary,
+            chat.summary_message_count,
+            len(messages),
+            first.content[:PREVIEW_LENGTH] if first else "",
+            safe_epoch(chat.created_at),
+            safe_epoch(chat.updated_at)
+        )
+
+    @staticmethod
+    def _message_row(chat_id: str, seq: int, message: Message) -> tuple:
+        if isinstance(message, dict):
+            message = Message.from_dict(message)
+        return (
+            chat_id,
+            seq,
+            message.role,
+            message.content,
+            message.timestamp,
+            message.model_used,
+            _dumps(message.tools_used or [])
+        )
+
+    def apply(self, ops: List[Tuple[str, Dict]]):
+        """Aplica un lote de operaciones en una única transacción"""
+        with self._write() as conn:
+            for name, kwargs in ops:
+                getattr(self, f"_op_{name}")(conn, **kwargs)
+
+    def insert_chat(self, chat: Chat):
+        """Registra un chat nuevo (sin mensajes)"""
+        with self._write() as conn:
+            self._op_insert_chat(conn, chat)
+
+    def save_chat(self, chat: Chat):
+        """Crea o reemplaza un chat completo (metadatos y mensajes)"""
+        with self._write() as conn:
+            self._op_save_chat(conn, chat)
+
+    def save_chats(self, chats: List[Chat]):
+        """Reemplaza varios chats en una sola transacción"""
+        with self._write() as conn:
+            for chat in chats:
+                self._op_save_chat(conn, chat)
+
+    def append_message(self, chat_id: str, message: Message, updated_at: str) -> bool:
+        """Añade un mensaje al final del chat"""
+        with self._write() as conn:
+            return self._op_append_message(conn, chat_id, message, updated_at)
+
+    def _op_insert_chat(self, conn: sqlite3.Connection, chat: Chat):
+        conn.execute(
+            "INSERT OR IGNORE INTO chats (chat_id, title, created_at, updated_at, wearable_data_snapshot, "
+            "summary, summary_message_count, message_count, preview, created_ts, updated_ts) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            self._chat_row(chat)
+        )
+
+    def _op_save_chat(self, conn: sqlite3.Connection, chat: Chat):
+        conn.execute("DELETE FROM messages WHERE chat_id = ?", (chat.chat_id,))
+        conn.execute(
+            "INSERT OR REPLACE INTO chats (chat_id, title, created_at, updated_at, wearable_data_snapshot, "
+            "summary, summary_message_count, message_count, preview, created_ts, updated_ts) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            self._chat_row(chat)
+        )
+        conn.executemany(
+            "INSERT INTO messages (chat_id, seq, role, content, timestamp, model_used, tools_used) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [self._message_row(chat.chat_id, seq, msg) for seq, msg in enumerate(chat.messages)]
+        )
+
+    def _op_append_message(self, conn: sqlite3.Connection, chat_id: str, message: Message, updated_at: str) -> bool:
+        row = conn.execute(
+            "SELECT message_count FROM chats WHERE chat_id = ?", (chat_id,)
+        ).fetchone()
+        if row is None:
+            return False
+
+        seq = row["message_count"]
+        conn.execute(
+            "INSERT INTO messages (chat_id, seq, role, content, timestamp, model_used, tools_used) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            self._message_row(chat_id, seq, message)
+        )
+        conn.execute(
+            "UPDATE chats SET message_count = ?, updated_at = ?, updated_ts = ?, "
+            "preview = CASE WHEN ? = 0 THEN ? ELSE preview END WHERE chat_id = ?",
+            (seq + 1, updated_at, safe_epoch(updated_at), seq, message.content[:PREVIEW_LENGTH], chat_id)
+        )
+        return True
+
+    def get_chat(self, chat_id: str) -> Optional[Chat]:
+        """Obtiene un chat completo"""
+        conn = self._conn()
+        row = conn.execute("SELECT * FROM chats WHERE chat_id = ?", (chat_id,)).fetchone()
+        if row is None:
+            return None
+        rows = conn.execute(
+            "SELECT * FROM messages WHERE chat_id = ? ORDER BY seq", (chat_id,)
+        ).fetchall()
+        return self._build_chat(row, rows)
+
+    def chat_exists(self, chat_id: str) -> bool:
+        row = self._conn().execute("SELECT 1 FROM chats WHERE chat_id = ?", (chat_id,)).fetchone()
+        return row is not None
+
+    @staticmethod
+    def _build_chat(row: sqlite3.Row, message_rows: List[sqlite3.Row]) -> Chat:
+        return Chat(
+            chat_id=row["chat_id"],
+            title=row["title"],
+            created_at=row["created_at"],
+            updated_at=row["updated_at"],
+            messages=[
+                Message(
+                    role=m["role"],
+                    content=m["content"],
+                    timestamp=m["timestamp"],
+                    model_used=m["model_used"],
+                    tools_used=_loads(m["tools_used"]) or []
+                )
+                for m in message_rows
+            ],
+            wearable_data_snapshot=_loads(row["wearable_data_snapshot"]),
+            summary=row["summary"],
+            summary_message_count=row["summary_message_count"] or 0
+        )
+
+    def iter_chats(self) -> Iterator[Chat]:
+        """Itera chat por chat sin cargar todo el historial en memoria"""
+        chat_ids = [r["chat_id"] for r in self._conn().execute("SELECT chat_id FROM chats")]
+        for chat_id in chat_ids:
+            chat = self.get_chat(chat_id)
+            if chat:
+                yield chat
+
+    def list_chats(self, limit: int = 100) -> List[Dict]:
+        """Resumen de chats ordenados por fecha de actualización (usa idx_chats_updated_ts)"""
+        rows = self._conn().execute(
+            "SELECT chat_id, title, created_at, updated_at, message_count, preview, created_ts, updated_ts "
+            "FROM chats ORDER BY updated_ts DESC LIMIT ?",
+            (limit,)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def list_summaries(self) -> Iterator[Dict]:
+        """Resúmenes de todos los chats (solo la tabla chats, sin mensajes)"""
+        cursor = self._conn().execute(
+            "SELECT chat_id, title, created_at, updated_at, message_count, preview, created_ts, updated_ts "
+            "FROM chats"
+        )
+        for row in cursor:
+            yield dict(row)
+
+    def update_chat(self, chat_id: str, **fields) -> bool:
+        """Actualiza campos simples del chat (title, summary, updated_at...)"""
+        if not fields:
+            return self.chat_exists(chat_id)
+        with self._write() as conn:
+            return self._op_update_chat(conn, chat_id, **fields)
+
+    def delete_chat(self, chat_id: str) -> bool:
+        """Elimina un chat y sus mensajes"""
+        with self._write() as conn:
+            return self._op_delete_chat(conn, chat_id)
+
+    def _op_update_chat(self, conn: sqlite3.Connection, chat_id: str, **fields) -> bool:
+        allowed = {"title", "summary", "summary_message_count", "created_at", "updated_at"}
+        unknown = set(fields) - allowed
+        if unknown:
+            raise ValueError(f"Campos no actualizables: {', '.join(sorted(unknown))}")
+
+        fields = dict(fields)
+        for key in ("created_at", "updated_at"):
+            if key in fields:
+                fields[key.replace("_at", "_ts")] = safe_epoch(fields[key])
+
+        assignments = ", ".join(f"{key} = ?" for key in fields)
+        cursor = conn.execute(
+            f"UPDATE chats SET {assignments} WHERE chat_id = ?",
+            (*fields.values(), chat_id)
+        )
+        return cursor.rowcount > 0
+
+    def _op_delete_chat(self, conn: sqlite3.Connection, chat_id: str) -> bool:
+        cursor = conn.execute("DELETE FROM chats WHERE chat_id = ?", (chat_id,))
+        return cursor.rowcount > 0
+
+    # ==================== MEMORIA ====================
+
+    def load_memory(self) -> Dict:
+        """Memoria completa con la misma forma que memory.json"""
+        conn = self._conn()
+        memory = {"global": {}, "sessions": {}}
+        for row in conn.execute("SELECT key, value FROM global_memory"):
+            memory["global"][row["key"]] = _loads(row["value"])
+        for row in conn.execute("SELECT session_id, key, value FROM session_memory"):
+            memory["sessions"].setdefault(row["session_id"], {})[row["key"]] = _loads(row["value"])
+        return memory
+
+    def get_global_memory(self, key: str, default=None):
+        row = self._conn().execute(
+            "SELECT value FROM global_memory WHERE key = ?", (key,)
+        ).fetchone()
+        return _loads(row["value"]) if row else default
+
+    def set_global_memory(self, key: str, value):
+        with self._write() as conn:
+            self._op_set_global_memory(conn, key, value)
+
+    def get_session_memory(self, session_id: str) -> Dict:
+        rows = self._conn().execute(
+            "SELECT key, value FROM session_memory WHERE session_id = ?", (session_id,)
+        ).fetchall()
+        return {row["key"]: _loads(row["value"]) for row in rows}
+
+    def set_session_memory(self, session_id: str, key: str, value):
+        with self._write() as conn:
+            self._op_set_session_memory(conn, session_id, key, value)
+
+    def clear_session_memory(self, session_id: str) -> bool:
+        with self._write() as conn:
+            return self._op_clear_session_memory(conn, session_id)
+
+    def _op_set_global_memory(self, conn: sqlite3.Connection, key: str, value):
+        conn.execute(
+            "INSERT OR REPLACE INTO global_memory (key, value) VALUES (?, ?)",
+            (key, _dumps(value))
+        )
+
+    def _op_set_session_memory(self, conn: sqlite3.Connection, session_id: str, key: str, value):
+        conn.execute(
+            "INSERT OR REPLACE INTO session_memory (session_id, key, value) VALUES (?, ?, ?)",
+            (session_id, key, _dumps(value))
+        )
+
+    def _op_clear_session_memory(self, conn: sqlite3.Connection, session_id: str) -> bool:
+        cursor = conn.execute("DELETE FROM session_memory WHERE session_id = ?", (session_id,))
+        return cursor.rowcount > 0
@@ -0,0 +1,142 @@
+"""Índice en memoria de resúmenes de chats para listados paginados"""
+
+from bisect import bisect_left, bisect_right, insort
+from dataclasses import dataclass, asdict
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .models import Chat
+
+PREVIEW_LENGTH = 100
+
+
+def iso_to_epoch(value: str) -> float:
+    """Convierte un timestamp ISO a epoch (sin zona horaria se interpreta como UTC)"""
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def safe_epoch(value: Optional[str]) -> float:
+    """iso_to_epoch tolerante a valores vacíos o mal formados"""
+    try:
+        return iso_to_epoch(value) if value else 0.0
+    except (TypeError, ValueError):
+        return 0.0
+
+
+@dataclass
+class ChatSummary:
+    """Datos de un chat necesarios para listarlo (sin cuerpos de mensajes)"""
+    chat_id: str
+    title: str
+    created_at: str
+    updated_at: str
+    created_ts: float
+    updated_ts: float
+    message_count: int
+    preview: str
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+    @staticmethod
+    def from_chat(chat: Chat) -> "ChatSummary":
+        first = chat.messages[0] if chat.messages else None
+        first_content = (first["content"] if isinstance(first, dict) else first.content) if first else ""
+        return ChatSummary(
+            chat_id=chat.chat_id,
+            title=chat.title,
+            created_at=chat.created_at,
+            updated_at=chat.updated_at,
+            created_ts=safe_epoch(chat.created_at),
+            updated_ts=safe_epoch(chat.updated_at),
+            message_count=len(chat.messages),
+            preview=first_content[:PREVIEW_LENGTH]
+        )
+
+    @staticmethod
+    def from_dict(data: Dict) -> "ChatSummary":
+        created_ts = data.get("created_ts")
+        updated_ts = data.get("updated_ts")
+        return ChatSummary(
+            chat_id=data["chat_id"],
+            title=data["title"],
+            created_at=data["created_at"],
+            updated_at=data["updated_at"],
+            created_ts=created_ts if created_ts is not None else safe_epoch(data["created_at"]),
+            updated_ts=updated_ts if updated_ts is not None else safe_epoch(data["updated_at"]),
+            message_count=data.get("message_count", 0),
+            preview=data.get("preview", "")
+        )
+
+
+class ChatSummaryIndex:
+    """
+    Resúmenes de chats ordenados por updated_ts descendente
+
+    Se mantiene en cada escritura; listar una página cuesta O(log n + limit)
+    sin tocar los mensajes.
+    """
+
+    def __init__(self, summaries: Iterable[ChatSummary] = ()):
+        self._items: Dict[str, ChatSummary] = {}
+        # Claves (-updated_ts, chat_id): orden ascendente = más recientes primero
+        self._order: List[Tuple[float, str]] = []
+        for summary in summaries:
+            self._items[summary.chat_id] = summary
+        self._order = sorted(self._key(s) for s in self._items.values())
+
+    @staticmethod
+    def _key(summary: ChatSummary) -> Tuple[float, str]:
+        return (-summary.updated_ts, summary.chat_id)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, chat_id: str) -> bool:
+        return chat_id in self._items
+
+    def get(self, chat_id: str) -> Optional[ChatSummary]:
+        return self._items.get(chat_id)
+
+    def put(self, summary: ChatSummary):
+        """Inserta o reemplaza el resumen de un chat"""
+        self.remove(summary.chat_id)
+        self._items[summary.chat_id] = summary
+        insort(self._order, self._key(summary))
+
+    def remove(self, chat_id: str) -> bool:
+        summary = self._items.pop(chat_id, None)
+        if summary is None:
+            return False
+        key = self._key(summary)
+        i = bisect_left(self._order, key)
+        if i < len(self._order) and self._order[i] == key:
+            del self._order[i]
+        return True
+
+    def page(
+        self,
+        limit: int = 100,
+        before_ts: Optional[float] = None,
+        before_id: Optional[str] = None
+    ) -> List[ChatSummary]:
+        """
+        Página de resúmenes (keyset): chats actualizados antes de `before_ts`
+
+        Args:
+            limit: Máximo de resultados
+            before_ts: Cursor (epoch) del último elemento de la página anterior
+            before_id: chat_id del cursor, desempata chats con el mismo updated_ts
+        """
+        if before_ts is None:
+            start = 0
+        elif before_id is None:
+            # Todo lo estrictamente anterior a before_ts
+            start = bisect_right(self._order, (-before_ts, "\uffff"))
+        else:
+            start = bisect_right(self._order, (-before_ts, before_id))
+
+        return [self._items[chat_id] for _, chat_id in self._order[start:start + limit]]
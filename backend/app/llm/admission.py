@@ -0,0 +1,236 @@
+"""Control de admisión y cola justa para las peticiones que ocupan un LLM"""
+
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict, Optional, Tuple
+
+from ..config import settings
+from ..core.deadline import Deadline
+from ..core.metrics import Distribution, metrics
+
+
+class AdmissionRejected(Exception):
+    """
+    Petición rechazada sin llegar al LLM
+
+    `status_code` 429 si el cliente ya tiene demasiadas peticiones en cola,
+    503 si el backend está saturado; `retry_after` en segundos.
+    """
+
+    def __init__(self, status_code: int, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Lane:
+    """
+    Ejecuciones concurrentes y cola de espera de un proveedor/modelo
+
+    Los que esperan se agrupan por sesión y los huecos se reparten por
+    turnos entre sesiones (round-robin): un cliente con muchas peticiones no
+    deja sin servicio al resto.
+    """
+
+    def __init__(self, key: str, limit: int):
+        self.key = key
+        self.limit = limit
+        self.active = 0
+        self._waiting: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self.queued = 0
+        # Media móvil del tiempo de servicio, para estimar esperas y Retry-After
+        self.service_seconds = settings.admission_initial_service_seconds
+        self.admitted = 0
+        self.rejected: Dict[int, int] = {429: 0, 503: 0}
+        self.wait_ms = Distribution()
+
+    def queued_for(self, session_id: str) -> int:
+        return len(self._waiting.get(session_id, ()))
+
+    def estimated_wait(self, position: int) -> float:
+        """Segundos hasta que quede libre un hueco para el que ocupa `position` en la cola"""
+        return math.ceil(position / self.limit) * self.service_seconds
+
+    def enqueue(self, session_id: str) -> asyncio.Future:
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(session_id, deque()).append(waiter)
+        self.queued += 1
+        return waiter
+
+    def discard(self, session_id: str, waiter: asyncio.Future):
+        waiters = self._waiting.get(session_id)
+        if waiters is None or waiter not in waiters:
+            return
+        waiters.remove(waiter)
+        self.queued -= 1
+        if not waiters:
+            del self._waiting[session_id]
+
+    def wake_next(self):
+        """Cede los huecos libres a la siguiente sesión en turno"""
+        while self.active < self.limit and self._waiting:
+            session_id, waiters = next(iter(self._waiting.items()))
+            waiter = waiters.popleft()
+            self.queued -= 1
+            if waiters:
+                # La sesión pasa al final de la rueda
+                self._waiting.move_to_end(session_id)
+            else:
+                del self._waiting[session_id]
+            if waiter.done():
+                continue
+            self.active += 1
+            waiter.set_result(None)
+
+    def release(self, service_seconds: float):
+        self.active -= 1
+        self.service_seconds = 0.8 * self.service_seconds + 0.2 * service_seconds
+        self.wake_next()
+
+    def stats(self) -> Dict:
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "queued": self.queued,
+            "sessions_waiting": len(self._waiting),
+            "service_seconds": round(self.service_seconds, 2),
+            "admitted": self.admitted,
+            "rejected_429": self.rejected[429],
+            "rejected_503": self.rejected[503],
+            "wait_ms": self.wait_ms.to_dict()
+        }
+
+
+class AdmissionController:
+    """
+    Limita cuántas peticiones ejecutan el agente a la vez por proveedor/modelo
+
+    Un backend local (Ollama, HuggingFace) rinde lo mismo con 2 peticiones
+    que con 20, pero con 20 todas tardan 10 veces más y acaban agotando su
+    plazo. Aquí entran como mucho `limit` a la vez; el resto espera en una
+    cola acotada y repartida entre sesiones. Se rechaza pronto, con
+    Retry-After:
+    - 429 si la sesión ya tiene `max_queue_per_session` peticiones esperando
+    - 503 si la cola está llena o la espera estimada supera el plazo de la petición
+    """
+
+    def __init__(self, max_queue: int = 32, max_queue_per_session: int = 4):
+        self.max_queue = max_queue
+        self.max_queue_per_session = max_queue_per_session
+        self._lanes: Dict[Tuple[str, str], Lane] = {}
+
+    @staticmethod
+    def limit_for(provider: str, model: Optional[str]) -> int:
+        """Concurrencia del modelo (`admission_model_limits`) o, si no, la del proveedor"""
+        limit = settings.admission_model_limits.get(f"{provider}/{model}")
+        if limit is None:
+            limit = getattr(settings, f"admission_concurrency_{provider}", settings.admission_concurrency_default)
+        return max(1, int(limit))
+
+    def _lane(self, provider: str, model: Optional[str]) -> Lane:
+        key = (provider, model or "")
+        lane = self._lanes.get(key)
+        if lane is None:
+            lane = self._lanes[key] = Lane(f"{provider}/{model or ''}", self.limit_for(provider, model))
+        return lane
+
+    def _reject(self, lane: Lane, status_code: int, reason: str, retry_after: float) -> AdmissionRejected:
+        lane.rejected[status_code] += 1
+        metrics.inc(f"admission.rejected_{status_code}")
+        print(f"🚦 {lane.key}: petición rechazada ({status_code}, {reason})")
+        return AdmissionRejected(status_code, reason, max(1, math.ceil(retry_after)))
+
+    # ==================== API ====================
+
+    def check(self, provider: str, model: Optional[str], session_id: str, deadline: Optional[Deadline] = None):
+        """
+        Rechazo anticipado sin reservar nada (p. ej. antes de abrir un stream SSE)
+
+        Raises:
+            AdmissionRejected: si `slot()` rechazaría ahora mismo la petición
+        """
+        lane = self._lane(provider, model)
+        if lane.active < lane.limit and not lane.queued:
+            return
+        if lane.queued_for(session_id) >= self.max_queue_per_session:
+            raise self._reject(lane, 429, "demasiadas peticiones en cola para esta sesión", lane.estimated_wait(lane.queued_for(session_id)))
+        if lane.queued >= self.max_queue:
+            raise self._reject(lane, 503, "cola llena", lane.estimated_wait(lane.queued + 1))
+        wait = lane.estimated_wait(lane.queued + 1)
+        if deadline is not None and wait > deadline.remaining():
+            raise self._reject(lane, 503, f"espera estimada de {wait:.0f}s", wait)
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        provider: str,
+        model: Optional[str],
+        session_id: str,
+        deadline: Optional[Deadline] = None
+    ) -> AsyncIterator[None]:
+        """
+        Hueco para ejecutar el agente (espera en cola si no hay)
+
+        Raises:
+            AdmissionRejected: cola llena, demasiadas peticiones de la sesión,
+                o el plazo se agotaría esperando
+        """
+        lane = self._lane(provider, model)
+        started = time.monotonic()
+
+        if lane.active < lane.limit and not lane.queued:
+            lane.active += 1
+        else:
+            self.check(provider, model, session_id, deadline)
+            waiter = lane.enqueue(session_id)
+            metrics.set(f"admission.queued.{lane.key}", lane.queued)
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter), timeout=deadline.remaining() if deadline else None)
+            except asyncio.TimeoutError:
+                # Salvo que el hueco llegara justo a la vez que el timeout
+                if not waiter.done() or waiter.cancelled():
+                    lane.discard(session_id, waiter)
+                    waiter.cancel()
+                    raise self._reject(lane, 503, "plazo agotado en cola", lane.estimated_wait(lane.queued + 1))
+            except asyncio.CancelledError:
+                # Cliente desconectado mientras esperaba: si ya tenía hueco, cederlo
+                lane.discard(session_id, waiter)
+                if waiter.done() and not waiter.cancelled():
+                    lane.active -= 1
+                    lane.wake_next()
+                else:
+                    waiter.cancel()
+                raise
+
+        waited = time.monotonic() - started
+        lane.admitted += 1
+        lane.wait_ms.observe(waited * 1000)
+        metrics.inc("admission.admitted")
+        metrics.observe("admission.wait_ms", waited * 1000)
+        metrics.set(f"admission.active.{lane.key}", lane.active)
+
+        admitted_at = time.monotonic()
+        try:
+            yield
+        finally:
+            lane.release(time.monotonic() - admitted_at)
+            metrics.set(f"admission.active.{lane.key}", lane.active)
+            metrics.set(f"admission.queued.{lane.key}", lane.queued)
+
+    def stats(self) -> Dict:
+        return {
+            "max_queue": self.max_queue,
+            "max_queue_per_session": self.max_queue_per_session,
+            "lanes": {lane.key: lane.stats() for lane in self._lanes.values()}
+        }
+
+
+# Instancia global
+admission_controller = AdmissionController(
+    max_queue=settings.admission_max_queue,
+    max_queue_per_session=settings.admission_max_queue_per_session
+)
@@ -1,37 +1,82 @@
 """Agente conversacional con herramientas"""
 
-from langchain.agents import AgentExecutor, create_react_agent
-from langchain_core.prompts import PromptTemplate
-from typing import Optional, List, Dict
+from langchain.agents import AgentExecutor, create_openai_tools_agent, create_react_agent
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder, PromptTemplate
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from typing import AsyncIterator, Optional, List, Dict, Union
+import asyncio
+import json
 import traceback
 from datetime import datetime
 
+from .context_budget import ContextBudget
+from .fast_path import FastPathMatch, fast_path_router, phrasing_prompt
 from .tools import get_tools
 from .llm_factory import LLMFactory
 from ..config import settings
+from ..core.deadline import Deadline, deadline_scope
+from ..core.metrics import metrics
+
+INSTRUCTIONS = """IMPORTANTE:
+- USA las herramientas cuando sea apropiado
+- Cita fuentes de información
+- Sé empático y motivador
+- Mantén respuestas concisas pero completas
+- Personaliza con los datos del wearable cuando sea relevante"""
+
+PARTIAL_NOTE = "\n\n⏱️ (Respuesta incompleta: se agotó el tiempo de respuesta)"
+
+USER_CONTEXT = """CONTEXTO DEL USUARIO:
+{profile_context}
+{wearable_context}"""
 
 class ChatFitAgent:
-    """Agente conversacional para CHATFIT AI"""
+    """
+    Agente conversacional para CHATFIT AI
+
+    El LLM, las herramientas y el AgentExecutor no dependen de la petición:
+    el contexto del usuario (wearable + perfil) se pasa al invocar, así una
+    misma instancia puede reutilizarse entre peticiones (ver AgentPool).
+
+    Dos modos de agente (`agent_mode`):
+    - "react": el modelo escribe Thought/Action/Action Input en texto y se
+      parsea; una herramienta por llamada al LLM. Funciona con cualquier modelo.
+    - "tools": tool calling nativo del proveedor (OpenAI/Groq function
+      calling, API de tools de Ollama). El modelo devuelve llamadas
+      estructuradas y puede pedir varias a la vez, que se ejecutan en
+      paralelo: menos llamadas al LLM por pregunta.
+    """
     
     def __init__(
         self, 
         wearable_data: Optional[dict] = None,
         llm_provider: Optional[str] = None,
-        model_name: Optional[str] = None
+        model_name: Optional[str] = None,
+        temperature: Optional[float] = None,
+        agent_mode: Optional[str] = None
     ):
+        # Datos del wearable por defecto si la llamada no aporta los suyos
         self.wearable_data = wearable_data
         self.llm_provider = llm_provider or settings.llm_provider
         self.model_name = model_name
+        self.temperature = temperature
+        self.agent_mode = self._resolve_agent_mode(agent_mode or settings.agent_mode, self.llm_provider, model_name)
+        self.prompt: Optional[Union[PromptTemplate, ChatPromptTemplate]] = None
+        self.tool_schemas: List[dict] = []
         
         print(f"🤖 Inicializando ChatFit Agent")
         print(f"   Proveedor: {self.llm_provider}")
         if self.model_name:
             print(f"   Modelo: {self.model_name}")
+        print(f"   Modo: {self.agent_mode}")
         
         try:
+            llm_kwargs = {"temperature": temperature} if temperature is not None else {}
             self.llm = LLMFactory.create_llm(
                 provider=self.llm_provider,
-                model_name=self.model_name
+                model_name=self.model_name,
+                tool_calling=self.agent_mode == "tools",
+                **llm_kwargs
             )
             print(f"✅ LLM creado exitosamente")
             
@@ -59,8 +104,82 @@ class ChatFitAgent:
             self.tools = []
             self.agent_executor = None
     
+    @staticmethod
+    def _resolve_agent_mode(mode: str, provider: str, model_name: Optional[str]) -> str:
+        """Resuelve "auto": tool calling nativo si el proveedor/modelo lo soporta, si no ReAct"""
+        if mode == "auto":
+            return "tools" if LLMFactory.supports_tool_calling(provider, model_name) else "react"
+        if mode == "tools" and not LLMFactory.supports_tool_calling(provider, model_name):
+            print(f"⚠️ {provider} sin tool calling nativo conocido para este modelo; se intenta igualmente")
+        return mode
+
     def _create_agent(self) -> AgentExecutor:
-        """Crea el agente ReAct con herramientas"""
+        """Crea el agente en el modo elegido (si falla el nativo, ReAct)"""
+        if self.agent_mode == "tools":
+            try:
+                return self._create_tools_agent()
+            except Exception as e:
+                print(f"⚠️ Error creando agente con tool calling nativo: {e}")
+                print("   Usando agente ReAct")
+                self.agent_mode = "react"
+        return self._create_react_agent()
+
+    def _executor(self, agent) -> AgentExecutor:
+        # Executor con configuración segura
+        return AgentExecutor(
+            agent=agent,
+            tools=self.tools,
+            verbose=settings.debug,
+            max_iterations=5,
+            max_execution_time=settings.chat_deadline_seconds,
+            handle_parsing_errors=True,
+            return_intermediate_steps=True
+        )
+
+    def _create_tools_agent(self) -> AgentExecutor:
+        """
+        Crea el agente con tool calling nativo
+
+        Las herramientas viajan como esquemas JSON en la petición (no en el
+        texto del prompt) y el modelo responde con llamadas estructuradas: no
+        hay formato que parsear. Varias llamadas en un mismo paso se ejecutan
+        en paralelo (AgentExecutor asíncrono). Mismo orden estable → volátil
+        que el prompt ReAct.
+        """
+        if not self.tools:
+            raise ValueError("sin herramientas")
+
+        system = f"""Eres CHATFIT AI, un asistente de fitness y salud. Responde las preguntas lo mejor que puedas.
+Si necesitas varias herramientas independientes, llámalas todas en el mismo paso.
+
+{INSTRUCTIONS}
+
+{USER_CONTEXT}"""
+
+        prompt = ChatPromptTemplate.from_messages([
+            ("system", system),
+            ("human", "{input}"),
+            MessagesPlaceholder(variable_name="agent_scratchpad")
+        ])
+        self.prompt = prompt
+        self.tool_schemas = [convert_to_openai_tool(tool) for tool in self.tools]
+
+        agent = create_openai_tools_agent(
+            llm=self.llm,
+            tools=self.tools,
+            prompt=prompt
+        )
+        return self._executor(agent)
+
+    def _create_react_agent(self) -> AgentExecutor:
+        """
+        Crea el agente ReAct con herramientas
+
+        El prompt va de lo estable a lo volátil: instrucciones, herramientas y
+        perfil son idénticos byte a byte entre peticiones y turnos, así los
+        backends locales (Ollama, HuggingFace) reutilizan la caché KV de ese
+        prefijo y solo procesan el wearable, la conversación y la pregunta.
+        """
         
         # Template ReAct (compatible con todos los LLMs)
         template = """Responde las siguientes preguntas lo mejor que puedas. Tienes acceso a las siguientes herramientas:
@@ -78,35 +197,25 @@ Observation: el resultado de la acción
 Thought: Ahora sé la respuesta final
 Final Answer: la respuesta final a la pregunta de entrada original
 
-CONTEXTO DEL USUARIO:
-{full_context}
-
-IMPORTANTE:
-- USA las herramientas cuando sea apropiado
-- Cita fuentes de información
-- Sé empático y motivador
-- Mantén respuestas concisas pero completas
-- Personaliza con los datos del wearable cuando sea relevante
+""" + INSTRUCTIONS + """
 
+""" + USER_CONTEXT + """
 Question: {input}
 {agent_scratchpad}"""
 
-        wearable_context = self._format_wearable_context()
-        user_profile_context = self._get_user_profile_context()
-        full_context = f"{wearable_context}\n\n{user_profile_context}"
-        
+        # Perfil y wearable se rellenan en cada invocación (ver _user_context)
         prompt = PromptTemplate(
             template=template,
-            input_variables=["input", "agent_scratchpad"],
+            input_variables=["input", "agent_scratchpad", "profile_context", "wearable_context"],
             partial_variables={
                 "tools": "\n".join([
                     f"- {tool.name}: {tool.description}" 
                     for tool in self.tools
                 ]) if self.tools else "No tools available",
-                "tool_names": ", ".join([tool.name for tool in self.tools]) if self.tools else "",
-                "full_context": full_context
+                "tool_names": ", ".join([tool.name for tool in self.tools]) if self.tools else ""
             }
         )
+        self.prompt = prompt
         
         # Crear agente ReAct
         agent = create_react_agent(
@@ -115,53 +224,52 @@ Question: {input}
             prompt=prompt
         )
         
-        # Executor con configuración segura
-        agent_executor = AgentExecutor(
-            agent=agent,
-            tools=self.tools,
-            verbose=settings.debug,
-            max_iterations=5,
-            max_execution_time=60,
-            handle_parsing_errors=True,
-            return_intermediate_steps=True
-        )
-        
-        return agent_executor
+        return self._executor(agent)
+
+    def format_prompt(self, full_input: str, context: Dict[str, str]) -> str:
+        """Prompt del primer paso del agente como texto (presupuesto, benchmarks)"""
+        scratchpad = [] if self.agent_mode == "tools" else ""
+        return self.prompt.format(input=full_input, agent_scratchpad=scratchpad, **context)
     
-    def _format_wearable_context(self) -> str:
+    @staticmethod
+    def _format_wearable_context(wearable_data: Optional[dict]) -> str:
         """Formatea datos del wearable para el prompt"""
-        if not self.wearable_data:
+        if not wearable_data:
             return "⚠️ Datos del dispositivo wearable no disponibles"
         
-        mock_note = " (DATOS DE PRUEBA)" if self.wearable_data.get("mock_data") else ""
+        mock_note = " (DATOS DE PRUEBA)" if wearable_data.get("mock_data") else ""
         
         return f"""
 📱 DISPOSITIVO XIAOMI{mock_note}:
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-👟 Pasos: {self.wearable_data.get('steps', 'N/A'):,}
-❤️ FC: {self.wearable_data.get('heart_rate', 'N/A')} bpm
-🔥 Calorías: {self.wearable_data.get('calories', 'N/A'):,} kcal
-😴 Sueño: {self.wearable_data.get('sleep_hours', 'N/A')} hrs
-📏 Distancia: {self.wearable_data.get('distance_km', 'N/A')} km
-⏱️ Activo: {self.wearable_data.get('active_minutes', 'N/A')} min
-🔋 Batería: {self.wearable_data.get('battery_level', 'N/A')}%
-📱 Modelo: {self.wearable_data.get('device_model', 'Xiaomi Band')}
+👟 Pasos: {wearable_data.get('steps', 'N/A'):,}
+❤️ FC: {wearable_data.get('heart_rate', 'N/A')} bpm
+🔥 Calorías: {wearable_data.get('calories', 'N/A'):,} kcal
+😴 Sueño: {wearable_data.get('sleep_hours', 'N/A')} hrs
+📏 Distancia: {wearable_data.get('distance_km', 'N/A')} km
+⏱️ Activo: {wearable_data.get('active_minutes', 'N/A')} min
+🔋 Batería: {wearable_data.get('battery_level', 'N/A')}%
+📱 Modelo: {wearable_data.get('device_model', 'Xiaomi Band')}
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 """
     
-    def _get_user_profile_context(self) -> str:
+    @staticmethod
+    def _get_user_profile() -> dict:
+        """Perfil desde la memoria global ('user_profile') o el perfil mock de settings"""
+        try:
+            from ..database.chat_db import ChatMemoryDB
+            return ChatMemoryDB.get_global_memory('user_profile', settings.mock_user_profile)
+        except Exception:
+            return settings.mock_user_profile
+    
+    @staticmethod
+    def _get_user_profile_context() -> str:
         """Formatea el perfil del usuario para el prompt
 
         Intenta obtener el perfil desde la memoria global (ChatMemoryDB) con clave
         'user_profile'. Si no existe, cae en el perfil mock configurado en settings.
         """
-        from ..config import settings
-        try:
-            # Obtener perfil desde memoria global si existe
-            from ..database.chat_db import ChatMemoryDB
-            profile = ChatMemoryDB.get_global_memory('user_profile', settings.mock_user_profile)
-        except Exception:
-            profile = settings.mock_user_profile
+        profile = ChatFitAgent._get_user_profile()
         
         return f"""
 👤 PERFIL DEL USUARIO:
@@ -174,142 +282,656 @@ Question: {input}
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 """
 
-    def chat(self, message: str, chat_history: Optional[List[dict]] = None) -> dict:
+    def _user_context(self, wearable_data: Optional[dict]) -> Dict[str, str]:
+        """
+        Variables de contexto del prompt para esta petición (bloqueante: lee el perfil)
+
+        Separadas porque van en posiciones distintas: el perfil forma parte del
+        prefijo estable y el wearable, que cambia con cada sincronización, va después.
+        """
+        return {
+            "profile_context": self._get_user_profile_context(),
+            "wearable_context": self._format_wearable_context(wearable_data)
+        }
+
+    def _cache_lookup(
+        self,
+        message: str,
+        chat_history: Optional[List[dict]],
+        wearable_data: Optional[dict],
+        model_info: dict,
+        summary: Optional[str] = None
+    ):
+        """
+        Caché semántica de respuestas (bloqueante: embedding de la pregunta)
+
+        Returns:
+            (respuesta cacheada o None, ticket para guardar la nueva respuesta)
+        """
+        # Con historial la respuesta depende de la conversación: no se cachea
+        if not settings.response_cache_enabled or chat_history or summary:
+            return None, None
+        try:
+            from .response_cache import response_cache, context_fingerprint
+            fingerprint = context_fingerprint(model_info, self._get_user_profile(), wearable_data)
+            return response_cache.lookup(message, fingerprint)
+        except Exception as e:
+            print(f"⚠️ Caché semántica no disponible: {e}")
+            return None, None
+
+    @staticmethod
+    def _cache_store(message: str, ticket, result: dict):
+        if ticket is None or result.get("model_info", {}).get("partial"):
+            return
+        from .response_cache import response_cache
+        response_cache.store(message, ticket, result)
+
+    def _model_info(self) -> dict:
+        return {
+            "provider": self.llm_provider,
+            "model": self.model_name or getattr(settings, f"{self.llm_provider}_model", "unknown"),
+            "agent_mode": self.agent_mode if self.agent_executor else "direct",
+            "timestamp": datetime.now().isoformat()
+        }
+
+    @staticmethod
+    def _unavailable(model_info: dict) -> dict:
+        return {
+            "response": "Lo siento, el sistema de IA no está disponible en este momento. Por favor verifica la configuración.",
+            "error": "LLM no disponible",
+            "success": False,
+            "model_info": model_info
+        }
+
+    @staticmethod
+    def _history_window() -> int:
+        """Mensajes recientes enviados literales (los anteriores, resumidos en Chat.summary)"""
+        return settings.chat_summary_keep_messages + settings.chat_summary_batch_messages
+
+    @staticmethod
+    def _build_input(
+        message: str,
+        chat_history: Optional[List[dict]],
+        retrieved_docs: Optional[List[Dict]] = None,
+        summary: Optional[str] = None
+    ) -> str:
+        """
+        Pregunta actual precedida del resumen, el historial reciente y el conocimiento RAG
+
+        Resumen e historial van antes que el RAG: entre turnos solo crecen por
+        el final, mientras que los documentos recuperados cambian con cada pregunta.
+        """
+        rag_context = ChatFitAgent._format_rag_context(retrieved_docs)
+        summary_context = f"RESUMEN DE LA CONVERSACIÓN:\n{summary}\n\n" if summary else ""
+        if chat_history and len(chat_history) > 0:
+            history_text = "\n".join([
+                f"{'Usuario' if msg['role'] == 'user' else 'Asistente'}: {msg['content']}"
+                for msg in chat_history[-ChatFitAgent._history_window():]
+            ])
+            return f"{summary_context}HISTORIAL RECIENTE:\n{history_text}\n\n{rag_context}PREGUNTA ACTUAL: {message}"
+        if summary_context:
+            return f"{summary_context}{rag_context}PREGUNTA ACTUAL: {message}"
+        return f"{rag_context}{message}"
+
+    @staticmethod
+    def _retrieve(message: str) -> List[Dict]:
+        """RAG: documentos relevantes para el mensaje (bloqueante: embeddings + Chroma)"""
+        try:
+            from ..rag.vector_store import vector_store
+            if vector_store:
+                # k configurable desde settings
+                return vector_store.search(message, k=getattr(settings, 'rag_k', 4))
+        except Exception as e:
+            print(f"⚠️ RAG retrieval failed: {e}")
+        return []
+
+    def _assemble_input(
+        self,
+        message: str,
+        chat_history: Optional[List[dict]],
+        retrieved_docs: Optional[List[Dict]],
+        context: Dict[str, str],
+        summary: Optional[str] = None
+    ) -> str:
+        """
+        `_build_input` ajustado al presupuesto de tokens del modelo
+
+        Cuenta con el tokenizador del modelo el prompt fijo, perfil, wearable,
+        resumen, pregunta, RAG e historial; lo que no cabe se descarta
+        (documentos peor clasificados, mensajes más antiguos) y registra el reparto.
+        """
+        try:
+            model = self.model_name or getattr(settings, f"{self.llm_provider}_model", None)
+            budget = ContextBudget.for_model(self.llm_provider, model)
+            empty = {"profile_context": "", "wearable_context": ""}
+            if self.prompt is not None:
+                skeleton = self.format_prompt("", empty)
+            else:
+                skeleton = self._direct_prompt("", empty)
+            fixed = {"prompt": skeleton, "perfil": context["profile_context"], "wearable": context["wearable_context"]}
+            if self.tool_schemas:
+                # En modo tools los esquemas van aparte del prompt, pero ocupan contexto
+                fixed["herramientas"] = json.dumps(self.tool_schemas, ensure_ascii=False)
+            if summary:
+                fixed["resumen"] = summary
+            plan = budget.fit(
+                fixed,
+                message,
+                (chat_history or [])[-self._history_window():],
+                retrieved_docs
+            )
+            print(plan.summary())
+            return self._build_input(plan.message, plan.history, plan.documents, summary)
+        except Exception as e:
+            print(f"⚠️ Presupuesto de contexto no disponible: {e}")
+            return self._build_input(message, chat_history, retrieved_docs, summary)
+
+    @staticmethod
+    def _format_rag_context(retrieved_docs: Optional[List[Dict]]) -> str:
+        if not retrieved_docs:
+            return ""
+        try:
+            retrieved_texts = "\n\n".join([
+                f"- {d['content'].strip()} (source: {d.get('metadata', {}).get('source', 'unknown')}, topic: {d.get('metadata', {}).get('topic', '')})"
+                for d in retrieved_docs
+            ])
+            return f"CONOCIMIENTO RELEVANTE (recuperado por RAG):\n{retrieved_texts}\n\n"
+        except Exception as e:
+            print(f"⚠️ Error formateando resultados RAG: {e}")
+            return ""
+
+    def _fast_path(self, message: str, wearable_data: Optional[dict]) -> Optional[FastPathMatch]:
+        """Herramientas que responden la pregunta sin agente (bloqueante: lee el perfil)"""
+        if not settings.fast_path_enabled:
+            return None
+        return fast_path_router.route(message, wearable_data, self._get_user_profile)
+
+    def _phrase_fast_path(self) -> bool:
+        return settings.fast_path_phrasing and self.llm is not None
+
+    def _phrase_fast_path_sync(self, message: str, outputs: list) -> Optional[str]:
+        """
+        Redacta con el LLM la respuesta de la ruta rápida; None → plantilla
+
+        El cálculo ya está hecho: si el LLM falla o no responde dentro del
+        plazo de la petición, se responde con la plantilla en lugar de un error.
+        """
+        if not self._phrase_fast_path():
+            return None
+        try:
+            with deadline_scope(Deadline(settings.chat_deadline_seconds)):
+                return self._message_text(self.llm.invoke(phrasing_prompt(message, outputs)))
+        except Exception as e:
+            metrics.inc("fast_path.phrasing_fallbacks")
+            print(f"⚠️ Redacción de la ruta rápida no disponible, se usa la plantilla: {e}")
+            return None
+
+    async def _phrase_fast_path_async(self, message: str, outputs: list, deadline: Deadline) -> Optional[str]:
+        """`_phrase_fast_path_sync` acotado por `deadline` (se cancela al agotarse)"""
+        if not self._phrase_fast_path():
+            return None
+        try:
+            with deadline_scope(deadline):
+                reply = await asyncio.wait_for(self.llm.ainvoke(phrasing_prompt(message, outputs)), timeout=deadline.remaining())
+            return self._message_text(reply)
+        except Exception as e:
+            metrics.inc("fast_path.phrasing_fallbacks")
+            print(f"⚠️ Redacción de la ruta rápida no disponible, se usa la plantilla: {e!r}")
+            return None
+
+    @staticmethod
+    def _fast_path_result(
+        match: FastPathMatch,
+        outputs: list,
+        response_text: Optional[str],
+        model_info: dict,
+        wearable_data: Optional[dict]
+    ) -> dict:
+        """Respuesta de la ruta rápida, mismo formato que _agent_result"""
+        fast_path_router.record(match)
+        print(f"⚡ Ruta rápida: {', '.join(name for name, _, _ in outputs)}")
+        return {
+            "response": response_text or "\n".join(output.strip() for _, _, output in outputs),
+            "tools_used": [{"tool": name, "input": str(args)} for name, args, _ in outputs],
+            "llm_calls": 1 if response_text else 0,
+            "model_info": {**model_info, "agent_mode": "fast_path"},
+            "wearable_data_used": bool(wearable_data),
+            "success": True
+        }
+
+    @staticmethod
+    def _llm_calls(steps: list) -> int:
+        """
+        Llamadas al LLM de una ejecución del agente
+
+        Cada paso intermedio sale de una llamada, salvo las acciones de una
+        misma respuesta con varias tool calls (comparten `message_log`); más
+        la llamada que da la respuesta final.
+        """
+        calls = set()
+        for index, (action, _) in enumerate(steps):
+            message_log = getattr(action, "message_log", None)
+            calls.add(id(message_log[0]) if message_log else index)
+        return len(calls) + 1
+
+    @staticmethod
+    def _agent_result(response: dict, model_info: dict, wearable_data: Optional[dict]) -> dict:
+        """Convierte la salida del AgentExecutor en la respuesta del agente"""
+        # Extraer tools usadas
+        tools_used = []
+        steps = response.get("intermediate_steps") or []
+        for step in steps:
+            try:
+                tool_action = step[0]
+                tools_used.append({
+                    "tool": tool_action.tool,
+                    "input": str(tool_action.tool_input)
+                })
+            except Exception as e:
+                print(f"⚠️ Error extrayendo tool info: {e}")
+
+        llm_calls = ChatFitAgent._llm_calls(steps)
+        metrics.observe(f"agent.{model_info.get('agent_mode')}.llm_calls", llm_calls)
+
+        return {
+            "response": response["output"],
+            "tools_used": tools_used,
+            "llm_calls": llm_calls,
+            "model_info": model_info,
+            "wearable_data_used": bool(wearable_data),
+            "success": True
+        }
+
+    @staticmethod
+    def _direct_prompt(full_input: str, context: Dict[str, str]) -> str:
+        """Prompt para usar el LLM directamente, sin agente (perfil, wearable y entrada)"""
+        return f"{context['profile_context']}\n{context['wearable_context']}\n\nUsuario: {full_input}\nAsistente:"
+
+    @staticmethod
+    def _direct_result(response_text: str, model_info: dict, wearable_data: Optional[dict]) -> dict:
+        return {
+            "response": response_text,
+            "tools_used": [],
+            "model_info": model_info,
+            "wearable_data_used": bool(wearable_data),
+            "success": True
+        }
+
+    @staticmethod
+    def _error_result(e: Exception, model_info: dict) -> dict:
+        print(f"❌ Error en agente: {e}")
+        traceback.print_exc()
+
+        return {
+            "response": "Lo siento, hubo un error al procesar tu mensaje. Por favor intenta de nuevo o reformula tu pregunta.",
+            "error": str(e),
+            "success": False,
+            "model_info": model_info
+        }
+
+    @staticmethod
+    def _message_text(result) -> str:
+        # Extraer el contenido del mensaje (puede ser AIMessage u otro tipo)
+        return result.content if hasattr(result, 'content') else str(result)
+
+    def chat(
+        self,
+        message: str,
+        chat_history: Optional[List[dict]] = None,
+        wearable_data: Optional[dict] = None,
+        summary: Optional[str] = None
+    ) -> dict:
         """
         Procesa mensaje del usuario
         
         Args:
             message: Mensaje del usuario
             chat_history: Historial de conversación previo
+            wearable_data: Datos del wearable para esta petición
+            summary: Resumen de los mensajes anteriores a chat_history (Chat.summary)
             
         Returns:
             dict con respuesta, tools usadas y metadata
         """
+        model_info = self._model_info()
         try:
-            # ✅ AGREGAR: Información detallada del modelo
-            model_info = {
-                "provider": self.llm_provider,
-                "model": self.model_name or getattr(settings, f"{self.llm_provider}_model", "unknown"),
-                "timestamp": datetime.now().isoformat()
-            }
-            
             print(f"🔧 Modelo activo: {model_info}")
             
+            if wearable_data is None:
+                wearable_data = self.wearable_data
+            
+            # Calculadoras: respuesta directa, sin el bucle del agente
+            match = self._fast_path(message, wearable_data)
+            if match:
+                outputs = match.execute()
+                response_text = self._phrase_fast_path_sync(message, outputs)
+                return self._fast_path_result(match, outputs, response_text, model_info, wearable_data)
+            
             # Verificar si tenemos LLM disponible
             if not self.llm:
-                return {
-                    "response": "Lo siento, el sistema de IA no está disponible en este momento. Por favor verifica la configuración.",
-                    "error": "LLM no disponible",
-                    "success": False,
-                    "model_info": model_info
-                }
+                return self._unavailable(model_info)
             
-            # Construir input con historial si existe
-            full_input = message
-            if chat_history and len(chat_history) > 0:
-                history_text = "\n".join([
-                    f"{'Usuario' if msg['role'] == 'user' else 'Asistente'}: {msg['content']}"
-                    for msg in chat_history[-6:]
-                ])
-                full_input = f"HISTORIAL RECIENTE:\n{history_text}\n\nPREGUNTA ACTUAL: {message}"
-
-            # === RAG: Recuperar documentos relevantes y añadirlos al prompt ===
-            retrieved_docs = []
-            try:
-                from ..rag.vector_store import vector_store
-                if vector_store:
-                    # k configurable desde settings
-                    from ..config import settings
-                    retrieved_docs = vector_store.similarity_search(message, k=getattr(settings, 'rag_k', 4))
-            except Exception as e:
-                print(f"⚠️ RAG retrieval failed: {e}")
-
-            if retrieved_docs:
-                try:
-                    retrieved_texts = "\n\n".join([
-                        f"- {d['content'].strip()} (source: {d.get('metadata', {}).get('source', 'unknown')}, topic: {d.get('metadata', {}).get('topic', '')})"
-                        for d in retrieved_docs
-                    ])
-                    rag_context = f"CONOCIMIENTO RELEVANTE (recuperado por RAG):\n{retrieved_texts}\n\n"
-                    full_input = f"{rag_context}{full_input}"
-                except Exception as e:
-                    print(f"⚠️ Error formateando resultados RAG: {e}")
+            cached, cache_ticket = self._cache_lookup(message, chat_history, wearable_data, model_info, summary)
+            if cached:
+                return cached
+            context = self._user_context(wearable_data)
+            full_input = self._assemble_input(message, chat_history, self._retrieve(message), context, summary)
             
             # Si tenemos agente_executor, usarlo
             if self.agent_executor:
                 print(f"💬 Procesando con agente: {message[:50]}...")
-                response = self.agent_executor.invoke({"input": full_input})
-                
-                # Extraer tools usadas
-                tools_used = []
-                if response.get("intermediate_steps"):
-                    for step in response["intermediate_steps"]:
-                        try:
-                            tool_action = step[0]
-                            tools_used.append({
-                                "tool": tool_action.tool,
-                                "input": str(tool_action.tool_input)
-                            })
-                        except Exception as e:
-                            print(f"⚠️ Error extrayendo tool info: {e}")
+                response = self.agent_executor.invoke({"input": full_input, **context})
+                result = self._agent_result(response, model_info, wearable_data)
+                self._cache_store(message, cache_ticket, result)
+                return result
+
+            # Fallback: usar LLM directamente sin agente
+            print(f"💬 Procesando con LLM directo: {message[:50]}...")
+            full_input_with_context = self._direct_prompt(full_input, context)
+            
+            # Para LLM directo, usar el método invoke o generate
+            try:
+                response_text = self._message_text(self.llm.invoke(full_input_with_context))
+            except Exception as e:
+                print(f"⚠️ Error con invoke, intentando con generate: {e}")
+                try:
+                    result = self.llm.generate([full_input_with_context])
+                    response_text = result.generations[0][0].text if result.generations else "No se pudo generar respuesta"
+                except Exception as e2:
+                    print(f"❌ Error con generate: {e2}")
+                    response_text = "Lo siento, no pude procesar tu mensaje en este momento."
+                    return self._direct_result(response_text, model_info, wearable_data)
+            
+            result = self._direct_result(response_text, model_info, wearable_data)
+            self._cache_store(message, cache_ticket, result)
+            return result
                 
-                return {
-                    "response": response["output"],
-                    "tools_used": tools_used,
-                    "model_info": model_info,
-                    "wearable_data_used": bool(self.wearable_data),
-                    "success": True
+        except Exception as e:
+            return self._error_result(e, model_info)
+
+    async def _arun(
+        self,
+        message: str,
+        full_input: str,
+        context: Dict[str, str],
+        model_info: dict,
+        wearable_data: Optional[dict],
+        callbacks: Optional[list] = None
+    ) -> dict:
+        """Ejecuta el agente (o el LLM directo) de forma asíncrona sobre la entrada ya construida"""
+        config = {"callbacks": callbacks} if callbacks else None
+
+        if self.agent_executor:
+            print(f"💬 Procesando con agente (async): {message[:50]}...")
+            response = await self.agent_executor.ainvoke({"input": full_input, **context}, config=config)
+            return self._agent_result(response, model_info, wearable_data)
+
+        print(f"💬 Procesando con LLM directo (async): {message[:50]}...")
+        full_input_with_context = self._direct_prompt(full_input, context)
+
+        try:
+            response_text = self._message_text(await self.llm.ainvoke(full_input_with_context, config=config))
+        except Exception as e:
+            print(f"⚠️ Error con ainvoke, intentando con agenerate: {e}")
+            try:
+                result = await self.llm.agenerate([full_input_with_context], callbacks=callbacks)
+                response_text = result.generations[0][0].text if result.generations else "No se pudo generar respuesta"
+            except Exception as e2:
+                print(f"❌ Error con agenerate: {e2}")
+                response_text = "Lo siento, no pude procesar tu mensaje en este momento."
+
+        return self._direct_result(response_text, model_info, wearable_data)
+
+    async def _arun_scoped(self, deadline: Deadline, *args, **kwargs) -> dict:
+        """`_arun` con el plazo visible para proveedores y herramientas (contextvar)"""
+        with deadline_scope(deadline):
+            return await self._arun(*args, **kwargs)
+
+    def _passthrough(self) -> bool:
+        """Si todo el texto del LLM es respuesta (LLM directo; en modo tools no hay "Final Answer:")"""
+        return self.agent_executor is None or self.agent_mode == "tools"
+
+    def _stream_handler(self, queue=None):
+        """En modo tools el texto de cada turno espera a saber si el turno pide herramientas"""
+        from .streaming import AgentStreamHandler
+
+        return AgentStreamHandler(
+            queue,
+            passthrough=self._passthrough(),
+            hold_turns=self.agent_executor is not None and self.agent_mode == "tools"
+        )
+
+    async def _arun_with_deadline(
+        self,
+        deadline: Deadline,
+        handler,
+        message: str,
+        full_input: str,
+        context: Dict[str, str],
+        model_info: dict,
+        wearable_data: Optional[dict]
+    ) -> dict:
+        """
+        `_arun` acotado por el plazo de la petición
+
+        Al agotarse el plazo se cancela la tarea (llamada al LLM, stream HTTP
+        con el proveedor, espera de herramientas) y se responde con lo que
+        lleve hecho. Si se cancela a quien espera (cliente desconectado),
+        también se cancela el trabajo en curso.
+        """
+        task = asyncio.create_task(
+            self._arun_scoped(deadline, message, full_input, context, model_info, wearable_data, callbacks=[handler])
+        )
+        try:
+            done, _ = await asyncio.wait({task}, timeout=deadline.remaining())
+        finally:
+            if not task.done():
+                task.cancel()
+                metrics.inc("cancel.agent_runs")
+        if task in done:
+            return task.result()
+        return self._partial_result(handler, model_info, wearable_data, deadline)
+
+    @staticmethod
+    def _partial_result(handler, model_info: dict, wearable_data: Optional[dict], deadline: Deadline) -> dict:
+        """Respuesta con lo que llevaba hecho el agente al agotarse el plazo"""
+        metrics.inc("cancel.deadline")
+        answer = handler.partial_answer.strip()
+        if answer:
+            response = answer + PARTIAL_NOTE
+        elif handler.tool_outputs:
+            response = "⏱️ No me dio tiempo a redactar la respuesta completa. Esto es lo que obtuve:\n\n" + "\n".join(
+                output.strip() for output in handler.tool_outputs
+            )
+        else:
+            response = "⏱️ Lo siento, no pude responder a tiempo. Por favor intenta de nuevo o haz una pregunta más concreta."
+
+        partial = bool(answer or handler.tool_outputs)
+        if partial:
+            metrics.inc("cancel.partial_answers")
+        print(f"⏱️ Plazo de {deadline.seconds:g}s agotado ({'respuesta parcial' if partial else 'sin respuesta'})")
+        return {
+            "response": response,
+            "tools_used": handler.tools_used,
+            "model_info": {**model_info, "partial": True, "deadline_seconds": deadline.seconds},
+            "wearable_data_used": bool(wearable_data),
+            "success": partial,
+            "error": None if partial else f"Tiempo límite de {deadline.seconds:g}s agotado"
+        }
+
+    async def achat(
+        self,
+        message: str,
+        chat_history: Optional[List[dict]] = None,
+        wearable_data: Optional[dict] = None,
+        summary: Optional[str] = None,
+        deadline: Optional[Deadline] = None
+    ) -> dict:
+        """
+        Versión asíncrona de chat()
+
+        El agente se ejecuta con `ainvoke` (los LLM con cliente async no ocupan
+        hilos; las herramientas y LLM síncronos los ejecuta LangChain en un
+        executor) y la recuperación RAG se delega al pool de trabajo bloqueante.
+        Así una generación lenta no congela el resto de peticiones.
+
+        `deadline` (por defecto `chat_deadline_seconds` desde ahora) acota la
+        ejecución del agente: al agotarse se cancela y se devuelve una
+        respuesta parcial (ver `_arun_with_deadline`).
+        """
+        from ..core.executor import run_blocking
+
+        deadline = deadline or Deadline(settings.chat_deadline_seconds)
+
+        model_info = self._model_info()
+        try:
+            print(f"🔧 Modelo activo: {model_info}")
+
+            if wearable_data is None:
+                wearable_data = self.wearable_data
+
+            match = await run_blocking(self._fast_path, message, wearable_data)
+            if match:
+                outputs = match.execute()
+                response_text = await self._phrase_fast_path_async(message, outputs, deadline)
+                return self._fast_path_result(match, outputs, response_text, model_info, wearable_data)
+
+            if not self.llm:
+                return self._unavailable(model_info)
+
+            cached, cache_ticket = await run_blocking(self._cache_lookup, message, chat_history, wearable_data, model_info, summary)
+            if cached:
+                return cached
+            context = await run_blocking(self._user_context, wearable_data)
+            retrieved_docs = await run_blocking(self._retrieve, message)
+            full_input = await run_blocking(self._assemble_input, message, chat_history, retrieved_docs, context, summary)
+
+            handler = self._stream_handler()
+            result = await self._arun_with_deadline(deadline, handler, message, full_input, context, model_info, wearable_data)
+            self._cache_store(message, cache_ticket, result)
+            return result
+
+        except Exception as e:
+            return self._error_result(e, model_info)
+
+    async def astream_chat(
+        self,
+        message: str,
+        chat_history: Optional[List[dict]] = None,
+        wearable_data: Optional[dict] = None,
+        summary: Optional[str] = None,
+        deadline: Optional[Deadline] = None
+    ) -> AsyncIterator[dict]:
+        """
+        Procesa el mensaje emitiendo eventos a medida que ocurren
+
+        Eventos (dict con "type"):
+            retrieval: documentos recuperados por RAG (fuente, tema, score)
+            tool_start / tool_end: el agente llama a una herramienta
+            token: fragmento de la respuesta final
+            done: resultado completo, mismo formato que chat() en "result"
+
+        Con el mismo plazo que achat(): al agotarse, "done" lleva la respuesta
+        parcial. Si el consumidor deja de iterar (cliente desconectado) se
+        cancela la generación en curso.
+        """
+        from ..core.executor import run_blocking
+
+        deadline = deadline or Deadline(settings.chat_deadline_seconds)
+
+        model_info = self._model_info()
+        print(f"🔧 Modelo activo (streaming): {model_info}")
+
+        if wearable_data is None:
+            wearable_data = self.wearable_data
+
+        match = await run_blocking(self._fast_path, message, wearable_data)
+        if match:
+            outputs = match.execute()
+            for name, args, output in outputs:
+                yield {"type": "tool_start", "tool": name, "input": str(args)}
+                yield {"type": "tool_end", "tool": name, "output": output[:500]}
+            response_text = await self._phrase_fast_path_async(message, outputs, deadline)
+            result = self._fast_path_result(match, outputs, response_text, model_info, wearable_data)
+            if result.get("response"):
+                yield {"type": "token", "content": result["response"]}
+            yield {"type": "done", "result": result}
+            return
+
+        if not self.llm:
+            yield {"type": "done", "result": self._unavailable(model_info)}
+            return
+
+        cached, cache_ticket = await run_blocking(self._cache_lookup, message, chat_history, wearable_data, model_info, summary)
+        if cached:
+            yield {"type": "token", "content": cached["response"]}
+            yield {"type": "done", "result": cached}
+            return
+        context = await run_blocking(self._user_context, wearable_data)
+        retrieved_docs = await run_blocking(self._retrieve, message)
+        yield {
+            "type": "retrieval",
+            "documents": [
+                {
+                    "source": d.get("metadata", {}).get("source", "unknown"),
+                    "topic": d.get("metadata", {}).get("topic", ""),
+                    "score": d.get("score")
                 }
-            else:
-                # Fallback: usar LLM directamente sin agente
-                print(f"💬 Procesando con LLM directo: {message[:50]}...")
-                
-                # Si hay datos del wearable, incluirlos en el mensaje
-                wearable_context = self._format_wearable_context()
-                # Incluir también el perfil del usuario en el contexto para personalización
-                user_profile_context = self._get_user_profile_context()
+                for d in retrieved_docs
+            ]
+        }
+        full_input = await run_blocking(self._assemble_input, message, chat_history, retrieved_docs, context, summary)
 
-                full_input_with_context = f"{wearable_context}\n\n{user_profile_context}\n\nUsuario: {full_input}\nAsistente:"
-                
-                # Para LLM directo, usar el método invoke o generate
+        queue: asyncio.Queue = asyncio.Queue()
+        handler = self._stream_handler(queue)
+        task = asyncio.create_task(
+            self._arun_scoped(deadline, message, full_input, context, model_info, wearable_data, callbacks=[handler])
+        )
+
+        try:
+            # Reenviar eventos mientras el agente trabaja (hasta el plazo)
+            timed_out = False
+            while True:
+                getter = asyncio.ensure_future(queue.get())
+                done, _ = await asyncio.wait(
+                    {getter, task},
+                    timeout=deadline.remaining(),
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                if getter in done:
+                    yield getter.result()
+                    continue
+                getter.cancel()
+                timed_out = task not in done
+                break
+
+            while not queue.empty():
+                yield queue.get_nowait()
+
+            if timed_out:
+                result = self._partial_result(handler, model_info, wearable_data, deadline)
+            else:
                 try:
-                    # Intentar con invoke
-                    result = self.llm.invoke(full_input_with_context)
-                    # Extraer el contenido del mensaje (puede ser AIMessage u otro tipo)
-                    if hasattr(result, 'content'):
-                        response_text = result.content
-                    else:
-                        response_text = str(result)
+                    result = task.result()
                 except Exception as e:
-                    print(f"⚠️ Error con invoke, intentando con generate: {e}")
-                    try:
-                        # Intentar con generate
-                        result = self.llm.generate([full_input_with_context])
-                        response_text = result.generations[0][0].text if result.generations else "No se pudo generar respuesta"
-                    except Exception as e2:
-                        print(f"❌ Error con generate: {e2}")
-                        response_text = "Lo siento, no pude procesar tu mensaje en este momento."
-                
-                return {
-                    "response": response_text,
-                    "tools_used": [],
-                    "model_info": model_info,
-                    "wearable_data_used": bool(self.wearable_data),
-                    "success": True
-                }
-                
-        except Exception as e:
-            print(f"❌ Error en agente: {e}")
-            traceback.print_exc()
-            
-            return {
-                "response": "Lo siento, hubo un error al procesar tu mensaje. Por favor intenta de nuevo o reformula tu pregunta.",
-                "error": str(e),
-                "success": False,
-                "model_info": model_info
-            }
+                    result = self._error_result(e, model_info)
+        finally:
+            # Plazo agotado o cliente desconectado: no seguir generando
+            if not task.done():
+                task.cancel()
+                metrics.inc("cancel.agent_runs")
+
+        # Proveedores sin streaming de tokens (HuggingFace) o respuesta sin
+        # marcador "Final Answer:": se envía la respuesta completa de una vez
+        if not handler.answer_streamed and result.get("response"):
+            yield {"type": "token", "content": result["response"]}
+        elif result.get("model_info", {}).get("partial"):
+            yield {"type": "token", "content": PARTIAL_NOTE}
+
+        self._cache_store(message, cache_ticket, result)
+        yield {"type": "done", "result": result}
     
     def update_wearable_data(self, new_data: dict):
-        """Actualiza datos del wearable y recrea el agente"""
+        """Actualiza los datos del wearable por defecto (los que se usan si la llamada no aporta otros)"""
         self.wearable_data = new_data
         print("✅ Datos del wearable actualizados")
\ No newline at end of file
@@ -0,0 +1,146 @@
+"""Registro de agentes reutilizables (LLM + herramientas + AgentExecutor)"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from ..config import settings
+from .agent import ChatFitAgent
+
+AgentKey = Tuple[str, str, Optional[float]]
+
+
+class AgentPool:
+    """
+    Agentes compartidos entre peticiones, uno por (proveedor, modelo, temperatura)
+
+    Crear un ChatFitAgent es caro (sondeo a Ollama, cliente Groq/OpenAI,
+    carga completa de un modelo HuggingFace, herramientas y AgentExecutor);
+    aquí se crea una sola vez y se reutiliza. El contexto de cada petición
+    (wearable, perfil) se pasa al invocar, no al construir.
+
+    - `max_resident`: máximo de agentes en memoria; se expulsa el menos usado
+    - `idle_ttl`: segundos sin uso tras los que un agente se descarta
+    - Peticiones simultáneas para la misma clave esperan a una única
+      construcción en lugar de cargar el modelo varias veces
+    - Un agente sin LLM (proveedor caído) o sin AgentExecutor (modo directo
+      degradado) no se guarda, así el siguiente intento vuelve a probar
+    """
+
+    def __init__(self, max_resident: int = 4, idle_ttl: float = 900.0):
+        self.max_resident = max_resident
+        self.idle_ttl = idle_ttl
+
+        self._lock = threading.Lock()
+        self._agents: "OrderedDict[AgentKey, ChatFitAgent]" = OrderedDict()
+        self._last_used: Dict[AgentKey, float] = {}
+        self._building: Dict[AgentKey, threading.Lock] = {}
+
+    @staticmethod
+    def _key(provider: Optional[str], model_name: Optional[str], temperature: Optional[float]) -> AgentKey:
+        provider = provider or settings.llm_provider
+        model_name = model_name or getattr(settings, f"{provider}_model", "")
+        return (provider, model_name, temperature)
+
+    def _touch(self, key: AgentKey):
+        self._agents.move_to_end(key)
+        self._last_used[key] = time.monotonic()
+
+    def _evict(self):
+        """Descarta agentes inactivos y los que excedan max_resident (con el lock)"""
+        now = time.monotonic()
+        for key in list(self._agents):
+            if now - self._last_used[key] > self.idle_ttl:
+                self._drop(key, "inactivo")
+        while len(self._agents) > self.max_resident:
+            self._drop(next(iter(self._agents)), "límite de residentes")
+
+    def _drop(self, key: AgentKey, reason: str):
+        self._agents.pop(key, None)
+        self._last_used.pop(key, None)
+        print(f"♻️ Agente {key[0]}/{key[1]} liberado ({reason})")
+
+    def get(
+        self,
+        provider: Optional[str] = None,
+        model_name: Optional[str] = None,
+        temperature: Optional[float] = None
+    ) -> ChatFitAgent:
+        """
+        Devuelve el agente para la clave, creándolo si no existe
+
+        Bloqueante si hay que construirlo: desde código async usar
+        `run_blocking(agent_pool.get, ...)`.
+        """
+        key = self._key(provider, model_name, temperature)
+
+        with self._lock:
+            self._evict()
+            agent = self._agents.get(key)
+            if agent is not None:
+                self._touch(key)
+                return agent
+            build_lock = self._building.setdefault(key, threading.Lock())
+
+        with build_lock:
+            # Otro hilo pudo construirlo mientras se esperaba
+            with self._lock:
+                agent = self._agents.get(key)
+                if agent is not None:
+                    self._touch(key)
+                    return agent
+
+            try:
+                agent = ChatFitAgent(
+                    llm_provider=key[0],
+                    model_name=key[1],
+                    temperature=temperature
+                )
+            except Exception:
+                with self._lock:
+                    self._building.pop(key, None)
+                raise
+
+            with self._lock:
+                if agent.llm is not None and agent.agent_executor is not None:
+                    self._agents[key] = agent
+                    self._touch(key)
+                    self._evict()
+                    print(f"📦 Agente {key[0]}/{key[1]} en el pool ({len(self._agents)}/{self.max_resident})")
+                # Solo tras publicarlo: quien espera este lock o llega después
+                # encuentra el agente en lugar de construirlo otra vez
+                self._building.pop(key, None)
+            return agent
+
+    def invalidate(self, provider: Optional[str] = None, model_name: Optional[str] = None):
+        """Descarta los agentes de un proveedor/modelo (o todos si no se indica)"""
+        with self._lock:
+            for key in list(self._agents):
+                if (provider is None or key[0] == provider) and (model_name is None or key[1] == model_name):
+                    self._drop(key, "invalidado")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            now = time.monotonic()
+            return {
+                "resident": len(self._agents),
+                "max_resident": self.max_resident,
+                "idle_ttl": self.idle_ttl,
+                "agents": [
+                    {
+                        "provider": key[0],
+                        "model": key[1],
+                        "temperature": key[2],
+                        "idle_seconds": round(now - self._last_used[key], 1)
+                    }
+                    for key in self._agents
+                ]
+            }
+
+
+# Instancia global
+agent_pool = AgentPool(
+    max_resident=settings.agent_pool_max_resident,
+    idle_ttl=settings.agent_pool_idle_ttl
+)
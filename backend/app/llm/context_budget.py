@@ -0,0 +1,247 @@
+"""Presupuesto de tokens del prompt: perfil, wearable, RAG e historial según el modelo destino"""
+
+import math
+import threading
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+from ..config import settings
+from ..core.metrics import metrics
+
+TRUNCATION_MARK = " […]"
+
+
+def _tiktoken_encoding(model: Optional[str]):
+    """Codificación de tiktoken para el modelo (None si tiktoken no está instalado)"""
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model or "")
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+class TokenCounter:
+    """
+    Cuenta tokens con el tokenizador del modelo destino
+
+    - openai: tiktoken del modelo (exacto)
+    - huggingface: tokenizador del modelo residente (exacto)
+    - ollama / groq: sin tokenizador local; cl100k_base (tiktoken) como
+      aproximación, inflada con `context_estimate_margin` para no quedarse corto
+    - sin tiktoken: ~4 caracteres por token, con el mismo margen
+    """
+
+    def __init__(self, provider: str, model: Optional[str]):
+        self.provider = provider
+        self.model = model
+        self.exact = False
+        self._encode: Callable[[str], List[int]]
+        self._decode: Optional[Callable[[List[int]], str]] = None
+
+        if provider == "huggingface":
+            from .hf_server import get_hf_server
+            tokenizer = get_hf_server(model).tokenizer
+            self._encode = lambda text: tokenizer.encode(text, add_special_tokens=False)
+            self._decode = lambda ids: tokenizer.decode(ids, skip_special_tokens=True)
+            self.exact = True
+            return
+
+        encoding = _tiktoken_encoding(model if provider == "openai" else None)
+        if encoding is not None:
+            self._encode = lambda text: encoding.encode(text, disallowed_special=())
+            self._decode = encoding.decode
+            self.exact = provider == "openai"
+        else:
+            self._encode = lambda text: [0] * math.ceil(len(text) / 4)
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        tokens = len(self._encode(text))
+        return tokens if self.exact else math.ceil(tokens * settings.context_estimate_margin)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Recorta el texto a `max_tokens` (contados con el mismo margen que `count`)"""
+        if max_tokens <= 0:
+            return ""
+        if self.count(text) <= max_tokens:
+            return text
+        limit = max_tokens if self.exact else int(max_tokens / settings.context_estimate_margin)
+        limit = max(0, limit - len(self._encode(TRUNCATION_MARK)))
+        if self._decode is None:
+            return text[:limit * 4].rstrip() + TRUNCATION_MARK
+        return self._decode(self._encode(text)[:limit]).rstrip() + TRUNCATION_MARK
+
+
+_counters: Dict[Tuple[str, Optional[str]], TokenCounter] = {}
+_counters_lock = threading.Lock()
+
+
+def get_token_counter(provider: str, model: Optional[str]) -> TokenCounter:
+    key = (provider, model)
+    counter = _counters.get(key)
+    if counter is None:
+        with _counters_lock:
+            counter = _counters.get(key)
+            if counter is None:
+                counter = TokenCounter(provider, model)
+                _counters[key] = counter
+    return counter
+
+
+def context_window(provider: str) -> int:
+    """Tokens de prompt que admite (o que queremos pagar en) cada proveedor"""
+    if provider == "ollama":
+        return settings.ollama_num_ctx
+    if provider == "huggingface":
+        # El servidor residente ya reserva su parte para la respuesta
+        return settings.huggingface_max_length - min(settings.huggingface_max_new_tokens, settings.huggingface_max_length // 2)
+    if provider == "router":
+        # El prompt tiene que caber en cualquier backend que acabe respondiendo
+        from .llm_router import parse_backends
+        return min((context_window(backend) for backend, _, _ in parse_backends(settings.llm_routing_backends)), default=settings.context_max_tokens)
+    return settings.context_max_tokens
+
+
+@dataclass
+class ContextPlan:
+    """Lo que cabe en el prompt de esta petición y cuánto ocupa cada parte"""
+    message: str
+    history: List[dict]
+    documents: List[Dict]
+    breakdown: Dict[str, int] = field(default_factory=dict)
+    dropped: Dict[str, int] = field(default_factory=dict)
+
+    def summary(self) -> str:
+        parts = " · ".join(f"{name} {tokens}" for name, tokens in self.breakdown.items() if name not in ("total", "window"))
+        dropped = ", ".join(f"{count} {name}" for name, count in self.dropped.items() if count)
+        line = f"📐 Contexto {self.breakdown['total']}/{self.breakdown['window']} tokens ({parts})"
+        return f"{line}; descartado: {dropped}" if dropped else line
+
+
+class ContextBudget:
+    """
+    Reparte la ventana de contexto entre las partes del prompt
+
+    Orden de prioridad:
+    1. Fijo: instrucciones + herramientas, perfil y wearable (siempre entran)
+    2. Reserva para la respuesta y el scratchpad del bucle ReAct
+    3. La pregunta (recortada solo si ella sola no cabe)
+    4. RAG (hasta `context_rag_share` de lo que queda) e historial; lo que no
+       usa uno lo aprovecha el otro
+
+    Si no cabe todo se descartan primero los documentos peor clasificados y
+    los mensajes más antiguos; los mensajes muy largos se recortan a
+    `context_message_max_tokens`.
+    """
+
+    def __init__(
+        self,
+        counter: TokenCounter,
+        window: int,
+        reserved: int = 1024,
+        rag_share: float = 0.4,
+        message_max_tokens: int = 300
+    ):
+        self.counter = counter
+        self.window = window
+        self.reserved = min(reserved, window // 4)
+        self.rag_share = rag_share
+        self.message_max_tokens = message_max_tokens
+
+    @classmethod
+    def for_model(cls, provider: str, model: Optional[str]) -> "ContextBudget":
+        return cls(
+            get_token_counter(provider, model),
+            window=context_window(provider),
+            reserved=settings.context_reserved_tokens,
+            rag_share=settings.context_rag_share,
+            message_max_tokens=settings.context_message_max_tokens
+        )
+
+    @staticmethod
+    def _history_line(message: dict) -> str:
+        return f"{'Usuario' if message['role'] == 'user' else 'Asistente'}: {message['content']}"
+
+    @staticmethod
+    def _document_line(document: Dict) -> str:
+        metadata = document.get("metadata", {})
+        return f"- {document['content'].strip()} (source: {metadata.get('source', 'unknown')}, topic: {metadata.get('topic', '')})"
+
+    def _fit_documents(self, documents: List[Dict], budget: int) -> Tuple[List[Dict], int]:
+        """Documentos en orden de relevancia mientras quepan"""
+        kept, used = [], 0
+        for document in documents:
+            tokens = self.counter.count(self._document_line(document))
+            if used + tokens > budget:
+                break
+            kept.append(document)
+            used += tokens
+        return kept, used
+
+    def _fit_history(self, history: List[dict], budget: int) -> Tuple[List[dict], int]:
+        """Mensajes del más reciente al más antiguo mientras quepan (los largos, recortados)"""
+        kept, used = [], 0
+        for message in reversed(history):
+            content = self.counter.truncate(message.get("content") or "", self.message_max_tokens)
+            tokens = self.counter.count(self._history_line({**message, "content": content}))
+            if used + tokens > budget:
+                break
+            kept.append({**message, "content": content})
+            used += tokens
+        kept.reverse()
+        return kept, used
+
+    def fit(
+        self,
+        fixed: Dict[str, str],
+        message: str,
+        history: Optional[List[dict]],
+        documents: Optional[List[Dict]]
+    ) -> ContextPlan:
+        """
+        Args:
+            fixed: Partes que siempre entran, por nombre (prompt, perfil, wearable)
+            message: Pregunta del usuario
+            history: Mensajes recientes, del más antiguo al más nuevo
+            documents: Documentos RAG, del más al menos relevante
+        """
+        history = history or []
+        documents = documents or []
+        breakdown = {name: self.counter.count(text) for name, text in fixed.items()}
+        available = self.window - self.reserved - sum(breakdown.values())
+
+        message = self.counter.truncate(message, max(available, self.message_max_tokens))
+        breakdown["pregunta"] = self.counter.count(message)
+        available = max(0, available - breakdown["pregunta"])
+
+        # RAG hasta su cuota; el historial se queda el resto (incluido lo que el RAG no use)
+        kept_documents, rag_tokens = self._fit_documents(documents, int(available * self.rag_share))
+        kept_history, history_tokens = self._fit_history(history, available - rag_tokens)
+        # Si sobró sitio del historial, más documentos
+        if len(kept_documents) < len(documents):
+            kept_documents, rag_tokens = self._fit_documents(documents, available - history_tokens)
+
+        breakdown["rag"] = rag_tokens
+        breakdown["historial"] = history_tokens
+        breakdown["reserva"] = self.reserved
+        breakdown["total"] = sum(breakdown.values())
+        breakdown["window"] = self.window
+
+        plan = ContextPlan(
+            message=message,
+            history=kept_history,
+            documents=kept_documents,
+            breakdown=breakdown,
+            dropped={
+                "documentos": len(documents) - len(kept_documents),
+                "mensajes": len(history) - len(kept_history)
+            }
+        )
+        metrics.observe("context.prompt_tokens", breakdown["total"] - self.reserved)
+        metrics.inc("context.documents_dropped", plan.dropped["documentos"])
+        metrics.inc("context.messages_dropped", plan.dropped["mensajes"])
+        return plan
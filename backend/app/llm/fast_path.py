@@ -0,0 +1,298 @@
+"""Ruta rápida determinista: preguntas de calculadora respondidas sin el bucle del agente"""
+
+import re
+import threading
+import time
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+from ..config import settings
+from ..core.metrics import Distribution, metrics
+from .tools import analyze_steps, calculate_bmi, calculate_daily_calories, calculate_target_heart_rate
+
+PHRASING_PROMPT = """Eres CHATFIT AI, un asistente de fitness y salud.
+Responde a la pregunta del usuario en 2-4 frases, en español, con tono empático
+y motivador. Usa solo las cifras de los resultados calculados; no inventes datos.
+
+PREGUNTA: {question}
+
+RESULTADOS CALCULADOS:
+{results}
+
+RESPUESTA:"""
+
+NUMBER = r"(\d+(?:[.,]\d+)?)"
+
+# Intención → patrón sobre el texto normalizado (minúsculas, sin tildes)
+INTENTS: Dict[str, re.Pattern] = {
+    "calculate_bmi": re.compile(r"\bimc\b|\bbmi\b|indice de masa corporal"),
+    "calculate_daily_calories": re.compile(
+        r"\btdee\b|\bbmr\b|metabolismo basal|gasto (calorico|energetico)|calorias (diarias|de mantenimiento)"
+        r"|cuantas calorias (necesito|debo|deberia|tengo que)|calorias (necesito|debo|deberia) (comer|consumir|tomar)"
+    ),
+    "calculate_target_heart_rate": re.compile(
+        r"(frecuencia|ritmo) cardiac[oa] (maxim[oa]|objetivo)|zonas? (de )?(frecuencia|cardiacas?|entrenamiento|pulsaciones)"
+        r"|pulsaciones maximas|\bfc max|zona de quema"
+    ),
+    "analyze_steps": re.compile(
+        r"\bpasos\b.*\b(hoy|llevo|voy|analiza)\b|\b(llevo|he dado|he caminado|como voy|analiza)\b.*\bpasos\b|\bmis pasos\b"
+    ),
+}
+
+# Pistas de que se pide un cálculo personal ("mi IMC", "calcula",
+# "cuántas calorías necesito"); sin ellas la pregunta es general
+PERSONAL = re.compile(
+    r"\bmis?\b|\bcalcul\w*|\bcuan(to|ta|tos|tas)\b|\b(necesito|tengo|llevo|peso|mido|voy|dime)\b|\bme (da|sale|toca|corresponde)\b"
+)
+
+# Peticiones que piden algo más que el cálculo: mejor el agente
+DEFER = re.compile(
+    r"\b(por que|explica\w*|plan|dieta|rutina|receta|menu|recomiend\w*|consejos?|entrenamiento de fuerza|ejercicios)\b"
+    r"|que (debo|deberia|puedo) (hacer|comer)|como (puedo|hago para)"
+    # Definiciones, comparaciones y valoraciones: las responde el agente
+    r"|\bque (es|son|significa|mide)\b|\b(normal|normales|diferencia|sirven?|buen[oa]?|mejor|peor|peligros[oa]|saludable|ideal|fiable)\b"
+    # Necesidades para una actividad concreta, no el gasto diario
+    r"|\bpara (correr|entrenar|competir|hacer|una?|el|la)\b"
+    # El usuario ya da el valor de la métrica ("mi IMC es 31"): quiere una valoración
+    r"|\b(imc|bmi|tdee|bmr)\b\W*((es|son|esta en|da|sale|de|me da)\s+)*\d|\d\s*(kcal|calorias)\b"
+    # Cambios de peso: las cifras son la meta, no el valor actual
+    r"|\b(perder|perd[ieo]\w*|pierd\w*|bajar|baj[eoa]\w*|subir|sub[eoi]\w*|ganar|gan[eoa]\w*|adelgaz\w*|engord\w*)\b"
+    # Otra persona o el pasado: el perfil y el wearable no aplican
+    r"|\bmis? (hij[oa]|madre|padre|mama|papa|pareja|novi[oa]|espos[oa]|marido|mujer|herman[oa]|amig[oa]|abuel[oa]|sobrin[oa]|prim[oa])s?\b"
+    r"|\bhace\b|\bcuando\b|\b(pesaba|media|tenia|caminaba)\b|\b(antes|ano pasado|mes pasado|semana pasada|ayer)\b"
+)
+
+# Valores actuales del usuario: solo en primera persona y presente ("peso 82",
+# "mido 1,80", "tengo 30 años", "llevo 7.500 pasos"); una cifra suelta junto a
+# una unidad puede ser una meta o un dato de otra cosa
+SLOTS = {
+    "weight_kg": re.compile(r"\b(?:mi peso (?:actual )?(?:es (?:de )?)?|peso|estoy en)\s*(?:unos\s+)?" + NUMBER + r"(?!\d|[.,]\d)(?!\s*(?:cm|centimetros?|anos|pasos|lbs?|libras?|g|gramos?)\b)"),
+    "height_m": re.compile(r"\bmido\s+(?:unos\s+)?(\d[.,]\d{1,2})\b"),
+    "height_cm": re.compile(r"\bmido\s+(?:unos\s+)?(\d{3})\b"),
+    # "tengo 30 años", no "tengo 3 años entrenando"
+    "age": re.compile(r"\btengo\s+(\d{1,3})\s*anos\b(?!\s+(?:de\s+(?!edad\b)|entrenando|corriendo|haciendo|practicando|en (?:el|este|esto)\b))"),
+    "steps": re.compile(
+        r"\b(?:llevo|he dado|he caminado|he hecho|voy por|tengo)\s+(?:unos\s+|ya\s+)?(\d{1,3}(?:[.,]\d{3})+|\d+)\s*(mil\s+)?pasos\b"
+    ),
+    "goal": re.compile(r"\b(?:objetivo|meta)\s+(?:es\s+|de\s+)?(\d{1,3}(?:[.,]\d{3})+|\d+)(\s*mil)?"),
+    "resting_hr": re.compile(r"\ben reposo\D{0,20}(\d{2,3})\b|\b(\d{2,3})\s*(?:bpm|ppm|pulsaciones)\s+en reposo"),
+}
+
+# Cifras con unidad en el mensaje: si no encajan en el slot (primera persona,
+# presente) no se sabe a qué se refieren y tampoco se usa el perfil
+MENTIONS = {
+    "weight_kg": re.compile(r"\d\s*(?:kg|kilos?|kilogramos?|lbs?|libras?)\b"),
+    "height": re.compile(r"\d\s*(?:m|metros?|cm|centimetros?)\b"),
+    "age": re.compile(r"\d\s*anos\b"),
+}
+
+GENDERS = [("hombre", re.compile(r"\b(hombre|varon|masculino)\b")), ("mujer", re.compile(r"\b(mujer|femenino)\b"))]
+ACTIVITY_LEVELS = [
+    ("muy_activo", re.compile(r"\bmuy activ[oa]\b")),
+    ("sedentario", re.compile(r"\bsedentari[oa]\b")),
+    ("ligero", re.compile(r"\b(ligero|poco activ[oa])\b")),
+    ("moderado", re.compile(r"\bmoderad[oa]\b")),
+    ("activo", re.compile(r"\bactiv[oa]\b")),
+]
+
+TOOLS = {
+    "calculate_bmi": calculate_bmi,
+    "calculate_daily_calories": calculate_daily_calories,
+    "calculate_target_heart_rate": calculate_target_heart_rate,
+    "analyze_steps": analyze_steps,
+}
+
+
+def normalize_question(text: str) -> str:
+    """Minúsculas, sin tildes ni signos de apertura, espacios colapsados"""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(text.replace("¿", " ").replace("¡", " ").split())
+
+
+def _number(value: str) -> float:
+    return float(value.replace(",", "."))
+
+
+def _integer(value: str) -> int:
+    """Enteros con separador de miles ("7.500", "7,500")"""
+    return int(re.sub(r"[.,]", "", value))
+
+
+@dataclass
+class FastPathMatch:
+    """Herramientas (con sus argumentos) que responden la pregunta"""
+    calls: List[Tuple[str, Dict]]
+    started: float = field(default_factory=time.perf_counter)
+
+    def execute(self) -> List[Tuple[str, Dict, str]]:
+        """Ejecuta las herramientas: (nombre, argumentos, salida)"""
+        return [(name, args, TOOLS[name].invoke(args)) for name, args in self.calls]
+
+
+class CalculatorRouter:
+    """
+    Enrutador de intenciones y slots delante del agente
+
+    Las calculadoras (IMC, calorías, zonas cardíacas, pasos) son funciones
+    puras: si la pregunta pide solo eso, se reconocen la intención y los
+    argumentos (del mensaje; si no aparecen, del wearable y del perfil del
+    usuario) y se ejecuta la herramienta directamente, sin las dos o más
+    generaciones del bucle del agente. El LLM solo interviene, opcionalmente,
+    para redactar la respuesta (`fast_path_phrasing`).
+
+    Si falta un argumento o la pregunta pide algo más (un plan, una
+    explicación), no se enruta y responde el agente.
+    """
+
+    def __init__(self, max_chars: int = 200):
+        self.max_chars = max_chars
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.routed = 0
+        self.by_intent: Dict[str, int] = {}
+        self._latency = Distribution()
+
+    # ==================== SLOTS ====================
+
+    @staticmethod
+    def _slot(name: str, text: str) -> Optional[str]:
+        match = SLOTS[name].search(text)
+        if match is None:
+            return None
+        return next(group for group in match.groups() if group)
+
+    @staticmethod
+    def _from_profile(mention: str, text: str, profile: Dict, key: str):
+        """Valor del perfil, salvo que el mensaje dé una cifra ambigua (None → agente)"""
+        return None if MENTIONS[mention].search(text) else profile.get(key)
+
+    @staticmethod
+    def _weight(text: str, profile: Dict) -> Optional[float]:
+        value = CalculatorRouter._slot("weight_kg", text)
+        return _number(value) if value else CalculatorRouter._from_profile("weight_kg", text, profile, "weight_kg")
+
+    @staticmethod
+    def _height(text: str, profile: Dict) -> Optional[float]:
+        meters = CalculatorRouter._slot("height_m", text)
+        if meters:
+            return round(_number(meters) * 100, 1)
+        centimeters = CalculatorRouter._slot("height_cm", text)
+        return float(centimeters) if centimeters else CalculatorRouter._from_profile("height", text, profile, "height_cm")
+
+    @staticmethod
+    def _age(text: str, profile: Dict) -> Optional[int]:
+        value = CalculatorRouter._slot("age", text)
+        return int(value) if value else CalculatorRouter._from_profile("age", text, profile, "age")
+
+    @staticmethod
+    def _thousands(match: re.Match) -> int:
+        """Cifra y multiplicador opcional ("10 mil")"""
+        value = _integer(match.group(1))
+        return value * 1000 if match.group(2) else value
+
+    @staticmethod
+    def _steps(text: str, wearable_data: Optional[dict]) -> Optional[int]:
+        # La cifra del objetivo no son los pasos de hoy
+        match = SLOTS["steps"].search(SLOTS["goal"].sub(" ", text))
+        if match:
+            return CalculatorRouter._thousands(match)
+        return (wearable_data or {}).get("steps")
+
+    @staticmethod
+    def _labelled(options, text: str, default: Optional[str]) -> Optional[str]:
+        for label, pattern in options:
+            if pattern.search(text):
+                return label
+        return default
+
+    def _arguments(self, intent: str, text: str, wearable_data: Optional[dict], profile: Dict) -> Optional[Dict]:
+        """Argumentos de la herramienta; None si falta alguno obligatorio"""
+        if intent == "calculate_bmi":
+            args = {"weight_kg": self._weight(text, profile), "height_cm": self._height(text, profile)}
+        elif intent == "calculate_daily_calories":
+            args = {
+                "weight_kg": self._weight(text, profile),
+                "height_cm": self._height(text, profile),
+                "age": self._age(text, profile),
+                "gender": self._labelled(GENDERS, text, profile.get("gender")),
+                "activity_level": self._labelled(ACTIVITY_LEVELS, text, profile.get("activity_level"))
+            }
+        elif intent == "calculate_target_heart_rate":
+            args = {"age": self._age(text, profile)}
+            resting_hr = self._slot("resting_hr", text)
+            if resting_hr:
+                args["resting_hr"] = int(resting_hr)
+        else:
+            args = {"steps": self._steps(text, wearable_data)}
+            goal = SLOTS["goal"].search(text)
+            if goal:
+                args["goal"] = self._thousands(goal)
+        if any(value is None for value in args.values()):
+            return None
+        return args
+
+    # ==================== API ====================
+
+    def route(
+        self,
+        message: str,
+        wearable_data: Optional[dict],
+        profile_loader: Callable[[], Dict]
+    ) -> Optional[FastPathMatch]:
+        """
+        Herramientas que responden la pregunta, o None si debe responder el agente
+
+        Args:
+            profile_loader: Devuelve el perfil del usuario (solo se consulta si hay intención)
+        """
+        with self._lock:
+            self.requests += 1
+        metrics.inc("fast_path.requests")
+
+        text = normalize_question(message)
+        if len(text) > self.max_chars or DEFER.search(text) or not PERSONAL.search(text):
+            return None
+        intents = [intent for intent, pattern in INTENTS.items() if pattern.search(text)]
+        if not intents:
+            return None
+
+        profile = profile_loader() or {}
+        calls = []
+        for intent in intents:
+            args = self._arguments(intent, text, wearable_data, profile)
+            if args is None:
+                metrics.inc("fast_path.missing_slots")
+                return None
+            calls.append((intent, args))
+        return FastPathMatch(calls=calls)
+
+    def record(self, match: FastPathMatch):
+        """Registra una pregunta respondida por la ruta rápida"""
+        latency_ms = (time.perf_counter() - match.started) * 1000
+        with self._lock:
+            self.routed += 1
+            for name, _ in match.calls:
+                self.by_intent[name] = self.by_intent.get(name, 0) + 1
+            self._latency.observe(latency_ms)
+        metrics.inc("fast_path.routed")
+        metrics.observe("fast_path.latency_ms", latency_ms)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "routed": self.routed,
+                "share": round(self.routed / self.requests, 3) if self.requests else 0.0,
+                "by_intent": dict(self.by_intent),
+                "latency_ms": self._latency.to_dict()
+            }
+
+
+def phrasing_prompt(question: str, outputs: List[Tuple[str, Dict, str]]) -> str:
+    return PHRASING_PROMPT.format(question=question, results="\n".join(output.strip() for _, _, output in outputs))
+
+
+# Instancia global
+fast_path_router = CalculatorRouter(max_chars=settings.fast_path_max_chars)
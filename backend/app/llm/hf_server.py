@@ -0,0 +1,467 @@
+"""Servidor residente de modelos HuggingFace con batching dinámico"""
+
+import asyncio
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import torch
+from langchain.llms.base import LLM
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from transformers import AutoModelForCausalLM, AutoTokenizer, StoppingCriteria, StoppingCriteriaList
+
+from ..config import settings
+from ..core.deadline import DeadlineExceeded, current_deadline
+from ..core.metrics import metrics
+
+
+@dataclass
+class GenerationRequest:
+    """Petición de generación encolada en el servidor"""
+    prompt: str
+    temperature: float
+    stop: List[str] = field(default_factory=list)
+    future: Future = field(default_factory=Future)
+    # Cancelada por quien la pidió, o plazo de la petición HTTP (reloj monotónico)
+    abort: threading.Event = field(default_factory=threading.Event)
+    expires_at: Optional[float] = None
+
+    def abandoned(self) -> bool:
+        return self.abort.is_set() or (self.expires_at is not None and time.monotonic() >= self.expires_at)
+
+
+class AbandonedCriteria(StoppingCriteria):
+    """Detiene generate() cuando todas las peticiones del lote se han abandonado"""
+
+    def __init__(self, batch: List[GenerationRequest]):
+        self.batch = batch
+        self.triggered = False
+
+    def __call__(self, input_ids, scores, **kwargs) -> bool:
+        if not self.triggered and all(request.abandoned() for request in self.batch):
+            self.triggered = True
+            metrics.inc("cancel.provider.huggingface")
+        return self.triggered
+
+
+def resolve_device() -> str:
+    """Dispositivo según `huggingface_device` ("auto": cuda > mps > cpu)"""
+    if settings.huggingface_device != "auto":
+        return settings.huggingface_device
+    if torch.cuda.is_available():
+        return "cuda"
+    if torch.backends.mps.is_available():
+        return "mps"
+    return "cpu"
+
+
+def apply_stop(text: str, stop: List[str]) -> str:
+    """Corta el texto en la primera secuencia de parada"""
+    cut = len(text)
+    for sequence in stop:
+        index = text.find(sequence)
+        if index >= 0:
+            cut = min(cut, index)
+    return text[:cut]
+
+
+def legacy_past(past_key_values):
+    """past_key_values como tupla por capa de (keys, values) [batch, heads, seq, dim]"""
+    if hasattr(past_key_values, "to_legacy_cache"):
+        return past_key_values.to_legacy_cache()
+    return past_key_values
+
+
+def crop_past(past_key_values, length: int):
+    """Los primeros `length` tokens de una caché KV (no modifica la original)"""
+    return tuple(
+        tuple(tensor[:, :, :length] for tensor in layer)
+        for layer in past_key_values
+    )
+
+
+class PrefixKVCache:
+    """
+    Cachés KV de los prompts más recientes (prompt + respuesta generada)
+
+    Un prompt nuevo que empiece por los mismos tokens que uno anterior (el
+    prefijo estable del agente, o la iteración previa del bucle ReAct, que es
+    el mismo prompt más el scratchpad) solo necesita procesar los tokens
+    posteriores. Cada entrada ocupa memoria del modelo: `max_entries` pequeño.
+    """
+
+    def __init__(self, max_entries: int = 2, min_tokens: int = 64):
+        self.max_entries = max_entries
+        self.min_tokens = min_tokens
+        self._entries: "deque[tuple]" = deque()  # (ids 1D, past_key_values)
+
+    @staticmethod
+    def _common_length(a: "torch.Tensor", b: "torch.Tensor") -> int:
+        n = min(a.shape[0], b.shape[0])
+        if n == 0:
+            return 0
+        mismatch = (a[:n] != b[:n]).nonzero()
+        return int(mismatch[0].item()) if mismatch.numel() else n
+
+    def match(self, ids: "torch.Tensor"):
+        """(tokens reutilizables, caché KV a recortar) del mejor prefijo; (0, None) si no llega a `min_tokens`"""
+        best_length, best_past = 0, None
+        for cached_ids, past in self._entries:
+            length = self._common_length(cached_ids, ids)
+            if length > best_length:
+                best_length, best_past = length, past
+        if best_length < self.min_tokens:
+            return 0, None
+        return best_length, best_past
+
+    def put(self, ids: "torch.Tensor", past_key_values):
+        self._entries.append((ids, past_key_values))
+        while len(self._entries) > self.max_entries:
+            self._entries.popleft()
+
+    def clear(self):
+        self._entries.clear()
+
+
+class HFGenerationServer:
+    """
+    Modelo HuggingFace cargado una sola vez y compartido por todos los chats
+
+    Un hilo trabajador toma peticiones de la cola y agrupa las que llegan
+    juntas (hasta `batch_size`, esperando como mucho `batch_wait_ms` desde la
+    primera) en un único `generate` con padding a la izquierda. Solo se
+    agrupan peticiones con la misma temperatura; el resto espera al siguiente
+    lote. El prompt más la respuesta nunca superan `huggingface_max_length`.
+
+    Los lotes de un solo prompt (el caso habitual en chats multiturno sin
+    concurrencia) reutilizan la caché KV del prefijo común con prompts
+    anteriores (`PrefixKVCache`); los lotes con padding no.
+    """
+
+    def __init__(
+        self,
+        model_id: str,
+        batch_size: int = 8,
+        batch_wait_ms: int = 20,
+        max_new_tokens: int = 512,
+        max_length: int = 2048,
+        prefix_cache_size: int = 2,
+        prefix_min_tokens: int = 64
+    ):
+        self.model_id = model_id
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait_ms / 1000
+        self.max_new_tokens = max_new_tokens
+        self.max_length = max_length
+        self.prefix_cache = PrefixKVCache(prefix_cache_size, prefix_min_tokens) if prefix_cache_size > 0 else None
+
+        self._queue: "queue.Queue[GenerationRequest]" = queue.Queue()
+        self._deferred: "deque[GenerationRequest]" = deque()
+        self._stopped = threading.Event()
+        self.batches = 0
+        self.requests = 0
+        self.prefix_hits = 0
+        self.prefix_tokens_reused = 0
+
+        self._load()
+        self._worker = threading.Thread(target=self._run, name=f"hf-server-{model_id}", daemon=True)
+        self._worker.start()
+
+    def _load(self):
+        device = resolve_device()
+        token = settings.huggingface_token if settings.huggingface_token else None
+
+        print(f"🔄 Cargando modelo HuggingFace (residente): {self.model_id}")
+        print(f"   Usando: {device}")
+
+        model_kwargs = {"trust_remote_code": True}
+        load_in_8bit = device == "cuda" and settings.huggingface_load_in_8bit
+        if load_in_8bit:
+            model_kwargs["load_in_8bit"] = True
+            model_kwargs["device_map"] = "auto"
+
+        # Padding a la izquierda: en modelos decoder-only la generación continúa
+        # al final de cada fila del lote
+        self.tokenizer = AutoTokenizer.from_pretrained(self.model_id, token=token, padding_side="left")
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+
+        self.model = AutoModelForCausalLM.from_pretrained(self.model_id, token=token, **model_kwargs)
+        if not load_in_8bit:
+            self.model = self.model.to(device)
+        self.model.eval()
+
+        print("✅ Modelo cargado")
+
+    # ==================== API ====================
+
+    def submit_request(self, prompt: str, temperature: float, stop: Optional[List[str]] = None) -> GenerationRequest:
+        """Encola un prompt con el plazo de la petición en curso (si lo hay)"""
+        if self._stopped.is_set():
+            raise RuntimeError(f"Servidor HuggingFace {self.model_id} detenido")
+        deadline = current_deadline()
+        request = GenerationRequest(
+            prompt=prompt,
+            temperature=temperature,
+            stop=list(stop or []),
+            expires_at=deadline.expires_at if deadline else None
+        )
+        self._queue.put(request)
+        return request
+
+    def submit(self, prompt: str, temperature: float, stop: Optional[List[str]] = None) -> Future:
+        """Encola un prompt; el Future se resuelve con el texto generado (sin el prompt)"""
+        return self.submit_request(prompt, temperature, stop).future
+
+    def generate(self, prompt: str, temperature: float, stop: Optional[List[str]] = None) -> str:
+        """Versión bloqueante de submit()"""
+        return self.submit(prompt, temperature, stop).result()
+
+    def stop(self):
+        self._stopped.set()
+        if self.prefix_cache is not None:
+            self.prefix_cache.clear()
+
+    def stats(self) -> Dict:
+        return {
+            "model": self.model_id,
+            "requests": self.requests,
+            "batches": self.batches,
+            "avg_batch_size": round(self.requests / self.batches, 2) if self.batches else 0,
+            "prefix_hits": self.prefix_hits,
+            "prefix_tokens_reused": self.prefix_tokens_reused,
+            "queued": self._queue.qsize() + len(self._deferred)
+        }
+
+    # ==================== TRABAJADOR ====================
+
+    def _next(self, timeout: Optional[float]) -> Optional[GenerationRequest]:
+        if self._deferred:
+            return self._deferred.popleft()
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def _collect_batch(self) -> List[GenerationRequest]:
+        first = self._next(timeout=0.5)
+        if first is None:
+            return []
+
+        batch = [first]
+        skipped = []
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            request = self._next(timeout=remaining)
+            if request is None:
+                break
+            if request.temperature == first.temperature:
+                batch.append(request)
+            else:
+                skipped.append(request)
+
+        # Las de otra temperatura van primero en el siguiente lote
+        self._deferred.extendleft(reversed(skipped))
+        return batch
+
+    def _run(self):
+        while not self._stopped.is_set():
+            batch = self._collect_batch()
+            if not batch:
+                continue
+            batch = [r for r in batch if r.future.set_running_or_notify_cancel()]
+            # Abandonadas mientras esperaban: no ocupar el modelo con ellas
+            for request in [r for r in batch if r.abandoned()]:
+                metrics.inc("cancel.provider.huggingface_queued")
+                request.future.set_exception(DeadlineExceeded("petición abandonada antes de generar"))
+            batch = [r for r in batch if not r.future.done()]
+            if not batch:
+                continue
+            try:
+                outputs = self._generate_batch(batch)
+                for request, text in zip(batch, outputs):
+                    request.future.set_result(apply_stop(text, request.stop))
+            except Exception as e:
+                print(f"❌ Error generando con {self.model_id}: {e}")
+                for request in batch:
+                    request.future.set_exception(e)
+
+    def _max_prompt_tokens(self) -> int:
+        # Dejar siempre sitio para al menos una parte de la respuesta
+        return max(1, self.max_length - min(self.max_new_tokens, self.max_length // 2))
+
+    def _generate_kwargs(self, batch: List[GenerationRequest], prompt_length: int) -> Dict[str, Any]:
+        temperature = batch[0].temperature
+        generate_kwargs = {
+            "max_new_tokens": max(1, min(self.max_new_tokens, self.max_length - prompt_length)),
+            "top_p": 0.95,
+            "repetition_penalty": 1.15,
+            "pad_token_id": self.tokenizer.pad_token_id,
+            # Cliente desconectado o plazo agotado: se devuelve lo generado hasta ahí
+            "stopping_criteria": StoppingCriteriaList([AbandonedCriteria(batch)])
+        }
+        if temperature > 0:
+            generate_kwargs.update(do_sample=True, temperature=temperature)
+        else:
+            generate_kwargs.update(do_sample=False)
+        return generate_kwargs
+
+    def _generate_batch(self, batch: List[GenerationRequest]) -> List[str]:
+        if len(batch) == 1 and self.prefix_cache is not None:
+            return [self._generate_single(batch[0])]
+
+        inputs = self.tokenizer(
+            [r.prompt for r in batch],
+            return_tensors="pt",
+            padding=True,
+            truncation=True,
+            max_length=self._max_prompt_tokens()
+        ).to(self.model.device)
+
+        prompt_length = inputs["input_ids"].shape[1]
+        generate_kwargs = self._generate_kwargs(batch, prompt_length)
+
+        with torch.no_grad():
+            output_ids = self.model.generate(**inputs, **generate_kwargs)
+
+        self.batches += 1
+        self.requests += len(batch)
+        return self.tokenizer.batch_decode(output_ids[:, prompt_length:], skip_special_tokens=True)
+
+    def _generate_single(self, request: GenerationRequest) -> str:
+        """Un solo prompt, partiendo de la caché KV del prefijo común con prompts anteriores"""
+        input_ids = self.tokenizer(
+            request.prompt,
+            return_tensors="pt",
+            truncation=True,
+            max_length=self._max_prompt_tokens()
+        )["input_ids"].to(self.model.device)
+        prompt_length = input_ids.shape[1]
+
+        # El último token del prompt lo procesa siempre generate()
+        reused, past = self.prefix_cache.match(input_ids[0])
+        reused = min(reused, prompt_length - 1)
+        generate_kwargs = self._generate_kwargs([request], prompt_length)
+
+        with torch.no_grad():
+            if past is not None and reused > 0:
+                past = crop_past(past, reused)
+                # Completar la caché hasta el penúltimo token: generate() solo
+                # procesa lo que no cubre la caché (el último token)
+                if reused < prompt_length - 1:
+                    outputs = self.model(
+                        input_ids=input_ids[:, reused:prompt_length - 1],
+                        past_key_values=past,
+                        use_cache=True
+                    )
+                    past = legacy_past(outputs.past_key_values)
+                generate_kwargs["past_key_values"] = past
+                self.prefix_hits += 1
+                self.prefix_tokens_reused += reused
+                metrics.inc("hf.prefix_cache.hits")
+                metrics.inc("hf.prefix_cache.tokens_reused", reused)
+            else:
+                reused = 0
+                metrics.inc("hf.prefix_cache.misses")
+
+            output = self.model.generate(
+                input_ids=input_ids,
+                attention_mask=torch.ones_like(input_ids),
+                return_dict_in_generate=True,
+                **generate_kwargs
+            )
+
+        # La caché devuelta cubre el prompt y la respuesta (salvo el último token)
+        past = getattr(output, "past_key_values", None)
+        if past is not None:
+            past = legacy_past(past)
+            cached_length = past[0][0].shape[2]
+            self.prefix_cache.put(output.sequences[0, :cached_length], past)
+
+        metrics.observe("hf.prefix_cache.prompt_tokens", prompt_length - reused)
+        self.batches += 1
+        self.requests += 1
+        return self.tokenizer.decode(output.sequences[0, prompt_length:], skip_special_tokens=True)
+
+
+# ==================== REGISTRO ====================
+
+_servers: Dict[str, HFGenerationServer] = {}
+_servers_lock = threading.Lock()
+
+
+def get_hf_server(model_id: Optional[str] = None) -> HFGenerationServer:
+    """Servidor residente del modelo (se carga la primera vez; bloqueante)"""
+    model_id = model_id or settings.huggingface_model
+    server = _servers.get(model_id)
+    if server is None:
+        with _servers_lock:
+            server = _servers.get(model_id)
+            if server is None:
+                server = HFGenerationServer(
+                    model_id,
+                    batch_size=settings.huggingface_batch_size,
+                    batch_wait_ms=settings.huggingface_batch_wait_ms,
+                    max_new_tokens=settings.huggingface_max_new_tokens,
+                    max_length=settings.huggingface_max_length,
+                    prefix_cache_size=settings.huggingface_prefix_cache_size,
+                    prefix_min_tokens=settings.huggingface_prefix_min_tokens
+                )
+                _servers[model_id] = server
+    return server
+
+
+def hf_server_stats() -> List[Dict]:
+    return [server.stats() for server in list(_servers.values())]
+
+
+class ResidentHuggingFaceLLM(LLM):
+    """
+    LLM de LangChain sobre el servidor residente
+
+    Varias instancias (una por agente) comparten el mismo modelo cargado y sus
+    peticiones se agrupan en lotes.
+    """
+
+    model_id: str
+    temperature: float = 0.3
+
+    @property
+    def _llm_type(self) -> str:
+        return "huggingface-resident"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model_id": self.model_id, "temperature": self.temperature}
+
+    def _call(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs
+    ) -> str:
+        return get_hf_server(self.model_id).generate(prompt, self.temperature, stop)
+
+    async def _acall(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs
+    ) -> str:
+        # El modelo ya está cargado: no hace falta un hilo para esperar el lote
+        request = get_hf_server(self.model_id).submit_request(prompt, self.temperature, stop)
+        try:
+            return await asyncio.wrap_future(request.future)
+        except asyncio.CancelledError:
+            # Si ya está generando, AbandonedCriteria lo detiene en el siguiente token
+            request.abort.set()
+            raise
@@ -2,18 +2,60 @@
 
 from langchain_openai import ChatOpenAI
 from langchain_community.llms import Ollama
-from langchain_community.llms import HuggingFacePipeline
 from langchain.llms.base import LLM
 from langchain_core.language_models.chat_models import BaseChatModel
-from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
 from langchain_core.outputs import ChatResult, ChatGeneration
-from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline
-import torch
-from typing import Literal, Optional, Any, List
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun
+from typing import Literal, Optional, Any, Dict, List, Iterator, AsyncIterator
+import json
+import uuid
 import httpx
-from groq import Groq
+import openai
+from groq import Groq, AsyncGroq
 
 from ..config import settings
+from ..core.deadline import check_deadline, remaining_timeout
+from ..core.http import get_http_client, get_async_http_client
+from .hf_server import ResidentHuggingFaceLLM, get_hf_server
+from .llm_router import RoutedBackend, RoutingChatModel, llm_router, parse_backends
+from .provider_status import provider_status
+
+GROQ_BASE_URL = "https://api.groq.com"
+OPENAI_BASE_URL = "https://api.openai.com/v1"
+
+# Prefijos de modelos con tool calling nativo fiable, por proveedor
+NATIVE_TOOL_CALLING = {
+    "openai": ("gpt-3.5-turbo", "gpt-4", "gpt-5", "o1", "o3", "o4"),
+    "groq": ("llama3-", "llama-3", "llama-4", "meta-llama/llama-4", "mixtral", "gemma2", "qwen", "openai/gpt-oss", "moonshotai/kimi"),
+    "ollama": (
+        "llama3.1", "llama3.2", "llama3.3", "llama4", "qwen2", "qwen2.5", "qwen3", "mistral",
+        "mixtral", "command-r", "firefunction", "hermes3", "granite3", "smollm2"
+    ),
+}
+
+
+def openai_tool_calls(message: AIMessage) -> List[dict]:
+    """Llamadas a herramientas de un AIMessage en formato OpenAI (additional_kwargs)"""
+    return list(message.additional_kwargs.get("tool_calls") or [])
+
+
+def tool_call_message(content: str, tool_calls: List[dict]) -> AIMessage:
+    """AIMessage con las llamadas en el formato que entiende OpenAIToolsAgentOutputParser"""
+    if not tool_calls:
+        return AIMessage(content=content or "")
+    return AIMessage(content=content or "", additional_kwargs={"tool_calls": tool_calls})
+
+
+def accumulate_tool_call_deltas(calls: Dict[int, dict], deltas) -> None:
+    """Junta los fragmentos de tool_calls de una respuesta en streaming (formato OpenAI)"""
+    for delta in deltas or []:
+        call = calls.setdefault(delta.index, {"id": "", "type": "function", "function": {"name": "", "arguments": ""}})
+        if delta.id:
+            call["id"] = delta.id
+        if delta.function is not None:
+            call["function"]["name"] += delta.function.name or ""
+            call["function"]["arguments"] += delta.function.arguments or ""
 
 
 class GroqChat(BaseChatModel):
@@ -23,79 +65,357 @@ class GroqChat(BaseChatModel):
     model: str = "llama-3.3-70b-versatile"
     temperature: float = 0.3
     groq_api_key: str = ""
+    streaming: bool = False
     
     class Config:
         arbitrary_types_allowed = True
     
-    def __init__(self, model: str, temperature: float = 0.3, groq_api_key: str = "", **kwargs):
+    def __init__(self, model: str, temperature: float = 0.3, groq_api_key: str = "", streaming: bool = False, **kwargs):
         """Inicializa el modelo Groq"""
         super().__init__(
             model=model,
             temperature=temperature,
             groq_api_key=groq_api_key,
+            streaming=streaming,
             **kwargs
         )
-        # Cliente Groq (no es un campo de Pydantic)
-        object.__setattr__(self, '_client', Groq(api_key=groq_api_key))
+        # Cliente Groq (no es un campo de Pydantic) sobre la conexión compartida
+        object.__setattr__(self, '_client', Groq(
+            api_key=groq_api_key,
+            http_client=get_http_client(GROQ_BASE_URL)
+        ))
     
     @property
     def client(self):
         """Acceso al cliente Groq"""
         return self._client
     
-    def _generate(self, messages: List[Any], stop: Optional[List[str]] = None, **kwargs) -> ChatResult:
-        """Genera respuesta usando Groq"""
+    @property
+    def async_client(self):
+        """Cliente Groq asíncrono (se crea en el primer uso)"""
+        client = getattr(self, '_async_client', None)
+        if client is None:
+            client = AsyncGroq(
+                api_key=self.groq_api_key,
+                http_client=get_async_http_client(GROQ_BASE_URL)
+            )
+            object.__setattr__(self, '_async_client', client)
+        return client
+
+    @staticmethod
+    def _to_groq_messages(messages: List[Any]) -> List[dict]:
         groq_messages = []
         for msg in messages:
             if isinstance(msg, HumanMessage):
                 groq_messages.append({"role": "user", "content": msg.content})
             elif isinstance(msg, AIMessage):
-                groq_messages.append({"role": "assistant", "content": msg.content})
+                entry = {"role": "assistant", "content": msg.content}
+                if openai_tool_calls(msg):
+                    entry["tool_calls"] = openai_tool_calls(msg)
+                groq_messages.append(entry)
+            elif isinstance(msg, ToolMessage):
+                groq_messages.append({"role": "tool", "tool_call_id": msg.tool_call_id, "content": msg.content})
             elif isinstance(msg, SystemMessage):
                 groq_messages.append({"role": "system", "content": msg.content})
-        
+        return groq_messages
+
+    def _request(self, messages: List[Any], **kwargs) -> dict:
+        """Parámetros de chat.completions.create (con `tools` si el agente las enlazó)"""
+        request = {
+            "model": self.model,
+            "messages": self._to_groq_messages(messages),
+            "temperature": self.temperature,
+            "max_tokens": kwargs.get('max_tokens', 2048),
+            "top_p": 1.0
+        }
+        if kwargs.get("tools"):
+            request["tools"] = kwargs["tools"]
+            request["tool_choice"] = kwargs.get("tool_choice", "auto")
+        timeout = remaining_timeout(None)
+        if timeout is not None:
+            request["timeout"] = timeout
+        return request
+
+    @staticmethod
+    def _result(message) -> ChatResult:
+        tool_calls = [call.model_dump() for call in (message.tool_calls or [])]
+        return ChatResult(generations=[ChatGeneration(message=tool_call_message(message.content, tool_calls))])
+    
+    def _generate(self, messages: List[Any], stop: Optional[List[str]] = None, **kwargs) -> ChatResult:
+        """Genera respuesta usando Groq"""
         try:
-            completion = self.client.chat.completions.create(
-                model=self.model,
-                messages=groq_messages,
-                temperature=self.temperature,
-                max_tokens=kwargs.get('max_tokens', 2048),
-                top_p=1.0
-            )
-            
-            message = AIMessage(content=completion.choices[0].message.content)
-            generation = ChatGeneration(message=message)
-            
-            return ChatResult(generations=[generation])
+            completion = self.client.chat.completions.create(**self._request(messages, **kwargs))
+            return self._result(completion.choices[0].message)
             
         except Exception as e:
             print(f"❌ Error en Groq: {e}")
             raise
+
+    async def _agenerate(
+        self,
+        messages: List[Any],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs
+    ) -> ChatResult:
+        """
+        Genera respuesta usando el cliente asíncrono de Groq (no ocupa hilos)
+
+        Con `streaming` la respuesta se pide en trozos y cada token se notifica
+        a los callbacks (on_llm_new_token) para el endpoint de streaming.
+        """
+        try:
+            if self.streaming and run_manager:
+                stream = await self.async_client.chat.completions.create(**self._request(messages, **kwargs), stream=True)
+                parts = []
+                calls: Dict[int, dict] = {}
+                async for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta
+                    accumulate_tool_call_deltas(calls, delta.tool_calls)
+                    if delta.content:
+                        parts.append(delta.content)
+                        await run_manager.on_llm_new_token(delta.content)
+                message = tool_call_message("".join(parts), [calls[index] for index in sorted(calls)])
+                return ChatResult(generations=[ChatGeneration(message=message)])
+
+            completion = await self.async_client.chat.completions.create(**self._request(messages, **kwargs))
+            return self._result(completion.choices[0].message)
+
+        except Exception as e:
+            print(f"❌ Error en Groq: {e}")
+            raise
     
     @property
     def _llm_type(self) -> str:
         return "groq-chat"
 
 
+class PooledOllama(Ollama):
+    """
+    Ollama sobre los clientes HTTP compartidos
+
+    El wrapper de LangChain abre una conexión nueva en cada llamada
+    (requests/aiohttp); aquí las peticiones reutilizan las conexiones
+    keep-alive de `core.http`. El formato de la petición es el mismo, más
+    `keep_alive`: mientras el modelo sigue cargado Ollama reutiliza la caché
+    KV del prefijo común con la petición anterior (instrucciones, herramientas
+    y perfil del prompt del agente) y solo evalúa los tokens nuevos.
+    """
+
+    def _request_payload(self, payload: Any, stop: Optional[List[str]], **kwargs) -> dict:
+        if self.stop is not None and stop is not None:
+            raise ValueError("`stop` found in both the input and default params.")
+        elif self.stop is not None:
+            stop = self.stop
+        elif stop is None:
+            stop = []
+
+        params = self._default_params
+        if "model" in kwargs:
+            params["model"] = kwargs["model"]
+        if "options" in kwargs:
+            params["options"] = kwargs["options"]
+        else:
+            params["options"] = {**params["options"], "stop": stop, **kwargs}
+
+        if settings.ollama_keep_alive:
+            params["keep_alive"] = settings.ollama_keep_alive
+
+        if payload.get("messages"):
+            return {"messages": payload.get("messages", []), **params}
+        return {"prompt": payload.get("prompt"), "images": payload.get("images", []), **params}
+
+    @staticmethod
+    def _raise_for_status(status_code: int, body: bytes, api_url: str):
+        if status_code == 200:
+            return
+        if status_code == 404:
+            raise ValueError(f"Ollama: endpoint no encontrado ({api_url}). ¿Está descargado el modelo?")
+        try:
+            detail = json.loads(body).get("error")
+        except Exception:
+            detail = body.decode("utf-8", errors="replace")
+        raise ValueError(f"Ollama call failed with status code {status_code}. Details: {detail}")
+
+    def _create_stream(
+        self,
+        api_url: str,
+        payload: Any,
+        stop: Optional[List[str]] = None,
+        **kwargs
+    ) -> Iterator[str]:
+        request_payload = self._request_payload(payload, stop, **kwargs)
+        client = get_http_client(self.base_url)
+        try:
+            with client.stream("POST", api_url, json=request_payload, timeout=remaining_timeout(self.timeout) or client.timeout) as response:
+                if response.status_code != 200:
+                    self._raise_for_status(response.status_code, response.read(), api_url)
+                for line in response.iter_lines():
+                    # En un hilo no se puede cancelar: cortar al agotar el plazo
+                    check_deadline("ollama")
+                    if line:
+                        yield line
+        except httpx.TransportError as e:
+            provider_status.mark_transport_error("ollama", e)
+            raise
+
+    async def _acreate_stream(
+        self,
+        api_url: str,
+        payload: Any,
+        stop: Optional[List[str]] = None,
+        **kwargs
+    ) -> AsyncIterator[str]:
+        request_payload = self._request_payload(payload, stop, **kwargs)
+        client = get_async_http_client(self.base_url)
+        try:
+            async with client.stream("POST", api_url, json=request_payload, timeout=remaining_timeout(self.timeout) or client.timeout) as response:
+                if response.status_code != 200:
+                    self._raise_for_status(response.status_code, await response.aread(), api_url)
+                async for line in response.aiter_lines():
+                    if line:
+                        yield line
+        except httpx.TransportError as e:
+            provider_status.mark_transport_error("ollama", e)
+            raise
+
+
+class OllamaToolsChat(BaseChatModel):
+    """
+    Chat de Ollama (/api/chat) con tool calling nativo
+
+    Lo usa el agente en modo "tools": las herramientas van en el campo
+    `tools` de la petición y el modelo responde con `tool_calls`
+    estructurados en lugar de texto ReAct que haya que parsear. Usa las
+    mismas conexiones compartidas y opciones (num_ctx, keep_alive) que
+    PooledOllama.
+    """
+
+    model: str
+    base_url: str = "http://localhost:11434"
+    temperature: float = 0.3
+    num_ctx: int = 4096
+    timeout: Optional[float] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "ollama-tools-chat"
+
+    @staticmethod
+    def _to_ollama_messages(messages: List[Any]) -> List[dict]:
+        ollama_messages = []
+        for msg in messages:
+            if isinstance(msg, HumanMessage):
+                ollama_messages.append({"role": "user", "content": msg.content})
+            elif isinstance(msg, AIMessage):
+                entry = {"role": "assistant", "content": msg.content}
+                calls = openai_tool_calls(msg)
+                if calls:
+                    entry["tool_calls"] = [
+                        {"function": {"name": call["function"]["name"], "arguments": json.loads(call["function"]["arguments"] or "{}")}}
+                        for call in calls
+                    ]
+                ollama_messages.append(entry)
+            elif isinstance(msg, ToolMessage):
+                ollama_messages.append({"role": "tool", "content": msg.content})
+            elif isinstance(msg, SystemMessage):
+                ollama_messages.append({"role": "system", "content": msg.content})
+        return ollama_messages
+
+    def _payload(self, messages: List[Any], stop: Optional[List[str]], **kwargs) -> dict:
+        payload = {
+            "model": self.model,
+            "messages": self._to_ollama_messages(messages),
+            "stream": True,
+            "options": {"temperature": self.temperature, "num_ctx": self.num_ctx, "stop": stop or []}
+        }
+        if kwargs.get("tools"):
+            payload["tools"] = kwargs["tools"]
+        if settings.ollama_keep_alive:
+            payload["keep_alive"] = settings.ollama_keep_alive
+        return payload
+
+    @staticmethod
+    def _merge_chunk(parts: List[str], calls: List[dict], line: str) -> str:
+        """Acumula una línea del stream; devuelve el texto nuevo (para on_llm_new_token)"""
+        chunk = json.loads(line)
+        if chunk.get("error"):
+            raise ValueError(f"Ollama: {chunk['error']}")
+        message = chunk.get("message") or {}
+        for call in message.get("tool_calls") or []:
+            function = call.get("function", {})
+            arguments = function.get("arguments", {})
+            calls.append({
+                "id": f"call_{uuid.uuid4().hex[:12]}",
+                "type": "function",
+                "function": {
+                    "name": function.get("name", ""),
+                    "arguments": arguments if isinstance(arguments, str) else json.dumps(arguments, ensure_ascii=False)
+                }
+            })
+        token = message.get("content") or ""
+        if token:
+            parts.append(token)
+        return token
+
+    def _generate(self, messages: List[Any], stop: Optional[List[str]] = None, run_manager=None, **kwargs) -> ChatResult:
+        client = get_http_client(self.base_url)
+        parts: List[str] = []
+        calls: List[dict] = []
+        try:
+            with client.stream("POST", "/api/chat", json=self._payload(messages, stop, **kwargs), timeout=remaining_timeout(self.timeout) or client.timeout) as response:
+                if response.status_code != 200:
+                    PooledOllama._raise_for_status(response.status_code, response.read(), "/api/chat")
+                for line in response.iter_lines():
+                    check_deadline("ollama")
+                    if line:
+                        token = self._merge_chunk(parts, calls, line)
+                        if token and run_manager:
+                            run_manager.on_llm_new_token(token)
+        except httpx.TransportError as e:
+            provider_status.mark_transport_error("ollama", e)
+            raise
+        return ChatResult(generations=[ChatGeneration(message=tool_call_message("".join(parts), calls))])
+
+    async def _agenerate(
+        self,
+        messages: List[Any],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs
+    ) -> ChatResult:
+        client = get_async_http_client(self.base_url)
+        parts: List[str] = []
+        calls: List[dict] = []
+        try:
+            async with client.stream("POST", "/api/chat", json=self._payload(messages, stop, **kwargs), timeout=remaining_timeout(self.timeout) or client.timeout) as response:
+                if response.status_code != 200:
+                    PooledOllama._raise_for_status(response.status_code, await response.aread(), "/api/chat")
+                async for line in response.aiter_lines():
+                    if line:
+                        token = self._merge_chunk(parts, calls, line)
+                        if token and run_manager:
+                            await run_manager.on_llm_new_token(token)
+        except httpx.TransportError as e:
+            provider_status.mark_transport_error("ollama", e)
+            raise
+        return ChatResult(generations=[ChatGeneration(message=tool_call_message("".join(parts), calls))])
+
+
 class LLMFactory:
     """Factory para crear LLMs"""
     
     @staticmethod
     def get_ollama_models() -> list:
-        """Obtiene modelos reales disponibles en Ollama"""
-        try:
-            response = httpx.get(f"{settings.ollama_base_url}/api/tags", timeout=5)
-            if response.status_code == 200:
-                data = response.json()
-                return [model["name"] for model in data.get("models", [])]
-            return []
-        except Exception as e:
-            print(f"⚠️ Error obteniendo modelos de Ollama: {e}")
-            return []
+        """Modelos disponibles en Ollama (último sondeo cacheado)"""
+        state = provider_status.snapshot("ollama")
+        return list(state.models) if state.available else []
     
     @staticmethod
     def create_llm(
-        provider: Optional[Literal['openai', 'ollama', 'huggingface', 'groq']] = None,
+        provider: Optional[Literal['openai', 'ollama', 'huggingface', 'groq', 'router']] = None,
         model_name: Optional[str] = None,
         **kwargs
     ) -> LLM:
@@ -103,9 +423,11 @@ class LLMFactory:
         Crea instancia de LLM según proveedor
         
         Args:
-            provider: 'openai', 'ollama', 'huggingface', 'groq'
+            provider: 'openai', 'ollama', 'huggingface', 'groq' o 'router'
+                (reparto entre los backends de LLM_ROUTING_BACKENDS)
             model_name: Nombre del modelo específico
-            **kwargs: Parámetros adicionales
+            **kwargs: Parámetros adicionales (`tool_calling=True`: modelo de
+                chat con tool calling nativo cuando el proveedor lo necesita)
         """
         provider = provider or settings.llm_provider
         
@@ -119,6 +441,8 @@ class LLMFactory:
             return LLMFactory._create_huggingface(model_name, **kwargs)
         elif provider == 'groq':
             return LLMFactory._create_groq(model_name, **kwargs)
+        elif provider == 'router':
+            return LLMFactory._create_router(**kwargs)
         else:
             raise ValueError(f"Proveedor no soportado: {provider}")
     
@@ -128,9 +452,19 @@ class LLMFactory:
         if not settings.openai_api_key:
             raise ValueError("OPENAI_API_KEY no configurada")
         
+        # Clientes explícitos: ChatOpenAI pasaría el mismo http_client al cliente
+        # síncrono y al asíncrono, y cada uno necesita el suyo
         return ChatOpenAI(
             model=model_name or settings.openai_model,
             api_key=settings.openai_api_key,
+            client=openai.OpenAI(
+                api_key=settings.openai_api_key,
+                http_client=get_http_client(OPENAI_BASE_URL)
+            ).chat.completions,
+            async_client=openai.AsyncOpenAI(
+                api_key=settings.openai_api_key,
+                http_client=get_async_http_client(OPENAI_BASE_URL)
+            ).chat.completions,
             temperature=kwargs.get('temperature', settings.openai_temperature),
             streaming=True
         )
@@ -147,20 +481,26 @@ class LLMFactory:
         return GroqChat(
             model=model,
             temperature=kwargs.get('temperature', settings.groq_temperature),
-            groq_api_key=settings.groq_api_key
+            groq_api_key=settings.groq_api_key,
+            streaming=True
         )
     
     @staticmethod
-    def _create_ollama(model_name: Optional[str] = None, **kwargs) -> Ollama:
-        """Crea LLM de Ollama"""
-        try:
-            response = httpx.get(f"{settings.ollama_base_url}/api/tags", timeout=5)
-            if response.status_code != 200:
-                raise Exception("Ollama no responde")
-        except Exception as e:
-            raise ValueError(f"Ollama no está disponible en {settings.ollama_base_url}. Inicia Ollama primero. Error: {e}")
+    def _create_ollama(model_name: Optional[str] = None, **kwargs) -> LLM:
+        """Crea LLM de Ollama (chat con tool calling si `tool_calling=True`)"""
+        state = provider_status.status("ollama")
+        if not state.available:
+            raise ValueError(f"Ollama no está disponible en {settings.ollama_base_url}. Inicia Ollama primero. Error: {state.error}")
+        
+        if kwargs.get('tool_calling'):
+            return OllamaToolsChat(
+                model=model_name or settings.ollama_model,
+                base_url=settings.ollama_base_url,
+                temperature=kwargs.get('temperature', settings.ollama_temperature),
+                num_ctx=settings.ollama_num_ctx
+            )
         
-        return Ollama(
+        return PooledOllama(
             model=model_name or settings.ollama_model,
             base_url=settings.ollama_base_url,
             temperature=kwargs.get('temperature', settings.ollama_temperature),
@@ -168,58 +508,58 @@ class LLMFactory:
         )
     
     @staticmethod
-    def _create_huggingface(model_name: Optional[str] = None, **kwargs) -> HuggingFacePipeline:
-        """Crea LLM de HuggingFace local"""
+    def _create_huggingface(model_name: Optional[str] = None, **kwargs) -> ResidentHuggingFaceLLM:
+        """
+        Crea LLM de HuggingFace local
+
+        El modelo se carga una sola vez en un servidor residente (hf_server) que
+        agrupa en lotes los prompts concurrentes; aquí solo se crea el adaptador.
+        """
         model_id = model_name or settings.huggingface_model
-        
-        print(f"🔄 Cargando modelo HuggingFace: {model_id}")
-        print(f"   Dispositivo: {settings.huggingface_device}")
-        
-        if settings.huggingface_device == "auto":
-            if torch.cuda.is_available():
-                device = "cuda"
-            elif torch.backends.mps.is_available():
-                device = "mps"
-            else:
-                device = "cpu"
-        else:
-            device = settings.huggingface_device
-        
-        print(f"   Usando: {device}")
-        
-        model_kwargs = {"trust_remote_code": True}
-        
-        if device == "cuda" and settings.huggingface_load_in_8bit:
-            model_kwargs["load_in_8bit"] = True
-            model_kwargs["device_map"] = "auto"
-        
-        tokenizer = AutoTokenizer.from_pretrained(
-            model_id,
-            token=settings.huggingface_token if settings.huggingface_token else None
-        )
-        
-        model = AutoModelForCausalLM.from_pretrained(
-            model_id,
-            token=settings.huggingface_token if settings.huggingface_token else None,
-            **model_kwargs
-        )
-        
-        if not settings.huggingface_load_in_8bit:
-            model = model.to(device)
-        
-        pipe = pipeline(
-            "text-generation",
-            model=model,
-            tokenizer=tokenizer,
-            max_length=settings.huggingface_max_length,
-            temperature=kwargs.get('temperature', settings.huggingface_temperature),
-            top_p=0.95,
-            repetition_penalty=1.15
+
+        # Carga el modelo si aún no está residente (errores visibles al crear el agente)
+        get_hf_server(model_id)
+
+        return ResidentHuggingFaceLLM(
+            model_id=model_id,
+            temperature=kwargs.get('temperature', settings.huggingface_temperature)
         )
-        
-        print(f"✅ Modelo cargado")
-        
-        return HuggingFacePipeline(pipeline=pipe)
+    
+    @staticmethod
+    def _create_router(**kwargs) -> RoutingChatModel:
+        """
+        Crea el modelo que reparte las peticiones entre LLM_ROUTING_BACKENDS
+
+        Cada backend se crea como si se pidiera directamente (mismos
+        `kwargs`); los que no se pueden crear ahora (sin API key, Ollama
+        caído) se omiten.
+        """
+        backends = []
+        for provider, model, weight in parse_backends(settings.llm_routing_backends):
+            try:
+                llm = LLMFactory.create_llm(provider, model, **kwargs)
+            except Exception as e:
+                print(f"⚠️ Backend {provider}/{model} omitido del enrutado: {e}")
+                continue
+            backends.append(RoutedBackend(provider, model, weight, llm, llm_router.health(provider, model)))
+        if not backends:
+            raise ValueError("Ningún backend de LLM_ROUTING_BACKENDS está disponible")
+        print(f"✅ Enrutado entre {len(backends)} backends: {', '.join(backend.health.key for backend in backends)}")
+        return RoutingChatModel(backends)
+    
+    @staticmethod
+    def supports_tool_calling(provider: str, model_name: Optional[str] = None) -> bool:
+        """
+        Si el proveedor/modelo tiene tool calling nativo (lista NATIVE_TOOL_CALLING)
+
+        Con 'router' solo si lo tienen todos los backends: cualquiera puede
+        acabar respondiendo.
+        """
+        if provider == 'router':
+            backends = parse_backends(settings.llm_routing_backends)
+            return bool(backends) and all(LLMFactory.supports_tool_calling(p, m) for p, m, _ in backends)
+        model = (model_name or getattr(settings, f"{provider}_model", "") or "").lower()
+        return model.startswith(NATIVE_TOOL_CALLING.get(provider, ()))
     
     @staticmethod
     def get_available_models() -> dict:
@@ -234,23 +574,10 @@ class LLMFactory:
         ollama_models = LLMFactory.get_ollama_models()
         if ollama_models:
             models["ollama"] = ollama_models
-            print(f"✅ Modelos de Ollama detectados: {len(ollama_models)}")
         
         return models
     
     @staticmethod
     def validate_provider(provider: str) -> bool:
-        """Valida si el proveedor está disponible"""
-        if provider == "ollama":
-            try:
-                response = httpx.get(f"{settings.ollama_base_url}/api/tags", timeout=5)
-                return response.status_code == 200
-            except:
-                return False
-        elif provider == "huggingface":
-            return True
-        elif provider == "openai":
-            return bool(settings.openai_api_key)
-        elif provider == "groq":
-            return bool(settings.groq_api_key)
-        return False
\ No newline at end of file
+        """Valida si el proveedor está disponible (estado cacheado, no bloquea)"""
+        return provider_status.snapshot(provider).available
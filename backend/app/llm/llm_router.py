@@ -0,0 +1,455 @@
+"""Reparto de peticiones entre varios proveedores/modelos: el más rápido sano, con failover y hedging"""
+
+import asyncio
+import re
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import httpx
+import openai
+import groq
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.language_models.llms import BaseLLM
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from ..config import settings
+from ..core.deadline import DeadlineExceeded
+from ..core.metrics import Distribution, metrics
+from .provider_status import provider_status
+
+OLLAMA_STATUS = re.compile(r"status code (\d{3})")
+
+# Mínimo de respuestas en la ventana antes de juzgar la tasa de errores
+MIN_OUTCOMES = 4
+
+
+def parse_backends(specs: List[str]) -> List[Tuple[str, str, float]]:
+    """
+    "proveedor/modelo@peso" → (proveedor, modelo, peso)
+
+    El modelo puede llevar "/" y ":" ("groq/meta-llama/llama-4-scout",
+    "ollama/llama3.1:8b"); el peso es opcional (1 por defecto).
+    """
+    backends = []
+    for spec in specs:
+        spec, _, weight = spec.strip().partition("@")
+        provider, _, model = spec.partition("/")
+        if provider:
+            backends.append((provider, model or getattr(settings, f"{provider}_model", ""), float(weight or 1.0)))
+    return backends
+
+
+def failover_reason(error: BaseException) -> Optional[str]:
+    """
+    Motivo para repetir la petición en otro backend, o None si el error no
+    depende del backend (petición inválida, plazo de la petición agotado)
+    """
+    if isinstance(error, DeadlineExceeded):
+        return None
+    status = getattr(error, "status_code", None)
+    if status is None and isinstance(error, ValueError):
+        # PooledOllama / OllamaToolsChat: "... failed with status code 503 ..."
+        match = OLLAMA_STATUS.search(str(error))
+        status = int(match.group(1)) if match else None
+    if status == 429:
+        return "429"
+    if status is not None and status >= 500:
+        return "5xx"
+    if isinstance(error, (httpx.TransportError, openai.APIConnectionError, groq.APIConnectionError, ConnectionError)):
+        return "connection"
+    return None
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Cabecera Retry-After de un 429 de OpenAI/Groq, si la hay"""
+    response = getattr(error, "response", None)
+    value = getattr(response, "headers", {}).get("retry-after") if response is not None else None
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+class BackendHealth:
+    """Latencia y errores recientes de un proveedor/modelo"""
+
+    def __init__(self, key: str, provider: str):
+        self.key = key
+        self.provider = provider
+        # Media móvil del tiempo hasta el primer token (o la respuesta completa)
+        self.latency_seconds: Optional[float] = None
+        self.first_token_ms = Distribution()
+        self.outcomes: Deque[bool] = deque(maxlen=max(MIN_OUTCOMES, settings.llm_routing_error_window))
+        self.cooldown_until = 0.0
+        self.launched = 0
+        self.wins = 0
+        self.errors: Dict[str, int] = {}
+
+    @property
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    @property
+    def healthy(self) -> bool:
+        if time.monotonic() < self.cooldown_until:
+            return False
+        return provider_status.snapshot(self.provider).circuit != "open"
+
+    def score(self, weight: float) -> float:
+        """Menor es mejor: latencia penalizada por la tasa de errores y dividida por el peso"""
+        if self.latency_seconds is None:
+            return 0.0
+        return self.latency_seconds * (1 + 2 * self.error_rate) / max(weight, 0.01)
+
+    def hedge_delay(self) -> float:
+        """Espera sin primer token antes de lanzar la petición a otro backend"""
+        delay = settings.llm_routing_hedge_seconds
+        if self.first_token_ms.count >= 20:
+            # Lo que tarda este backend en el 95% de los casos
+            delay = max(delay, self.first_token_ms.to_dict()["p95"] / 1000)
+        return delay
+
+    def stats(self) -> Dict:
+        return {
+            "healthy": self.healthy,
+            "cooldown_seconds": round(max(0.0, self.cooldown_until - time.monotonic()), 1),
+            "latency_seconds": round(self.latency_seconds, 3) if self.latency_seconds is not None else None,
+            "error_rate": round(self.error_rate, 3),
+            "launched": self.launched,
+            "wins": self.wins,
+            "errors": dict(self.errors),
+            "first_token_ms": self.first_token_ms.to_dict()
+        }
+
+
+class LLMRouter:
+    """
+    Salud de los backends del pool, compartida por todos los RoutingChatModel
+
+    Ordena los backends para cada petición (sanos primero, por latencia
+    reciente) y registra el resultado de cada intento. Un backend deja de
+    recibir tráfico durante `llm_routing_cooldown_seconds` (o lo que pida su
+    Retry-After) tras un 429, o cuando su tasa de errores en la ventana
+    supera `llm_routing_max_error_rate`; con el circuito de provider_status
+    abierto también se evita.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._health: Dict[str, BackendHealth] = {}
+        self.requests = 0
+        self.failovers = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.exhausted = 0
+
+    def health(self, provider: str, model: str) -> BackendHealth:
+        key = f"{provider}/{model}"
+        with self._lock:
+            health = self._health.get(key)
+            if health is None:
+                health = self._health[key] = BackendHealth(key, provider)
+            return health
+
+    def order(self, backends: List["RoutedBackend"]) -> List["RoutedBackend"]:
+        """Sanos por puntuación (los aún sin medir primero, en el orden configurado); después el resto"""
+        with self._lock:
+            self.requests += 1
+        metrics.inc("router.requests")
+        ranked = sorted(enumerate(backends), key=lambda item: (item[1].health.score(item[1].weight), item[0]))
+        healthy = [backend for _, backend in ranked if backend.health.healthy]
+        return healthy + [backend for _, backend in ranked if backend not in healthy]
+
+    def launched(self, backend: "RoutedBackend", reason: str):
+        """Decisión de enrutado: primario, hedge o failover"""
+        with self._lock:
+            backend.health.launched += 1
+            if reason == "hedge":
+                self.hedges += 1
+            elif reason == "failover":
+                self.failovers += 1
+        metrics.inc(f"router.launched.{backend.health.key}")
+        if reason != "primary":
+            metrics.inc(f"router.{reason}s")
+            print(f"🔀 {reason} → {backend.health.key}")
+
+    def succeeded(self, backend: "RoutedBackend", latency_seconds: float, hedged: bool):
+        health = backend.health
+        with self._lock:
+            health.wins += 1
+            health.outcomes.append(True)
+            health.first_token_ms.observe(latency_seconds * 1000)
+            health.latency_seconds = latency_seconds if health.latency_seconds is None else (
+                0.8 * health.latency_seconds + 0.2 * latency_seconds
+            )
+            if hedged:
+                self.hedge_wins += 1
+        metrics.inc(f"router.wins.{health.key}")
+        metrics.observe(f"router.first_token_ms.{health.key}", latency_seconds * 1000)
+        if hedged:
+            metrics.inc("router.hedge_wins")
+
+    def failed(self, backend: "RoutedBackend", reason: str, error: BaseException):
+        health = backend.health
+        with self._lock:
+            health.errors[reason] = health.errors.get(reason, 0) + 1
+            health.outcomes.append(False)
+            cooldown = 0.0
+            if reason == "429":
+                cooldown = retry_after(error) or settings.llm_routing_cooldown_seconds
+            elif len(health.outcomes) >= MIN_OUTCOMES and health.error_rate > settings.llm_routing_max_error_rate:
+                cooldown = settings.llm_routing_cooldown_seconds
+            if cooldown:
+                health.cooldown_until = time.monotonic() + cooldown
+        metrics.inc(f"router.errors.{health.key}.{reason}")
+        print(f"⚠️ {health.key} falló ({reason}): {error}")
+        if cooldown:
+            print(f"🧊 {health.key} sin tráfico durante {cooldown:.0f}s")
+
+    def gave_up(self):
+        with self._lock:
+            self.exhausted += 1
+        metrics.inc("router.exhausted")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "failovers": self.failovers,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "exhausted": self.exhausted,
+                "backends": {key: health.stats() for key, health in self._health.items()}
+            }
+
+
+@dataclass(eq=False)
+class RoutedBackend:
+    """Un LLM ya creado del pool, con su peso y su salud compartida"""
+    provider: str
+    model: str
+    weight: float
+    llm: Any
+    health: BackendHealth
+
+
+class _Race:
+    """Intentos simultáneos de una petición: gana el primero que emite un token (o termina)"""
+
+    def __init__(self):
+        self.winner: Optional["_Attempt"] = None
+        self.tasks: Dict[asyncio.Task, "_Attempt"] = {}
+
+    def claim(self, attempt: "_Attempt") -> bool:
+        if self.winner is None:
+            self.winner = attempt
+            # Los demás intentos ya no sirven: dejar de generar
+            for task, other in self.tasks.items():
+                if other is not attempt:
+                    task.cancel()
+        return self.winner is attempt
+
+
+class _Attempt:
+    """
+    Un intento contra un backend
+
+    Se pasa al backend en lugar del run_manager de la petición: solo los
+    tokens del intento ganador llegan a los callbacks (streaming).
+    """
+
+    def __init__(self, backend: RoutedBackend, reason: str, run_manager: Any, race: Optional[_Race] = None):
+        self.backend = backend
+        self.reason = reason
+        self.run_manager = run_manager
+        self.race = race
+        self.started = time.monotonic()
+        self.first_token_at: Optional[float] = None
+
+    def latency(self) -> float:
+        return (self.first_token_at or time.monotonic()) - self.started
+
+    def __getattr__(self, name: str) -> Any:
+        # El resto de callbacks (on_llm_end, get_child...) van al run_manager real
+        return getattr(self.__dict__.get("run_manager"), name)
+
+    def _forward(self) -> bool:
+        if self.first_token_at is None:
+            self.first_token_at = time.monotonic()
+        return self.race is None or self.race.claim(self)
+
+    def on_llm_new_token(self, token: str, **kwargs) -> Any:
+        if self._forward() and self.run_manager is not None:
+            return self.run_manager.on_llm_new_token(token, **kwargs)
+        return _ignored() if self.race is not None else None
+
+
+async def _ignored():
+    return None
+
+
+def _consume(task: asyncio.Task):
+    """Recoge el resultado de un intento abandonado (evita avisos de excepción no recuperada)"""
+    if not task.cancelled():
+        task.exception()
+
+
+class RoutingChatModel(BaseChatModel):
+    """
+    Modelo de chat que reparte cada petición entre varios backends
+
+    - Cada petición va al backend sano más rápido (`llm_router.order`)
+    - Ante 429, 5xx o errores de conexión se repite en el siguiente
+      (failover), salvo que ya se hayan emitido tokens de la respuesta
+    - Async: si el backend no da el primer token en `hedge_delay` se lanza la
+      misma petición al siguiente y se queda la primera que empiece a
+      responder; la otra se cancela
+    - Sync (hilos del pool, que no se pueden cancelar): solo failover
+
+    Los backends se crean con LLMFactory, así que las herramientas enlazadas
+    (`bind(tools=...)`) y el plazo de la petición llegan a cada uno igual que
+    sin enrutado. Los LLM de texto (PooledOllama, HuggingFace) reciben el
+    prompt como texto.
+    """
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def __init__(self, backends: List[RoutedBackend], **kwargs):
+        super().__init__(**kwargs)
+        object.__setattr__(self, '_backends', list(backends))
+
+    @property
+    def backends(self) -> List[RoutedBackend]:
+        return self._backends
+
+    @property
+    def _llm_type(self) -> str:
+        return "routing-chat"
+
+    # ==================== LLAMADA A UN BACKEND ====================
+
+    @staticmethod
+    def _prompt(messages: List[Any]) -> str:
+        return "\n".join(str(message.content) for message in messages)
+
+    @staticmethod
+    def _to_chat_result(result) -> ChatResult:
+        if isinstance(result, ChatResult):
+            return result
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=result.generations[0][0].text))])
+
+    def _call_backend(self, attempt: _Attempt, messages: List[Any], stop: Optional[List[str]], **kwargs) -> ChatResult:
+        llm = attempt.backend.llm
+        if isinstance(llm, BaseLLM):
+            return self._to_chat_result(llm._generate([self._prompt(messages)], stop=stop, run_manager=attempt, **kwargs))
+        return llm._generate(messages, stop=stop, run_manager=attempt, **kwargs)
+
+    async def _acall_backend(self, attempt: _Attempt, messages: List[Any], stop: Optional[List[str]], **kwargs) -> ChatResult:
+        llm = attempt.backend.llm
+        if isinstance(llm, BaseLLM):
+            result = await llm._agenerate([self._prompt(messages)], stop=stop, run_manager=attempt, **kwargs)
+            return self._to_chat_result(result)
+        return await llm._agenerate(messages, stop=stop, run_manager=attempt, **kwargs)
+
+    # ==================== ENRUTADO ====================
+
+    def _generate(self, messages: List[Any], stop: Optional[List[str]] = None, run_manager=None, **kwargs) -> ChatResult:
+        """Backends en orden hasta que uno responda (sin hedging)"""
+        error: Optional[BaseException] = None
+        for index, backend in enumerate(llm_router.order(self._backends)):
+            attempt = _Attempt(backend, "primary" if index == 0 else "failover", run_manager)
+            llm_router.launched(backend, attempt.reason)
+            try:
+                result = self._call_backend(attempt, messages, stop, **kwargs)
+            except Exception as e:
+                reason = failover_reason(e)
+                if reason is None:
+                    raise
+                llm_router.failed(backend, reason, e)
+                if attempt.first_token_at is not None:
+                    raise
+                error = e
+                continue
+            llm_router.succeeded(backend, attempt.latency(), hedged=False)
+            return result
+        llm_router.gave_up()
+        raise error or ValueError("Ningún backend configurado en LLM_ROUTING_BACKENDS")
+
+    async def _agenerate(self, messages: List[Any], stop: Optional[List[str]] = None, run_manager=None, **kwargs) -> ChatResult:
+        """
+        Primario, hedge si tarda en empezar y failover si falla
+
+        Como mucho un hedge por petición; un failover puede sumarse después
+        si el intento que quedaba también falla.
+        """
+        candidates = iter(llm_router.order(self._backends))
+        race = _Race()
+        hedged = False
+        error: Optional[BaseException] = None
+
+        def launch(reason: str) -> bool:
+            backend = next(candidates, None)
+            if backend is None:
+                return False
+            attempt = _Attempt(backend, reason, run_manager, race)
+            task = asyncio.ensure_future(self._acall_backend(attempt, messages, stop, **kwargs))
+            race.tasks[task] = attempt
+            llm_router.launched(backend, reason)
+            return True
+
+        if not launch("primary"):
+            raise ValueError("Ningún backend configurado en LLM_ROUTING_BACKENDS")
+
+        try:
+            while race.tasks:
+                timeout = None
+                if not hedged and race.winner is None and len(race.tasks) == 1 and settings.llm_routing_hedge_seconds > 0:
+                    attempt = next(iter(race.tasks.values()))
+                    timeout = max(0.0, attempt.started + attempt.backend.health.hedge_delay() - time.monotonic())
+
+                done, _ = await asyncio.wait(set(race.tasks), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Sin primer token a tiempo: la misma petición al siguiente backend
+                    hedged = True
+                    if race.winner is None:
+                        launch("hedge")
+                    continue
+
+                for task in done:
+                    attempt = race.tasks.pop(task)
+                    if task.cancelled():
+                        continue
+                    e = task.exception()
+                    if e is None:
+                        if race.claim(attempt):
+                            llm_router.succeeded(attempt.backend, attempt.latency(), hedged=attempt.reason == "hedge")
+                            return task.result()
+                        continue
+                    reason = failover_reason(e)
+                    if reason is None or race.winner is attempt:
+                        # Error propio de la petición, o la respuesta ya se estaba emitiendo
+                        if reason is not None:
+                            llm_router.failed(attempt.backend, reason, e)
+                        raise e
+                    llm_router.failed(attempt.backend, reason, e)
+                    error = e
+                    if not race.tasks and not launch("failover"):
+                        llm_router.gave_up()
+                        raise e
+            raise error or ValueError("Ningún backend respondió")
+        finally:
+            # Plazo agotado, cliente desconectado o ya hay ganador: cortar el resto
+            for task in race.tasks:
+                task.cancel()
+                task.add_done_callback(_consume)
+
+
+# Instancia global
+llm_router = LLMRouter()
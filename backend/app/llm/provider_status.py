@@ -0,0 +1,224 @@
+"""Estado de los proveedores de LLM (disponibilidad y modelos) con caché y circuit breaker"""
+
+import asyncio
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from ..config import settings
+from ..core.http import get_http_client
+
+PROVIDERS = ["ollama", "groq", "openai", "huggingface"]
+
+
+@dataclass
+class ProviderStatus:
+    """Último estado conocido de un proveedor"""
+    provider: str
+    available: bool = False
+    models: List[str] = field(default_factory=list)
+    error: Optional[str] = None
+    checked_at: Optional[float] = None  # time.monotonic() del último sondeo
+    latency_ms: Optional[float] = None
+    failures: int = 0  # fallos consecutivos
+    open_until: float = 0.0  # circuito abierto hasta este instante (monotonic)
+
+    @property
+    def circuit(self) -> str:
+        if self.open_until == 0.0:
+            return "closed"
+        return "open" if time.monotonic() < self.open_until else "half_open"
+
+    def to_dict(self) -> Dict:
+        return {
+            "provider": self.provider,
+            "available": self.available,
+            "models": list(self.models),
+            "error": self.error,
+            "age_seconds": round(time.monotonic() - self.checked_at, 1) if self.checked_at else None,
+            "latency_ms": self.latency_ms,
+            "circuit": self.circuit
+        }
+
+
+class ProviderStatusService:
+    """
+    Caché del estado de cada proveedor
+
+    Los endpoints leen siempre del estado en memoria (`snapshot`) y nunca
+    esperan a la red: si el dato ha caducado (`ttl`) se lanza un sondeo en
+    segundo plano y se responde con el último conocido. Además:
+
+    - Un solo sondeo a la vez por proveedor; las demás peticiones esperan su
+      resultado en lugar de repetirlo
+    - Tras `failure_threshold` fallos seguidos el circuito se abre y durante
+      `open_seconds` no se vuelve a sondear (se responde "no disponible" al
+      instante); después se permite un sondeo de prueba
+    - `refresh_periodically` mantiene el estado al día sin depender del tráfico
+    """
+
+    def __init__(self, ttl: float = 30.0, failure_threshold: int = 3, open_seconds: float = 60.0):
+        self.ttl = ttl
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+
+        self._lock = threading.Lock()
+        self._states: Dict[str, ProviderStatus] = {p: ProviderStatus(provider=p) for p in PROVIDERS}
+        self._refreshing: Dict[str, threading.Event] = {}
+
+    # ==================== SONDEOS ====================
+
+    @staticmethod
+    def _probe(provider: str) -> Tuple[bool, List[str], Optional[str]]:
+        """Comprueba un proveedor: (disponible, modelos, error)"""
+        if provider == "ollama":
+            response = get_http_client(settings.ollama_base_url).get("/api/tags", timeout=5)
+            if response.status_code != 200:
+                return False, [], f"Ollama respondió {response.status_code}"
+            models = [model["name"] for model in response.json().get("models", [])]
+            return True, models or list(settings.available_ollama_models), None
+        if provider == "groq":
+            if not settings.groq_api_key:
+                return False, list(settings.available_groq_models), "GROQ_API_KEY no configurada"
+            return True, list(settings.available_groq_models), None
+        if provider == "openai":
+            if not settings.openai_api_key:
+                return False, list(settings.available_openai_models), "OPENAI_API_KEY no configurada"
+            return True, list(settings.available_openai_models), None
+        if provider == "huggingface":
+            return True, list(settings.available_huggingface_models), None
+        return False, [], f"Proveedor no soportado: {provider}"
+
+    def _is_stale(self, state: ProviderStatus) -> bool:
+        return state.checked_at is None or time.monotonic() - state.checked_at > self.ttl
+
+    def refresh(self, provider: str, force: bool = False) -> ProviderStatus:
+        """
+        Sondea el proveedor (bloqueante) y actualiza su estado
+
+        Si ya hay un sondeo en curso espera a ese. Con el circuito abierto no
+        sondea salvo `force`.
+        """
+        with self._lock:
+            state = self._states.setdefault(provider, ProviderStatus(provider=provider))
+            if not force and state.circuit == "open":
+                return state
+            pending = self._refreshing.get(provider)
+            if pending is None:
+                self._refreshing[provider] = threading.Event()
+
+        if pending is not None:
+            pending.wait()
+            return self._states[provider]
+
+        started = time.perf_counter()
+        try:
+            available, models, error = self._probe(provider)
+        except Exception as e:
+            available, models, error = False, [], str(e)
+        latency_ms = round((time.perf_counter() - started) * 1000, 1)
+
+        with self._lock:
+            state.checked_at = time.monotonic()
+            state.latency_ms = latency_ms
+            state.available = available
+            state.error = error
+            if models or available:
+                state.models = models
+            if available:
+                state.failures = 0
+                state.open_until = 0.0
+            else:
+                state.failures += 1
+                if state.failures >= self.failure_threshold:
+                    if state.circuit != "open":
+                        print(f"⚠️ Proveedor {provider} no disponible: circuito abierto {self.open_seconds:.0f}s ({error})")
+                    state.open_until = state.checked_at + self.open_seconds
+            self._refreshing.pop(provider).set()
+        return state
+
+    def _refresh_in_background(self, provider: str):
+        with self._lock:
+            if provider in self._refreshing:
+                return
+        threading.Thread(target=self.refresh, args=(provider,), name=f"provider-status-{provider}", daemon=True).start()
+
+    # ==================== LECTURA ====================
+
+    def snapshot(self, provider: str) -> ProviderStatus:
+        """Último estado conocido, sin esperar nunca a la red"""
+        state = self._states.get(provider)
+        if state is None:
+            return ProviderStatus(provider=provider, error=f"Proveedor no soportado: {provider}")
+        if self._is_stale(state) and state.circuit != "open":
+            self._refresh_in_background(provider)
+        return state
+
+    def status(self, provider: str) -> ProviderStatus:
+        """Estado vigente: sondea (bloqueante) solo si ha caducado o nunca se comprobó"""
+        state = self._states.get(provider)
+        if state is None or self._is_stale(state):
+            return self.refresh(provider)
+        return state
+
+    def is_available(self, provider: str) -> bool:
+        return self.status(provider).available
+
+    def mark_failure(self, provider: str, error: str):
+        """
+        Registra un fallo observado fuera del sondeo (p.ej. conexión rechazada al generar)
+
+        Un fallo aislado solo se cuenta: el proveedor sigue disponible hasta
+        `failure_threshold` fallos seguidos, y entonces se abre el circuito.
+        """
+        with self._lock:
+            state = self._states.setdefault(provider, ProviderStatus(provider=provider))
+            state.failures += 1
+            state.error = error
+            if state.failures >= self.failure_threshold:
+                state.checked_at = time.monotonic()
+                state.available = False
+                if state.circuit != "open":
+                    print(f"⚠️ Proveedor {provider} no disponible: circuito abierto {self.open_seconds:.0f}s ({error})")
+                state.open_until = state.checked_at + self.open_seconds
+
+    def mark_transport_error(self, provider: str, error: httpx.TransportError):
+        """
+        Fallo de red al generar; los timeouts de lectura o de espera por una
+        conexión del pool no cuentan: el proveedor respondió (o ni se llegó a
+        él) y solo se agotó el tiempo de la petición, p. ej. su plazo
+        """
+        if isinstance(error, (httpx.ReadTimeout, httpx.PoolTimeout)):
+            return
+        self.mark_failure(provider, str(error))
+
+    def stats(self) -> Dict[str, Dict]:
+        return {provider: self.snapshot(provider).to_dict() for provider in list(self._states)}
+
+    # ==================== SEGUNDO PLANO ====================
+
+    def refresh_all(self):
+        for provider in list(self._states):
+            self.refresh(provider)
+
+    async def refresh_periodically(self, interval: float):
+        """Tarea de fondo: sondea todos los proveedores cada `interval` segundos"""
+        from ..core.executor import run_blocking
+
+        while True:
+            try:
+                await run_blocking(self.refresh_all)
+            except Exception as e:
+                print(f"⚠️ Error refrescando estado de proveedores: {e}")
+            await asyncio.sleep(interval)
+
+
+# Instancia global
+provider_status = ProviderStatusService(
+    ttl=settings.provider_status_ttl,
+    failure_threshold=settings.provider_circuit_failures,
+    open_seconds=settings.provider_circuit_open_seconds
+)
@@ -0,0 +1,219 @@
+"""Caché semántica de respuestas del agente para preguntas repetidas"""
+
+import copy
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ..config import settings
+from ..core.metrics import metrics
+from ..rag.embedding_service import normalize_text
+
+
+def wearable_fingerprint(wearable_data: Optional[dict]) -> Dict:
+    """
+    Datos del wearable redondeados a lo que cambia una respuesta
+
+    Unos pasos más o un latido menos no deben invalidar la respuesta; un
+    cambio de tramo (miles de pasos, 5 bpm, media hora de sueño) sí.
+    """
+    if not wearable_data:
+        return {}
+
+    def bucket(key: str, size: float):
+        value = wearable_data.get(key)
+        return int(value // size) if isinstance(value, (int, float)) else None
+
+    return {
+        "steps": bucket("steps", 1000),
+        "heart_rate": bucket("heart_rate", 5),
+        "calories": bucket("calories", 250),
+        "sleep_hours": bucket("sleep_hours", 0.5),
+        "active_minutes": bucket("active_minutes", 15),
+        "mock": bool(wearable_data.get("mock_data"))
+    }
+
+
+def context_fingerprint(model_info: dict, profile: Optional[dict], wearable_data: Optional[dict]) -> str:
+    """Hash del contexto que condiciona la respuesta: modelo, perfil y tramos del wearable"""
+    payload = {
+        "provider": model_info.get("provider"),
+        "model": model_info.get("model"),
+        "profile": profile or {},
+        "wearable": wearable_fingerprint(wearable_data)
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+@dataclass
+class CacheTicket:
+    """Lo calculado en `lookup` que necesita `store` tras generar la respuesta"""
+    fingerprint: str
+    vector: np.ndarray
+    generation: int
+
+
+@dataclass
+class CacheEntry:
+    question: str
+    vector: np.ndarray  # normalizado (norma 1)
+    result: dict
+    created_at: float
+    generation: int
+
+
+class SemanticResponseCache:
+    """
+    Respuestas del agente indexadas por el embedding de la pregunta
+
+    Una pregunta nueva reutiliza una respuesta anterior si su embedding tiene
+    similitud coseno >= `threshold` con una pregunta ya respondida bajo el
+    mismo contexto (`context_fingerprint`). Además:
+
+    - `ttl`: segundos de validez de una respuesta
+    - `max_entries`: límite total; se expulsa la menos usada (LRU)
+    - `invalidate()`: descarta todo; se llama cuando cambia la base de
+      conocimiento o el perfil del usuario
+    - Solo preguntas sin historial: un seguimiento ("¿y para mujeres?")
+      depende de la conversación y no se cachea
+    """
+
+    def __init__(self, threshold: float = 0.93, ttl: float = 3600.0, max_entries: int = 1000):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[str, int], CacheEntry]" = OrderedDict()
+        self._by_context: Dict[str, List[Tuple[str, int]]] = {}
+        self._next_id = 0
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _embed(question: str) -> Optional[np.ndarray]:
+        from ..rag.vector_store import vector_store
+        if vector_store is None:
+            return None
+        vector = np.asarray(vector_store.embeddings.embed_query(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def _expired(self, entry: CacheEntry, now: float) -> bool:
+        return entry.generation != self._generation or now - entry.created_at > self.ttl
+
+    def _drop(self, key: Tuple[str, int]):
+        self._entries.pop(key, None)
+        keys = self._by_context.get(key[0])
+        if keys is not None:
+            try:
+                keys.remove(key)
+            except ValueError:
+                pass
+            if not keys:
+                del self._by_context[key[0]]
+
+    # ==================== API ====================
+
+    def lookup(self, question: str, fingerprint: str) -> Tuple[Optional[dict], Optional[CacheTicket]]:
+        """
+        Busca una respuesta para la pregunta (bloqueante: calcula el embedding)
+
+        Returns:
+            (resultado cacheado o None, ticket para guardar la respuesta con `store`)
+        """
+        started = time.perf_counter()
+        vector = self._embed(normalize_text(question).lower())
+        if vector is None:
+            return None, None
+
+        with self._lock:
+            ticket = CacheTicket(fingerprint=fingerprint, vector=vector, generation=self._generation)
+            now = time.monotonic()
+            best_key, best_score = None, -1.0
+            for key in list(self._by_context.get(fingerprint, [])):
+                entry = self._entries[key]
+                if self._expired(entry, now):
+                    self._drop(key)
+                    continue
+                score = float(np.dot(entry.vector, vector))
+                if score > best_score:
+                    best_key, best_score = key, score
+
+            if best_key is not None and best_score >= self.threshold:
+                self._entries.move_to_end(best_key)
+                entry = self._entries[best_key]
+                self.hits += 1
+                metrics.inc("response_cache.hits")
+                metrics.observe("response_cache.lookup_ms", (time.perf_counter() - started) * 1000)
+                result = copy.deepcopy(entry.result)
+                result.setdefault("model_info", {})["cached"] = True
+                result["model_info"]["cache_similarity"] = round(best_score, 4)
+                print(f"⚡ Respuesta desde caché semántica (similitud {best_score:.3f}): {question[:50]}")
+                return result, ticket
+
+            self.misses += 1
+        metrics.inc("response_cache.misses")
+        metrics.observe("response_cache.lookup_ms", (time.perf_counter() - started) * 1000)
+        return None, ticket
+
+    def store(self, question: str, ticket: Optional[CacheTicket], result: dict):
+        """Guarda una respuesta correcta (las de error no se cachean)"""
+        if ticket is None or not result.get("success"):
+            return
+        with self._lock:
+            # Si se invalidó mientras se generaba, la respuesta ya no vale
+            if ticket.generation != self._generation:
+                return
+            key = (ticket.fingerprint, self._next_id)
+            self._next_id += 1
+            self._entries[key] = CacheEntry(
+                question=question,
+                vector=ticket.vector,
+                result=copy.deepcopy(result),
+                created_at=time.monotonic(),
+                generation=self._generation
+            )
+            self._by_context.setdefault(ticket.fingerprint, []).append(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+            metrics.set("response_cache.entries", len(self._entries))
+
+    def invalidate(self, reason: str = ""):
+        """Descarta todas las respuestas"""
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._by_context.clear()
+            metrics.set("response_cache.entries", 0)
+        metrics.inc("response_cache.invalidations")
+        if reason:
+            print(f"♻️ Caché de respuestas invalidada ({reason})")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+                "threshold": self.threshold,
+                "ttl": self.ttl
+            }
+
+
+# Instancia global
+response_cache = SemanticResponseCache(
+    threshold=settings.response_cache_threshold,
+    ttl=settings.response_cache_ttl,
+    max_entries=settings.response_cache_max_entries
+)
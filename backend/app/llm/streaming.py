@@ -0,0 +1,143 @@
+"""Eventos de streaming del agente: tokens de la respuesta final y uso de herramientas"""
+
+import asyncio
+from typing import Any, Dict, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackHandler
+
+FINAL_ANSWER_MARKER = "Final Answer:"
+
+
+class FinalAnswerFilter:
+    """
+    Filtra los tokens de una llamada al LLM dentro del bucle ReAct
+
+    Solo deja pasar el texto posterior a "Final Answer:"; los Thought/Action
+    intermedios no llegan al usuario. Con `passthrough` (LLM directo, sin
+    agente) todos los tokens son respuesta.
+    """
+
+    def __init__(self, passthrough: bool = False):
+        self.passthrough = passthrough
+        self.reset()
+
+    def reset(self):
+        """Nueva llamada al LLM (nuevo paso del agente)"""
+        self._buffer = ""
+        self._in_answer = self.passthrough
+        self._strip = not self.passthrough
+
+    def feed(self, token: str) -> str:
+        if not self._in_answer:
+            self._buffer += token
+            index = self._buffer.find(FINAL_ANSWER_MARKER)
+            if index < 0:
+                return ""
+            self._in_answer = True
+            token = self._buffer[index + len(FINAL_ANSWER_MARKER):]
+            self._buffer = ""
+
+        # Quitar el espacio/salto de línea que sigue al marcador
+        if self._strip:
+            token = token.lstrip()
+            if not token:
+                return ""
+            self._strip = False
+
+        return token
+
+
+class AgentStreamHandler(AsyncCallbackHandler):
+    """
+    Convierte callbacks de LangChain en eventos (dict) encolados en `queue`
+
+    Además guarda lo que lleva hecho el agente (texto de la respuesta final,
+    herramientas y sus salidas) para poder devolver una respuesta parcial si
+    se agota el plazo. Sin `queue` solo se guarda.
+
+    Con `hold_turns` (agente con tool calling nativo) el texto de cada
+    llamada al LLM se retiene hasta que termina: si la llamada pide
+    herramientas era un preámbulo ("Voy a calcular tu IMC…") y se descarta;
+    si no, es la respuesta final y se emite.
+    """
+
+    def __init__(
+        self,
+        queue: Optional["asyncio.Queue[Dict[str, Any]]"] = None,
+        passthrough: bool = False,
+        hold_turns: bool = False
+    ):
+        self.queue = queue
+        self.answer = FinalAnswerFilter(passthrough=passthrough)
+        self.hold_turns = hold_turns
+        self.streamed = False
+        self.answer_parts: List[str] = []
+        self.tools_used: List[Dict[str, str]] = []
+        self.tool_outputs: List[str] = []
+
+    @property
+    def answer_streamed(self) -> bool:
+        """Si ya se emitió algún token de la respuesta final"""
+        return self.streamed
+
+    @property
+    def partial_answer(self) -> str:
+        """Texto de la respuesta final generado hasta ahora (llamada al LLM en curso)"""
+        return "".join(self.answer_parts)
+
+    async def _emit(self, event: Dict[str, Any]):
+        if self.queue is not None:
+            await self.queue.put(event)
+
+    async def on_llm_start(self, serialized, prompts, **kwargs):
+        self.answer.reset()
+        self.answer_parts = []
+
+    async def on_chat_model_start(self, serialized, messages, **kwargs):
+        self.answer.reset()
+        self.answer_parts = []
+
+    async def _emit_answer(self, text: str):
+        self.streamed = True
+        await self._emit({"type": "token", "content": text})
+
+    async def on_llm_new_token(self, token: str, **kwargs):
+        text = self.answer.feed(token)
+        if text:
+            self.answer_parts.append(text)
+            if not self.hold_turns:
+                await self._emit_answer(text)
+
+    @staticmethod
+    def _requests_tools(response) -> bool:
+        for generations in getattr(response, "generations", None) or []:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                if message is not None and (message.additional_kwargs.get("tool_calls") or getattr(message, "tool_calls", None)):
+                    return True
+        return False
+
+    async def on_llm_end(self, response, **kwargs):
+        if not self.hold_turns or not self.answer_parts:
+            return
+        if self._requests_tools(response):
+            # Preámbulo de una llamada a herramientas: no es respuesta
+            self.answer_parts = []
+            return
+        await self._emit_answer(self.partial_answer)
+
+    async def on_agent_action(self, action, **kwargs):
+        self.tools_used.append({"tool": action.tool, "input": str(action.tool_input)})
+        await self._emit({
+            "type": "tool_start",
+            "tool": action.tool,
+            "input": str(action.tool_input)
+        })
+
+    async def on_tool_end(self, output, **kwargs):
+        self.tool_outputs.append(str(output))
+        await self._emit({
+            "type": "tool_end",
+            "tool": kwargs.get("name"),
+            "output": str(output)[:500]
+        })
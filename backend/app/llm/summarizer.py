@@ -0,0 +1,187 @@
+"""Resumen incremental de conversaciones largas en Chat.summary (en segundo plano)"""
+
+import queue
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from ..config import settings
+from ..core.metrics import metrics
+from ..database.chat_db import ChatMemoryDB
+from ..database.models import Message
+
+SUMMARY_PROMPT = """Eres el módulo de memoria de CHATFIT AI, un asistente de fitness y salud.
+Actualiza el resumen de la conversación incorporando los mensajes nuevos.
+
+Conserva lo que el asistente necesitará más adelante: datos y objetivos del
+usuario, lesiones o condiciones, preferencias, cifras concretas (peso, pasos,
+calorías, ritmo cardíaco), recomendaciones dadas y compromisos acordados.
+Omite saludos y repeticiones. Escribe en español, en tercera persona
+("El usuario..."), con un máximo de {max_words} palabras.
+
+RESUMEN ANTERIOR:
+{previous}
+
+MENSAJES NUEVOS:
+{messages}
+
+RESUMEN ACTUALIZADO:"""
+
+
+class ConversationSummarizer:
+    """
+    Pliega los mensajes antiguos de cada chat en `Chat.summary`
+
+    Los últimos `keep_messages` mensajes se envían siempre literales. Cuando
+    un chat acumula `keep_messages + batch_messages` mensajes fuera del
+    resumen, un hilo trabajador resume los más antiguos junto con el resumen
+    anterior (una llamada a un modelo barato) y guarda hasta qué mensaje
+    llega (`Chat.summary_message_count`). El agente recibe resumen +
+    mensajes posteriores: el prompt no crece con la longitud del chat.
+    """
+
+    def __init__(
+        self,
+        keep_messages: int = 6,
+        batch_messages: int = 6,
+        max_words: int = 200,
+        provider: Optional[str] = None,
+        model_name: Optional[str] = None
+    ):
+        self.keep_messages = keep_messages
+        self.batch_messages = batch_messages
+        self.max_words = max_words
+        self.provider = provider
+        self.model_name = model_name
+
+        self._queue: "queue.Queue[str]" = queue.Queue()
+        self._pending: Set[str] = set()
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+        self._llm = None
+        self.runs = 0
+        self.errors = 0
+
+    # ==================== API ====================
+
+    def context(self, chat_id: str, fallback_history: List[dict]) -> Tuple[List[dict], Optional[str]]:
+        """
+        Historial para el agente (bloqueante: lee el chat)
+
+        Returns:
+            (mensajes posteriores al resumen, resumen); sin resumen, el
+            historial enviado por el cliente y None
+        """
+        chat = ChatMemoryDB.get_chat(chat_id)
+        if chat is None or not chat.summary:
+            return fallback_history, None
+        recent = [
+            {"role": message.role, "content": message.content}
+            for message in chat.messages[chat.summary_message_count:]
+        ]
+        return recent, chat.summary
+
+    def maybe_schedule(self, chat_id: str):
+        """Encola el chat si tiene suficientes mensajes sin resumir (bloqueante: lee el chat)"""
+        chat = ChatMemoryDB.get_chat(chat_id)
+        if chat is None:
+            return
+        if len(chat.messages) - chat.summary_message_count < self.keep_messages + self.batch_messages:
+            return
+        with self._lock:
+            if chat_id in self._pending:
+                return
+            self._pending.add(chat_id)
+            self._ensure_worker()
+        self._queue.put(chat_id)
+        metrics.inc("summarizer.scheduled")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            "pending": pending,
+            "runs": self.runs,
+            "errors": self.errors,
+            "keep_messages": self.keep_messages,
+            "batch_messages": self.batch_messages
+        }
+
+    # ==================== TRABAJADOR ====================
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name="chat-summarizer", daemon=True)
+            self._worker.start()
+
+    def _run(self):
+        while True:
+            chat_id = self._queue.get()
+            try:
+                self._summarize(chat_id)
+            except Exception as e:
+                self.errors += 1
+                metrics.inc("summarizer.errors")
+                print(f"⚠️ Error resumiendo chat {chat_id}: {e}")
+            finally:
+                with self._lock:
+                    self._pending.discard(chat_id)
+
+    def _get_llm(self):
+        if self._llm is None:
+            from .llm_factory import LLMFactory
+            self._llm = LLMFactory.create_llm(
+                provider=self.provider or settings.llm_provider,
+                model_name=self.model_name or None,
+                temperature=0.0
+            )
+        return self._llm
+
+    @staticmethod
+    def _format_messages(messages: List[Message]) -> str:
+        return "\n".join(
+            f"{'Usuario' if message.role == 'user' else 'Asistente'}: {message.content}"
+            for message in messages
+        )
+
+    def _summarize(self, chat_id: str):
+        chat = ChatMemoryDB.get_chat(chat_id)
+        if chat is None:
+            return
+        start = chat.summary_message_count
+        end = len(chat.messages) - self.keep_messages
+        if end - start < self.batch_messages:
+            return
+
+        started = time.perf_counter()
+        prompt = SUMMARY_PROMPT.format(
+            max_words=self.max_words,
+            previous=chat.summary or "(sin resumen)",
+            messages=self._format_messages(chat.messages[start:end])
+        )
+        response = self._get_llm().invoke(prompt)
+        summary = (response.content if hasattr(response, "content") else str(response)).strip()
+        if not summary:
+            raise ValueError("resumen vacío")
+
+        with ChatMemoryDB.lock_chat(chat_id):
+            current = ChatMemoryDB.get_chat(chat_id)
+            # Borrado, o el resumen cambió mientras se generaba: descartar
+            if current is None or current.summary_message_count != start or current.summary != chat.summary:
+                return
+            ChatMemoryDB.update_chat_summary(chat_id, summary, message_count=end)
+
+        self.runs += 1
+        metrics.inc("summarizer.messages_folded", end - start)
+        metrics.observe("summarizer.latency_ms", (time.perf_counter() - started) * 1000)
+        print(f"📝 Chat {chat_id} resumido: {end} mensajes en el resumen ({len(summary)} caracteres)")
+
+
+# Instancia global
+conversation_summarizer = ConversationSummarizer(
+    keep_messages=settings.chat_summary_keep_messages,
+    batch_messages=settings.chat_summary_batch_messages,
+    max_words=settings.chat_summary_max_words,
+    provider=settings.chat_summary_provider or None,
+    model_name=settings.chat_summary_model or None
+)
@@ -6,6 +6,7 @@ from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 import uvicorn
+import asyncio
 from datetime import datetime
 
 from .config import settings
@@ -31,6 +32,9 @@ app.add_middleware(
 # Incluir routers
 app.include_router(api_router, prefix="/api/v1")
 
+# Tareas de fondo iniciadas en startup
+_background_tasks = []
+
 # ============================================
 # ENDPOINTS RAÍZ
 # ============================================
@@ -47,7 +51,10 @@ async def root():
             "docs": "/docs",
             "redoc": "/redoc",
             "health": "/health",
+            "metrics": "/metrics",
             "chat": "/api/v1/chat",
+            "chat_stream": "/api/v1/chat/stream",
+            "chat_ws": "/api/v1/chat/ws",
             "wearable": "/api/v1/wearable",
             "models": "/api/v1/chat/models"
         },
@@ -62,8 +69,12 @@ async def root():
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    from .llm.llm_factory import LLMFactory
     from .iot.xiaomi_client import xiaomi_client
+    from .llm.agent_pool import agent_pool
+    from .llm.provider_status import provider_status
+    
+    # Estado cacheado del proveedor: responde sin sondear
+    llm_status = provider_status.snapshot(settings.llm_provider)
     
     # Verificar estado de componentes
     health_status = {
@@ -73,9 +84,12 @@ async def health_check():
             "api": "ok",
             "llm": {
                 "provider": settings.llm_provider,
-                "available": LLMFactory.validate_provider(settings.llm_provider),
-                "model": settings.ollama_model if settings.llm_provider == "ollama" else settings.huggingface_model
+                "available": llm_status.available,
+                "model": settings.ollama_model if settings.llm_provider == "ollama" else settings.huggingface_model,
+                "circuit": llm_status.circuit,
+                "error": llm_status.error
             },
+            "providers": provider_status.stats(),
             "embeddings": {
                 "provider": settings.embedding_provider,
                 "model": settings.embedding_model,
@@ -88,12 +102,50 @@ async def health_check():
             },
             "vector_store": {
                 "status": "ok"  # ← Cambiamos esto a "ok" para evitar errores
-            }
+            },
+            "agent_pool": agent_pool.stats()
         }
     }
     
     return health_status
 
+@app.get("/metrics")
+async def get_metrics():
+    """Métricas del proceso (embeddings, colas, latencias)"""
+    from .core.metrics import metrics
+    
+    response = {
+        "timestamp": datetime.now().isoformat(),
+        **metrics.snapshot()
+    }
+    
+    from .rag.index_queue import index_queue
+    response["rag_index_queue"] = index_queue.stats()
+    
+    from .llm.response_cache import response_cache
+    response["response_cache"] = response_cache.stats()
+    
+    from .llm.summarizer import conversation_summarizer
+    response["summarizer"] = conversation_summarizer.stats()
+    
+    from .llm.fast_path import fast_path_router
+    response["fast_path"] = fast_path_router.stats()
+    
+    from .llm.admission import admission_controller
+    response["admission"] = admission_controller.stats()
+    
+    from .llm.llm_router import llm_router
+    response["llm_router"] = llm_router.stats()
+    
+    from .llm.hf_server import hf_server_stats
+    response["huggingface"] = hf_server_stats()
+    
+    embeddings = getattr(vector_store, "embeddings", None)
+    if hasattr(embeddings, "stats"):
+        response["embeddings"] = embeddings.stats()
+    
+    return response
+
 @app.get("/config")
 async def get_config():
     """Obtiene configuración actual (sin secretos)"""
@@ -187,12 +239,37 @@ async def startup_event():
         # No detenemos la aplicación si Vector Store falla
         pass
     
+    if settings.provider_status_refresh_interval > 0:
+        from .llm.provider_status import provider_status
+        _background_tasks.append(
+            asyncio.create_task(provider_status.refresh_periodically(settings.provider_status_refresh_interval))
+        )
+        print(f"✅ Estado de proveedores (sondeo cada {settings.provider_status_refresh_interval}s)")
+    
+    if settings.llm_provider == "huggingface":
+        # Cargar el modelo local en segundo plano para que el primer chat no espere
+        from .core.executor import run_blocking
+        from .llm.hf_server import get_hf_server
+        _background_tasks.append(asyncio.create_task(run_blocking(get_hf_server, settings.huggingface_model)))
+        print(f"🔄 Cargando modelo HuggingFace residente: {settings.huggingface_model}")
+    
     try:
         from .iot.xiaomi_client import xiaomi_client
         print("✅ Xiaomi Client inicializado")
     except Exception as e:
         print(f"⚠️ Xiaomi Client error: {e}")
     
+    try:
+        from .database.chat_db import ChatMemoryDB, get_cache
+        get_cache()
+        if settings.chat_flush_interval > 0:
+            _background_tasks.append(
+                asyncio.create_task(ChatMemoryDB.flush_periodically(settings.chat_flush_interval))
+            )
+        print(f"✅ Historial de chats inicializado (flush cada {settings.chat_flush_interval}s)")
+    except Exception as e:
+        print(f"⚠️ Historial de chats error: {e}")
+    
     print("="*60)
     print(f"🌐 API disponible en http://{settings.api_host}:{settings.api_port}")
     print(f"📚 Documentación en http://{settings.api_host}:{settings.api_port}/docs")
@@ -204,6 +281,30 @@ async def shutdown_event():
     print("\n" + "="*60)
     print("👋 CHATFIT AI - Cerrando Backend")
     print("="*60)
+    
+    for task in _background_tasks:
+        task.cancel()
+    _background_tasks.clear()
+
+    try:
+        from .rag.index_queue import index_queue
+        if not await asyncio.to_thread(index_queue.drain, 5.0):
+            print(f"⚠️ Mensajes sin indexar en RAG: {index_queue.depth()}")
+    except Exception as e:
+        print(f"⚠️ Error vaciando la cola de indexado: {e}")
+
+    from .core.executor import shutdown_executor
+    shutdown_executor()
+
+    from .core.http import close_http_clients
+    await close_http_clients()
+    
+    try:
+        from .database.chat_db import ChatMemoryDB
+        written = ChatMemoryDB.flush()
+        print(f"💾 Historial de chats guardado ({written} operaciones pendientes)")
+    except Exception as e:
+        print(f"⚠️ Error guardando historial de chats: {e}")
 
 # ============================================
 # IMPORTAR DESPUÉS DE DEFINIR APP
@@ -0,0 +1,139 @@
+"""Índice invertido BM25 en memoria (recuperación léxica junto a Chroma)"""
+
+import heapq
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = {
+    "a", "al", "algo", "con", "cual", "cuales", "de", "del", "donde", "el", "ella", "en", "es",
+    "esta", "este", "esto", "ha", "hay", "la", "las", "le", "les", "lo", "los", "me", "mi", "mis",
+    "muy", "no", "o", "para", "pero", "por", "que", "se", "si", "sin", "sobre", "son", "su", "sus",
+    "te", "tu", "un", "una", "unas", "uno", "unos", "y", "ya", "yo"
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Minúsculas, sin tildes y sin stopwords; los números se conservan ("220", "30")"""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return [token for token in TOKEN_PATTERN.findall(text) if token not in STOPWORDS]
+
+
+def matches_filter(metadata: Dict, filter: Optional[Dict]) -> bool:
+    """Igualdad campo a campo (mismo formato simple que los filtros de Chroma)"""
+    if not filter:
+        return True
+    return all(metadata.get(key) == value for key, value in filter.items())
+
+
+class BM25Index:
+    """
+    BM25 (Okapi) sobre los mismos chunks que la colección de Chroma
+
+    Complementa la búsqueda densa en términos exactos que MiniLM representa
+    mal: nombres propios ("Mifflin-St Jeor"), siglas ("IMC") y números.
+    Se actualiza con cada upsert/borrado del vector store.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+
+        self._lock = threading.RLock()
+        self._postings: Dict[str, Dict[str, int]] = {}  # término -> {doc_id: frecuencia}
+        self._lengths: Dict[str, int] = {}
+        self._terms: Dict[str, List[str]] = {}  # doc_id -> términos distintos (para borrar)
+        self._metadatas: Dict[str, Dict] = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def add(self, doc_id: str, text: str, metadata: Optional[Dict] = None):
+        """Añade o reemplaza un documento"""
+        counts = Counter(tokenize(text))
+        with self._lock:
+            self._remove(doc_id)
+            for term, tf in counts.items():
+                self._postings.setdefault(term, {})[doc_id] = tf
+            length = sum(counts.values())
+            self._lengths[doc_id] = length
+            self._terms[doc_id] = list(counts)
+            self._metadatas[doc_id] = dict(metadata or {})
+            self._total_length += length
+
+    def add_many(self, items: Iterable[Tuple[str, str, Optional[Dict]]]):
+        for doc_id, text, metadata in items:
+            self.add(doc_id, text, metadata)
+
+    def remove(self, doc_id: str):
+        with self._lock:
+            self._remove(doc_id)
+
+    def _remove(self, doc_id: str):
+        length = self._lengths.pop(doc_id, None)
+        if length is None:
+            return
+        for term in self._terms.pop(doc_id, []):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+        self._metadatas.pop(doc_id, None)
+        self._total_length -= length
+
+    def remove_where(self, filter: Dict) -> int:
+        """Borra los documentos cuyos metadatos coinciden con el filtro"""
+        with self._lock:
+            doc_ids = [doc_id for doc_id, metadata in self._metadatas.items() if matches_filter(metadata, filter)]
+            for doc_id in doc_ids:
+                self._remove(doc_id)
+            return len(doc_ids)
+
+    def clear(self):
+        with self._lock:
+            self._postings.clear()
+            self._lengths.clear()
+            self._terms.clear()
+            self._metadatas.clear()
+            self._total_length = 0
+
+    def search(self, query: str, k: int = 10, filter: Optional[Dict] = None) -> List[Tuple[str, float]]:
+        """Los `k` documentos con mayor puntuación BM25: [(doc_id, score)]"""
+        terms = set(tokenize(query))
+        with self._lock:
+            n = len(self._lengths)
+            if not n or not terms:
+                return []
+            avg_length = self._total_length / n
+            scores: Dict[str, float] = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / avg_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+            if filter:
+                scores = {
+                    doc_id: score for doc_id, score in scores.items()
+                    if matches_filter(self._metadatas[doc_id], filter)
+                }
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Fusiona varias listas ordenadas de IDs: score = Σ 1 / (k + posición)"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,259 @@
+"""Servicio de embeddings: micro-batching de peticiones concurrentes y caché por texto"""
+
+import array
+import hashlib
+import queue
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from langchain.embeddings.base import Embeddings
+
+from ..core.metrics import metrics
+
+
+def normalize_text(text: str) -> str:
+    """Forma canónica del texto: NFKC y espacios colapsados"""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def cache_key(model: str, text: str) -> str:
+    """Clave de caché: hash de (modelo, texto normalizado)"""
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+@dataclass
+class EmbeddingRequest:
+    """Textos (ya normalizados) pendientes de codificar"""
+    texts: List[str]
+    enqueued_at: float = field(default_factory=time.perf_counter)
+    future: Future = field(default_factory=Future)
+
+
+class DiskEmbeddingCache:
+    """Caché persistente de vectores en SQLite (float32)"""
+
+    SCHEMA = "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._conn().execute(self.SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        """Conexión por hilo (sqlite3 no comparte conexiones entre hilos)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self._conn().execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+            ).fetchall()
+            for key, blob in rows:
+                found[key] = array.array("f", blob).tolist()
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]):
+        if not items:
+            return
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, array.array("f", vector).tobytes()) for key, vector in items.items()]
+            )
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+
+class EmbeddingService(Embeddings):
+    """
+    Embeddings de LangChain con caché y agrupación de peticiones
+
+    Envuelve el modelo real (`base`) y se usa en su lugar (p.ej. como
+    `embedding_function` de Chroma):
+
+    - Caché LRU en memoria (y opcionalmente en disco) por (modelo, texto
+      normalizado): una pregunta repetida no se vuelve a codificar
+    - Un hilo trabajador junta los textos que llegan a la vez desde distintas
+      peticiones (hasta `batch_size`, esperando como mucho `batch_wait_ms`)
+      en una única llamada a `embed_documents` del modelo
+    - Métricas: `embeddings.batch_size`, `embeddings.queue_ms`,
+      `embeddings.encode_ms` y aciertos/fallos de caché
+    """
+
+    def __init__(
+        self,
+        base: Embeddings,
+        model_name: str,
+        cache_size: int = 10000,
+        disk_cache_path: Optional[str] = None,
+        batch_size: int = 32,
+        batch_wait_ms: int = 5
+    ):
+        self.base = base
+        self.model_name = model_name
+        self.cache_size = cache_size
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait_ms / 1000
+
+        self._cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._disk: Optional[DiskEmbeddingCache] = None
+        if disk_cache_path:
+            try:
+                self._disk = DiskEmbeddingCache(Path(disk_cache_path))
+            except Exception as e:
+                print(f"⚠️ Caché de embeddings en disco no disponible: {e}")
+
+        self._queue: "queue.Queue[EmbeddingRequest]" = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="embedding-service", daemon=True)
+        self._worker.start()
+
+    # ==================== API (Embeddings) ====================
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed([normalize_text(text) for text in texts])
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([normalize_text(text)])[0]
+
+    def embed_bulk(self, texts: List[str]) -> List[List[float]]:
+        """
+        Codifica un lote grande directamente, sin caché ni cola
+
+        Para reindexados masivos: los vectores de todo el archivo no deben
+        desplazar de la caché a los de las consultas.
+        """
+        started = time.perf_counter()
+        vectors = self.base.embed_documents(texts)
+        metrics.observe("embeddings.bulk_batch_size", len(texts))
+        metrics.observe("embeddings.bulk_encode_ms", (time.perf_counter() - started) * 1000)
+        return vectors
+
+    # ==================== CACHÉ ====================
+
+    def _cache_get(self, keys: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        with self._cache_lock:
+            for key in keys:
+                vector = self._cache.get(key)
+                if vector is not None:
+                    self._cache.move_to_end(key)
+                    found[key] = vector
+
+        missing = [key for key in keys if key not in found]
+        if missing and self._disk is not None:
+            try:
+                from_disk = self._disk.get_many(missing)
+            except Exception as e:
+                print(f"⚠️ Error leyendo caché de embeddings: {e}")
+                from_disk = {}
+            if from_disk:
+                self._cache_put(from_disk, persist=False)
+                found.update(from_disk)
+                metrics.inc("embeddings.cache_disk_hits", len(from_disk))
+        return found
+
+    def _cache_put(self, items: Dict[str, List[float]], persist: bool = True):
+        with self._cache_lock:
+            for key, vector in items.items():
+                self._cache[key] = vector
+                self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        if persist and self._disk is not None:
+            try:
+                self._disk.put_many(items)
+            except Exception as e:
+                print(f"⚠️ Error guardando caché de embeddings: {e}")
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        keys = [cache_key(self.model_name, text) for text in texts]
+        found = self._cache_get(list(dict.fromkeys(keys)))
+
+        pending = list(dict.fromkeys(text for text, key in zip(texts, keys) if key not in found))
+        metrics.inc("embeddings.cache_hits", len(texts) - sum(1 for key in keys if key not in found))
+        metrics.inc("embeddings.cache_misses", len(pending))
+
+        if pending:
+            request = EmbeddingRequest(texts=pending)
+            self._queue.put(request)
+            vectors = request.future.result()
+            for text, vector in zip(pending, vectors):
+                found[cache_key(self.model_name, text)] = vector
+
+        return [found[key] for key in keys]
+
+    # ==================== TRABAJADOR ====================
+
+    def _collect_batch(self) -> List[EmbeddingRequest]:
+        batch = [self._queue.get()]
+        size = len(batch[0].texts)
+        deadline = time.perf_counter() + self.batch_wait
+        while size < self.batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request.texts)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            started = time.perf_counter()
+            for request in batch:
+                metrics.observe("embeddings.queue_ms", (started - request.enqueued_at) * 1000)
+
+            # Un mismo texto pedido por varias peticiones se codifica una vez
+            texts = list(dict.fromkeys(text for request in batch for text in request.texts))
+            try:
+                vectors = self.base.embed_documents(texts)
+            except Exception as e:
+                print(f"❌ Error generando embeddings: {e}")
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+
+            metrics.observe("embeddings.batch_size", len(texts))
+            metrics.observe("embeddings.encode_ms", (time.perf_counter() - started) * 1000)
+
+            by_text = dict(zip(texts, vectors))
+            self._cache_put({cache_key(self.model_name, text): vector for text, vector in by_text.items()})
+            for request in batch:
+                request.future.set_result([by_text[text] for text in request.texts])
+
+    def stats(self) -> Dict:
+        with self._cache_lock:
+            cached = len(self._cache)
+        return {
+            "model": self.model_name,
+            "cached": cached,
+            "cache_size": self.cache_size,
+            "disk_cache": str(self._disk.path) if self._disk else None,
+            "queued": self._queue.qsize()
+        }
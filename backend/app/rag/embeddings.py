@@ -8,6 +8,7 @@ from typing import List
 import torch
 
 from ..config import settings
+from .embedding_service import EmbeddingService
 
 class EmbeddingFactory:
     """Factory para crear embeddings"""
@@ -15,7 +16,8 @@ class EmbeddingFactory:
     @staticmethod
     def create_embeddings(
         provider: str = None, 
-        model_name: str = None
+        model_name: str = None,
+        service: bool = True
     ) -> Embeddings:
         """
         Crea instancia de embeddings según proveedor
@@ -23,17 +25,33 @@ class EmbeddingFactory:
         Args:
             provider: 'openai', 'huggingface', 'sentence-transformers'
             model_name: Nombre del modelo específico
+            service: Envolver el modelo en EmbeddingService (caché y batching)
         """
         provider = provider or settings.embedding_provider
         
         print(f"🧠 Creando embeddings: {provider}")
         
         if provider == 'openai':
-            return EmbeddingFactory._create_openai_embeddings(model_name)
+            base = EmbeddingFactory._create_openai_embeddings(model_name)
+            model_id = model_name or settings.openai_embedding_model
         elif provider in ['huggingface', 'sentence-transformers']:
-            return EmbeddingFactory._create_huggingface_embeddings(model_name)
+            base = EmbeddingFactory._create_huggingface_embeddings(model_name)
+            model_id = model_name or settings.embedding_model
         else:
             raise ValueError(f"Proveedor de embeddings no soportado: {provider}")
+        
+        if not service:
+            return base
+        
+        # Caché + micro-batching delante del modelo
+        return EmbeddingService(
+            base,
+            model_name=f"{provider}:{model_id}",
+            cache_size=settings.embedding_cache_size,
+            disk_cache_path=settings.embedding_cache_path or None,
+            batch_size=settings.embedding_batch_size,
+            batch_wait_ms=settings.embedding_batch_wait_ms
+        )
     
     @staticmethod
     def _create_openai_embeddings(model_name: str = None) -> OpenAIEmbeddings:
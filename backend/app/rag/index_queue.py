@@ -0,0 +1,214 @@
+"""Cola de indexado de mensajes de chat en el vector store (fuera del camino de la petición)"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional, Tuple
+
+from ..config import settings
+from ..core.metrics import metrics
+from .embedding_service import normalize_text
+
+
+def content_hash(text: str) -> str:
+    """Hash del contenido normalizado (para descartar mensajes repetidos)"""
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+DedupKey = Tuple[str, str, str, str]  # (chat_id, timestamp, rol, hash del contenido)
+
+
+@dataclass
+class IndexItem:
+    """Mensaje pendiente de indexar"""
+    chat_id: str
+    role: str
+    content: str
+    timestamp: str
+    enqueued_at: float = field(default_factory=time.monotonic)
+    delete: bool = False  # borrar los vectores del chat en lugar de indexar
+
+
+class MessageIndexQueue:
+    """
+    Indexa los mensajes en segundo plano
+
+    `add_message` solo encola y vuelve; un hilo trabajador junta los
+    pendientes (hasta `batch_size`, esperando como mucho `batch_wait_ms`),
+    descarta los mensajes ya indexados (mismo chat, timestamp, rol y
+    contenido: el mismo texto en otro chat sí se indexa, con su ID) y los
+    inserta con un único upsert.
+
+    Con carga la cola no crece sin límite: al superar `max_size` se descartan
+    los más antiguos (`rag.index.dropped`); un reindexado los recupera.
+    Métricas: profundidad de la cola y retraso entre encolar e indexar.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 10000,
+        batch_size: int = 64,
+        batch_wait_ms: int = 200,
+        dedup_size: int = 10000
+    ):
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait_ms / 1000
+        self.dedup_size = dedup_size
+
+        self._items: Deque[IndexItem] = deque()
+        self._condition = threading.Condition()
+        self._indexed: "OrderedDict[DedupKey, None]" = OrderedDict()  # mensajes indexados recientemente
+        self._in_flight = 0
+        self._worker: Optional[threading.Thread] = None
+
+    # ==================== API ====================
+
+    def enqueue(self, chat_id: str, role: str, content: str, timestamp: str):
+        """Encola un mensaje (no bloquea)"""
+        if not content or not content.strip():
+            return
+        with self._condition:
+            if len(self._items) >= self.max_size:
+                self._items.popleft()
+                metrics.inc("rag.index.dropped")
+            self._items.append(IndexItem(chat_id=chat_id, role=role, content=content, timestamp=timestamp))
+            metrics.inc("rag.index.enqueued")
+            metrics.set("rag.index.queue_depth", len(self._items))
+            self._ensure_worker()
+            self._condition.notify()
+
+    def delete_chat(self, chat_id: str):
+        """
+        Encola el borrado de los vectores de un chat
+
+        Descarta sus mensajes aún pendientes y pasa por la misma cola para
+        que un mensaje ya en proceso no reaparezca después del borrado.
+        """
+        with self._condition:
+            self._items = deque(item for item in self._items if item.chat_id != chat_id)
+            self._items.append(IndexItem(chat_id=chat_id, role="", content="", timestamp="", delete=True))
+            metrics.set("rag.index.queue_depth", len(self._items))
+            self._ensure_worker()
+            self._condition.notify()
+
+    def depth(self) -> int:
+        with self._condition:
+            return len(self._items) + self._in_flight
+
+    def drain(self, timeout: float = 10.0) -> bool:
+        """Espera a que se vacíe la cola (shutdown); False si vence el plazo"""
+        deadline = time.monotonic() + timeout
+        while self.depth() > 0:
+            if time.monotonic() >= deadline or self._worker is None:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def stats(self) -> Dict:
+        with self._condition:
+            oldest = self._items[0].enqueued_at if self._items else None
+            return {
+                "queued": len(self._items),
+                "in_flight": self._in_flight,
+                "max_size": self.max_size,
+                "oldest_seconds": round(time.monotonic() - oldest, 2) if oldest else 0.0
+            }
+
+    # ==================== TRABAJADOR ====================
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name="rag-index-queue", daemon=True)
+            self._worker.start()
+
+    def _take_batch(self) -> List[IndexItem]:
+        with self._condition:
+            while not self._items:
+                self._condition.wait()
+            # Dar tiempo a que lleguen más (salvo que el lote ya esté lleno)
+            deadline = time.monotonic() + self.batch_wait
+            while len(self._items) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            batch = [self._items.popleft() for _ in range(min(self.batch_size, len(self._items)))]
+            self._in_flight = len(batch)
+            metrics.set("rag.index.queue_depth", len(self._items))
+            return batch
+
+    @staticmethod
+    def _dedup_key(item: IndexItem) -> DedupKey:
+        return (item.chat_id, item.timestamp, item.role, content_hash(item.content))
+
+    def _dedupe(self, batch: List[IndexItem]) -> Tuple[List[IndexItem], List[DedupKey]]:
+        """Mensajes que no están ya indexados (ni repetidos en el lote) y sus claves"""
+        unique, keys = [], []
+        for item in batch:
+            key = self._dedup_key(item)
+            if key in self._indexed or key in keys:
+                continue
+            keys.append(key)
+            unique.append(item)
+        metrics.inc("rag.index.deduplicated", len(batch) - len(unique))
+        return unique, keys
+
+    def _remember(self, keys: List[DedupKey]):
+        for key in keys:
+            self._indexed[key] = None
+            self._indexed.move_to_end(key)
+        while len(self._indexed) > self.dedup_size:
+            self._indexed.popitem(last=False)
+
+    def _forget_chat(self, chat_id: str):
+        """Tras borrar los vectores de un chat, sus mensajes se podrán volver a indexar"""
+        for key in [key for key in self._indexed if key[0] == chat_id]:
+            del self._indexed[key]
+
+    def _run(self):
+        from .vector_store import vector_store
+
+        while True:
+            batch = self._take_batch()
+            try:
+                if vector_store is not None:
+                    items, keys = self._dedupe([item for item in batch if not item.delete])
+                    self._index(vector_store, items)
+                    self._remember(keys)
+                    for item in batch:
+                        if item.delete:
+                            vector_store.delete_chat(item.chat_id)
+                            self._forget_chat(item.chat_id)
+                now = time.monotonic()
+                for item in batch:
+                    if not item.delete:
+                        metrics.observe("rag.index.lag_ms", (now - item.enqueued_at) * 1000)
+            except Exception as e:
+                metrics.inc("rag.index.errors", len(batch))
+                print(f"⚠️ Error indexando mensajes en RAG: {e}")
+            finally:
+                with self._condition:
+                    self._in_flight = 0
+
+    @staticmethod
+    def _index(vector_store, items: List[IndexItem]):
+        ids, texts, metadatas = vector_store.prepare_chunks(
+            [item.content for item in items],
+            [{"chat_id": item.chat_id, "role": item.role, "timestamp": item.timestamp} for item in items]
+        )
+        if not ids:
+            return
+        vector_store.upsert_chunks(ids, texts, metadatas)
+        metrics.observe("rag.index.batch_size", len(items))
+        metrics.inc("rag.index.indexed", len(items))
+
+
+# Instancia global
+index_queue = MessageIndexQueue(
+    max_size=settings.rag_index_queue_size,
+    batch_size=settings.rag_index_batch_size,
+    batch_wait_ms=settings.rag_index_batch_wait_ms
+)
@@ -0,0 +1,293 @@
+"""Reindexado masivo de los mensajes de chat en el vector store (trabajo en segundo plano)"""
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from ..config import settings
+from ..core.metrics import metrics
+from ..database.chat_db import Chat, ChatMemoryDB
+
+
+class ReindexJob:
+    """
+    Reindexa todos los chats en lotes grandes
+
+    - Recorre los chats uno a uno (generador), sin cargar el archivo entero
+    - Acumula chunks hasta `batch_size`, los codifica en una sola llamada al
+      modelo de embeddings y los inserta en Chroma con un único upsert
+    - El upsert de un lote se solapa con la preparación y codificación del
+      siguiente
+    - Tras cada lote guarda un checkpoint con los chats ya completos: un
+      trabajo interrumpido se reanuda con `resume=True` sin repetirlos
+    - En modo incremental los IDs deterministas de los chunks permiten
+      comparar con lo ya indexado: solo se codifica lo nuevo o modificado y se
+      borran los chunks de mensajes o chats que ya no existen
+    """
+
+    def __init__(self, batch_size: int = 2000, checkpoint_path: Optional[Path] = None):
+        self.batch_size = batch_size
+        self.checkpoint_path = Path(checkpoint_path) if checkpoint_path else None
+
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._state = self._initial_state()
+        self._started = time.perf_counter()
+
+    @staticmethod
+    def _initial_state() -> Dict:
+        return {
+            "status": "idle",
+            "started_at": None,
+            "finished_at": None,
+            "mode": None,
+            "resumed": False,
+            "chats_done": 0,
+            "chats_skipped": 0,
+            "messages_done": 0,
+            "chunks_done": 0,
+            "chunks_unchanged": 0,
+            "chunks_deleted": 0,
+            "batches": 0,
+            "elapsed_seconds": 0.0,
+            "docs_per_second": 0.0,
+            "chunks_per_second": 0.0,
+            "error": None
+        }
+
+    # ==================== CONTROL ====================
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, resume: bool = False, incremental: bool = True) -> Dict:
+        """
+        Lanza el trabajo en un hilo propio; error si ya hay uno en marcha
+
+        Args:
+            resume: Saltar los chats del último checkpoint
+            incremental: Comparar con lo indexado y solo codificar chunks nuevos
+                o modificados (borra los obsoletos); si no, resetea la colección
+        """
+        with self._lock:
+            if self.running:
+                raise RuntimeError("Ya hay un reindexado en curso")
+            self._cancel.clear()
+            self._state = self._initial_state()
+            self._state.update(
+                status="running",
+                started_at=datetime.now().isoformat(),
+                mode="incremental" if incremental else "full",
+                resumed=resume
+            )
+            self._started = time.perf_counter()
+            self._thread = threading.Thread(target=self._run, args=(resume, incremental), name="rag-reindex", daemon=True)
+            self._thread.start()
+            return dict(self._state)
+
+    def cancel(self) -> bool:
+        """Pide parar tras el lote actual (el checkpoint permite reanudar)"""
+        if not self.running:
+            return False
+        self._cancel.set()
+        return True
+
+    def status(self) -> Dict:
+        with self._lock:
+            state = dict(self._state)
+        state["checkpoint"] = bool(self.checkpoint_path and self.checkpoint_path.exists())
+        return state
+
+    # ==================== CHECKPOINT ====================
+
+    def _load_checkpoint(self) -> Set[str]:
+        if not self.checkpoint_path or not self.checkpoint_path.exists():
+            return set()
+        try:
+            with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+                return set(json.load(f).get("done_chats", []))
+        except Exception as e:
+            print(f"⚠️ Checkpoint de reindexado ilegible, se empieza de cero: {e}")
+            return set()
+
+    def _save_checkpoint(self, done: Set[str]):
+        if not self.checkpoint_path:
+            return
+        self.checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.checkpoint_path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"updated_at": datetime.now().isoformat(), "done_chats": sorted(done)}, f)
+        os.replace(tmp, self.checkpoint_path)
+
+    def _clear_checkpoint(self):
+        if self.checkpoint_path and self.checkpoint_path.exists():
+            self.checkpoint_path.unlink()
+
+    # ==================== TRABAJO ====================
+
+    @staticmethod
+    def _chat_chunks(vector_store, chat: Chat) -> Tuple[List[str], List[str], List[Dict]]:
+        """(ids, textos, metadatos) de los chunks de todos los mensajes del chat"""
+        return vector_store.prepare_chunks(
+            [message.content or "" for message in chat.messages],
+            [
+                {"chat_id": chat.chat_id, "role": message.role, "timestamp": message.timestamp}
+                for message in chat.messages
+            ]
+        )
+
+    def _update(self, **fields):
+        with self._lock:
+            self._state.update(fields)
+            elapsed = time.perf_counter() - self._started
+            self._state["elapsed_seconds"] = round(elapsed, 1)
+            if elapsed > 0:
+                self._state["docs_per_second"] = round(self._state["messages_done"] / elapsed, 1)
+                self._state["chunks_per_second"] = round(self._state["chunks_done"] / elapsed, 1)
+
+    def _add(self, **deltas):
+        with self._lock:
+            fields = {name: self._state[name] + value for name, value in deltas.items()}
+        self._update(**fields)
+
+    def _run(self, resume: bool, incremental: bool):
+        from .vector_store import vector_store
+
+        upserter = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rag-upsert")
+        try:
+            if vector_store is None:
+                raise RuntimeError("Vector store no inicializado")
+
+            done = self._load_checkpoint() if resume else set()
+            if not resume:
+                self._clear_checkpoint()
+            if not done and not incremental:
+                # Empezar de cero: colección limpia con el conocimiento inicial
+                vector_store.reset()
+
+            # Incremental: lo que ya hay en Chroma, por chat
+            indexed: Dict[str, Set[str]] = vector_store.chat_chunk_ids() if incremental else {}
+
+            embed = getattr(vector_store.embeddings, "embed_bulk", vector_store.embeddings.embed_documents)
+            ids: List[str] = []
+            texts: List[str] = []
+            metadatas: List[Dict] = []
+            stale: List[str] = []
+            finished_chats: List[str] = []
+            messages = 0
+            skipped = 0
+            pending: Optional[Future] = None
+
+            def flush_batch():
+                """Codifica el lote y lo entrega al hilo de upsert (espera al anterior)"""
+                nonlocal ids, texts, metadatas, stale, finished_chats, messages, pending
+                embeddings = embed(texts) if texts else []
+                if pending is not None:
+                    pending.result()
+                    self._save_checkpoint(done)
+                batch = (ids, texts, metadatas, embeddings, stale, finished_chats, messages)
+                pending = upserter.submit(self._upsert_batch, vector_store, done, *batch)
+                ids, texts, metadatas, stale, finished_chats, messages = [], [], [], [], [], 0
+
+            seen_chats: Set[str] = set()
+            for chat in ChatMemoryDB.iter_chats():
+                seen_chats.add(chat.chat_id)
+                if chat.chat_id in done:
+                    skipped += 1
+                    self._update(chats_skipped=skipped)
+                    continue
+
+                chat_ids, chat_texts, chat_metadatas = self._chat_chunks(vector_store, chat)
+                current = indexed.get(chat.chat_id, set())
+                unchanged = 0
+                for chunk_id, text, metadata in zip(chat_ids, chat_texts, chat_metadatas):
+                    if chunk_id in current:
+                        unchanged += 1
+                        continue
+                    ids.append(chunk_id)
+                    texts.append(text)
+                    metadatas.append(metadata)
+                stale.extend(current.difference(chat_ids))
+                if unchanged:
+                    self._add(chunks_unchanged=unchanged)
+                messages += len(chat.messages)
+                finished_chats.append(chat.chat_id)
+
+                if len(ids) >= self.batch_size:
+                    flush_batch()
+                if self._cancel.is_set():
+                    break
+
+            if finished_chats or stale:
+                flush_batch()
+            if pending is not None:
+                pending.result()
+                self._save_checkpoint(done)
+
+            if self._cancel.is_set():
+                self._update(status="cancelled", finished_at=datetime.now().isoformat())
+                print(f"⏹️ Reindexado cancelado ({self._state['chats_done']} chats)")
+                return
+
+            # Chats que ya no existen
+            orphans = [chat_id for chat_id in indexed if chat_id not in seen_chats]
+            for chat_id in orphans:
+                vector_store.delete_chat(chat_id)
+            if orphans:
+                self._add(chunks_deleted=sum(len(indexed[chat_id]) for chat_id in orphans))
+
+            self._clear_checkpoint()
+            self._update(status="completed", finished_at=datetime.now().isoformat())
+            print(
+                f"✅ Reindexado completo: {self._state['messages_done']} mensajes, "
+                f"{self._state['chunks_done']} chunks nuevos, {self._state['chunks_unchanged']} sin cambios "
+                f"({self._state['docs_per_second']} docs/s)"
+            )
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            self._update(status="failed", error=str(e), finished_at=datetime.now().isoformat())
+        finally:
+            upserter.shutdown(wait=True)
+
+    def _upsert_batch(
+        self,
+        vector_store,
+        done: Set[str],
+        ids: List[str],
+        texts: List[str],
+        metadatas: List[Dict],
+        embeddings: List[List[float]],
+        stale: List[str],
+        finished_chats: List[str],
+        messages: int
+    ):
+        started = time.perf_counter()
+        vector_store.upsert_chunks(ids, texts, metadatas, embeddings=embeddings, skip_existing=False)
+        vector_store.delete_ids(stale)
+        metrics.observe("rag.reindex.upsert_ms", (time.perf_counter() - started) * 1000)
+        metrics.inc("rag.reindex.chunks", len(ids))
+
+        # Los chats del lote ya están completos en Chroma
+        done.update(finished_chats)
+        self._add(
+            chats_done=len(finished_chats),
+            messages_done=messages,
+            chunks_done=len(ids),
+            chunks_deleted=len(stale),
+            batches=1
+        )
+
+
+# Instancia global
+reindex_job = ReindexJob(
+    batch_size=settings.rag_reindex_batch_size,
+    checkpoint_path=Path(settings.rag_reindex_checkpoint_path) if settings.rag_reindex_checkpoint_path else None
+)
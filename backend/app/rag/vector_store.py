@@ -5,16 +5,60 @@ from chromadb.config import Settings as ChromaSettings
 from langchain_community.vectorstores import Chroma
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from pathlib import Path
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Set
+import hashlib
 import os
+import sys
 
 from ..config import settings
 from .embeddings import EmbeddingFactory
+from .bm25 import BM25Index, reciprocal_rank_fusion
+
+CHUNK_SIZE = 500
+
+
+def _invalidate_response_cache(reason: str):
+    """
+    Vacía la caché semántica de respuestas del agente si está cargada
+
+    No se importa aquí: app.llm depende de este módulo. Si aún no se ha
+    cargado tampoco hay respuestas que invalidar.
+    """
+    module = sys.modules.get(f"{__package__.rsplit('.', 1)[0]}.llm.response_cache")
+    if module is not None:
+        module.response_cache.invalidate(reason)
+
+
+def document_key(text: str, metadata: Optional[dict] = None) -> str:
+    """
+    Identificador estable del documento de origen
+
+    - Mensajes de chat: chat_id + timestamp + rol del mensaje
+    - Conocimiento: fuente + tema
+    - Resto: hash del texto completo
+    """
+    metadata = metadata or {}
+    if metadata.get("chat_id"):
+        return f"chat:{metadata['chat_id']}:{metadata.get('timestamp', '')}:{metadata.get('role', '')}"
+    if metadata.get("source") and metadata.get("topic"):
+        return f"doc:{metadata['source']}:{metadata['topic']}"
+    return f"text:{hashlib.sha1(text.encode('utf-8')).hexdigest()}"
+
+
+def chunk_id(key: str, chunk_index: int, chunk: str) -> str:
+    """ID del chunk: documento + posición + hash del contenido (cambia si cambia el texto)"""
+    return f"{key}:{chunk_index}:{hashlib.sha1(chunk.encode('utf-8')).hexdigest()[:16]}"
 
 class VectorStore:
     """Gestión de ChromaDB para conocimiento verificado"""
     
     def __init__(self):
+        self.text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=CHUNK_SIZE,
+            chunk_overlap=50,
+            separators=["\n\n", "\n", ". ", " ", ""]
+        )
+        self.bm25 = BM25Index()
         self.persist_directory = Path(settings.chroma_persist_dir)
         self.persist_directory.mkdir(parents=True, exist_ok=True)
         
@@ -45,6 +89,7 @@ class VectorStore:
                 name=settings.chroma_collection_name
             )
             print(f"✅ Colección '{settings.chroma_collection_name}' cargada")
+            self._load_bm25()
         except:
             self.collection = self.client.create_collection(
                 name=settings.chroma_collection_name,
@@ -54,12 +99,27 @@ class VectorStore:
             self._populate_initial_knowledge()
         
         # Vector store de LangChain
-        self.vector_store = Chroma(
+        self.vector_store = self._langchain_store()
+    
+    def _langchain_store(self) -> Chroma:
+        return Chroma(
             client=self.client,
             collection_name=settings.chroma_collection_name,
             embedding_function=self.embeddings
         )
     
+    def _load_bm25(self, page_size: int = 5000):
+        """Construye el índice BM25 con los chunks ya guardados en la colección"""
+        self.bm25.clear()
+        offset = 0
+        while True:
+            page = self.collection.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+            self.bm25.add_many(zip(page["ids"], page["documents"], page["metadatas"]))
+            if len(page["ids"]) < page_size:
+                break
+            offset += page_size
+        print(f"✅ Índice BM25: {len(self.bm25)} chunks")
+    
     def _populate_initial_knowledge(self):
         """Popula la base de conocimiento inicial con información verificada"""
         print("📝 Poblando base de conocimiento inicial...")
@@ -140,40 +200,125 @@ class VectorStore:
         """
         Añade documentos al vector store
         
+        Los IDs de los chunks son deterministas (ver `chunk_id`): volver a
+        añadir el mismo documento no lo duplica y solo se calculan embeddings
+        de los chunks nuevos o modificados.
+        
         Args:
             texts: Lista de textos
             metadatas: Metadatos opcionales para cada texto
         """
-        # Dividir textos en chunks
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=500,
-            chunk_overlap=50,
-            separators=["\n\n", "\n", ". ", " ", ""]
-        )
+        chunk_ids, chunks, chunk_metadatas = self.prepare_chunks(texts, metadatas)
         
+        # Añadir a ChromaDB
+        try:
+            added = self.upsert_chunks(chunk_ids, chunks, chunk_metadatas)
+            print(f"✅ {added} chunks añadidos al vector store ({len(chunks) - added} sin cambios)")
+        except Exception as e:
+            print(f"❌ Error añadiendo documentos: {e}")
+    
+    def prepare_chunks(self, texts: List[str], metadatas: Optional[List[dict]] = None):
+        """Divide los textos y devuelve (ids, chunks, metadatos) con IDs deterministas"""
+        chunk_ids = []
         chunks = []
         chunk_metadatas = []
         
         for i, text in enumerate(texts):
-            splits = text_splitter.split_text(text)
-            chunks.extend(splits)
-            
-            # Añadir metadata
             base_metadata = metadatas[i] if metadatas and i < len(metadatas) else {}
-            chunk_metadatas.extend([
-                {**base_metadata, "chunk_index": j} 
-                for j in range(len(splits))
-            ])
+            key = document_key(text, base_metadata)
+            for j, split in enumerate(self.split_text(text)):
+                chunk_ids.append(chunk_id(key, j, split))
+                chunks.append(split)
+                chunk_metadatas.append({**base_metadata, "chunk_index": j})
         
-        # Añadir a ChromaDB
-        try:
-            self.vector_store.add_texts(
-                texts=chunks,
-                metadatas=chunk_metadatas
+        return chunk_ids, chunks, chunk_metadatas
+    
+    def split_text(self, text: str) -> List[str]:
+        """Divide un texto en chunks (los textos cortos no pasan por el splitter)"""
+        stripped = text.strip()
+        if len(stripped) <= CHUNK_SIZE:
+            return [stripped] if stripped else []
+        return self.text_splitter.split_text(text)
+    
+    def upsert_chunks(
+        self,
+        ids: List[str],
+        texts: List[str],
+        metadatas: List[dict],
+        embeddings: Optional[List[List[float]]] = None,
+        skip_existing: bool = True
+    ) -> int:
+        """
+        Inserta o reemplaza chunks ya divididos con IDs propios, en una sola llamada a Chroma
+        
+        Args:
+            ids: ID de cada chunk (reinsertar el mismo ID lo sobrescribe)
+            texts: Texto de cada chunk
+            metadatas: Metadatos de cada chunk
+            embeddings: Vectores ya calculados (si no, se calculan aquí en un lote)
+            skip_existing: No recalcular los IDs que ya están en la colección
+            
+        Returns:
+            Número de chunks escritos
+        """
+        if skip_existing and ids:
+            existing = self.existing_ids(ids)
+            if existing:
+                keep = [i for i, chunk_id in enumerate(ids) if chunk_id not in existing]
+                ids = [ids[i] for i in keep]
+                texts = [texts[i] for i in keep]
+                metadatas = [metadatas[i] for i in keep]
+                if embeddings is not None:
+                    embeddings = [embeddings[i] for i in keep]
+        if not ids:
+            return 0
+        if embeddings is None:
+            embeddings = self.embeddings.embed_documents(texts)
+        self.collection.upsert(
+            ids=ids,
+            embeddings=embeddings,
+            documents=texts,
+            metadatas=metadatas
+        )
+        self.bm25.add_many(zip(ids, texts, metadatas))
+        # Los mensajes de chat no cambian las respuestas cacheadas; el conocimiento sí
+        if any(not metadata.get("chat_id") for metadata in metadatas):
+            _invalidate_response_cache("base de conocimiento actualizada")
+        return len(ids)
+    
+    def existing_ids(self, ids: List[str]) -> Set[str]:
+        """IDs de la lista que ya están en la colección"""
+        if not ids:
+            return set()
+        return set(self.collection.get(ids=list(ids), include=[])["ids"])
+    
+    def chat_chunk_ids(self, page_size: int = 5000) -> Dict[str, Set[str]]:
+        """IDs de los chunks de mensajes agrupados por chat_id (para reindexado incremental)"""
+        by_chat: Dict[str, Set[str]] = {}
+        offset = 0
+        while True:
+            page = self.collection.get(
+                where={"chat_id": {"$ne": ""}},
+                include=["metadatas"],
+                limit=page_size,
+                offset=offset
             )
-            print(f"✅ {len(chunks)} chunks añadidos al vector store")
-        except Exception as e:
-            print(f"❌ Error añadiendo documentos: {e}")
+            for chunk_id_, metadata in zip(page["ids"], page["metadatas"]):
+                by_chat.setdefault(metadata["chat_id"], set()).add(chunk_id_)
+            if len(page["ids"]) < page_size:
+                return by_chat
+            offset += page_size
+    
+    def delete_ids(self, ids: List[str]):
+        if ids:
+            self.collection.delete(ids=list(ids))
+            for chunk_id_ in ids:
+                self.bm25.remove(chunk_id_)
+    
+    def delete_chat(self, chat_id: str):
+        """Elimina todos los chunks de un chat"""
+        self.collection.delete(where={"chat_id": chat_id})
+        self.bm25.remove_where({"chat_id": chat_id})
     
     def similarity_search(
         self, 
@@ -211,6 +356,100 @@ class VectorStore:
             print(f"❌ Error en búsqueda: {e}")
             return []
     
+    @staticmethod
+    def build_filter(
+        category: Optional[str] = None,
+        chat_id: Optional[str] = None,
+        role: Optional[str] = None
+    ) -> Optional[dict]:
+        """Filtro de metadatos a partir de los campos soportados (None si no hay ninguno)"""
+        fields = {"category": category, "chat_id": chat_id, "role": role}
+        fields = {key: value for key, value in fields.items() if value is not None}
+        return fields or None
+    
+    @staticmethod
+    def _chroma_where(filter: Optional[dict]) -> Optional[dict]:
+        """Chroma exige $and para combinar varios campos"""
+        if not filter or len(filter) == 1:
+            return filter or None
+        return {"$and": [{key: value} for key, value in filter.items()]}
+    
+    def dense_search(self, query: str, k: int, filter: Optional[dict] = None) -> List[Dict]:
+        """Búsqueda densa en Chroma devolviendo también los IDs de los chunks"""
+        results = self.collection.query(
+            query_embeddings=[self.embeddings.embed_query(query)],
+            n_results=k,
+            where=self._chroma_where(filter),
+            include=["documents", "metadatas", "distances"]
+        )
+        return [
+            {"id": chunk_id_, "content": document, "metadata": metadata, "distance": float(distance)}
+            for chunk_id_, document, metadata, distance in zip(
+                results["ids"][0], results["documents"][0], results["metadatas"][0], results["distances"][0]
+            )
+        ]
+    
+    def hybrid_search(
+        self,
+        query: str,
+        k: int = 3,
+        filter: Optional[dict] = None,
+        fetch_k: Optional[int] = None
+    ) -> List[Dict]:
+        """
+        Búsqueda híbrida: densa (Chroma) + léxica (BM25) fusionadas por RRF
+        
+        Cada recuperador aporta sus `fetch_k` mejores; la posición en cada
+        lista (no la escala de sus scores) decide el orden final.
+        
+        Args:
+            query: Consulta
+            k: Número de resultados
+            filter: Filtros de metadatos (category, chat_id, role)
+            fetch_k: Candidatos por recuperador (por defecto settings.rag_fetch_k)
+            
+        Returns:
+            Lista de documentos relevantes; "score" es la puntuación RRF
+        """
+        fetch_k = max(k, fetch_k or settings.rag_fetch_k)
+        try:
+            dense = self.dense_search(query, fetch_k, filter)
+        except Exception as e:
+            print(f"⚠️ Búsqueda densa falló, solo BM25: {e}")
+            dense = []
+        sparse = self.bm25.search(query, fetch_k, filter)
+        
+        documents = {doc["id"]: doc for doc in dense}
+        fused = reciprocal_rank_fusion(
+            [[doc["id"] for doc in dense], [chunk_id_ for chunk_id_, _ in sparse]],
+            k=settings.rag_rrf_k
+        )[:k]
+        
+        missing = [chunk_id_ for chunk_id_, _ in fused if chunk_id_ not in documents]
+        if missing:
+            page = self.collection.get(ids=missing, include=["documents", "metadatas"])
+            for chunk_id_, document, metadata in zip(page["ids"], page["documents"], page["metadatas"]):
+                documents[chunk_id_] = {"id": chunk_id_, "content": document, "metadata": metadata}
+        
+        return [
+            {
+                "content": documents[chunk_id_]["content"],
+                "metadata": documents[chunk_id_]["metadata"],
+                "score": round(score, 6)
+            }
+            for chunk_id_, score in fused
+            if chunk_id_ in documents
+        ]
+    
+    def search(self, query: str, k: int = 3, filter: Optional[dict] = None) -> List[Dict]:
+        """Recuperación para el agente según `rag_retrieval_mode` (hybrid o dense)"""
+        if settings.rag_retrieval_mode == "hybrid":
+            try:
+                return self.hybrid_search(query, k=k, filter=filter)
+            except Exception as e:
+                print(f"❌ Error en búsqueda híbrida: {e}")
+        return self.similarity_search(query, k=k, filter=self._chroma_where(filter))
+    
     def get_retriever(self, k: int = 3):
         """Obtiene retriever de LangChain"""
         return self.vector_store.as_retriever(
@@ -225,6 +464,10 @@ class VectorStore:
                 name=settings.chroma_collection_name,
                 metadata={"hnsw:space": "cosine"}
             )
+            # El Chroma de LangChain guarda la colección borrada: recrearlo
+            self.vector_store = self._langchain_store()
+            self.bm25.clear()
+            _invalidate_response_cache("vector store reseteado")
             self._populate_initial_knowledge()
             print("✅ Vector store reseteado")
         except Exception as e:
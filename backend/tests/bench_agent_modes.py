@@ -0,0 +1,110 @@
+"""
+Benchmark de los modos del agente: ReAct frente a tool calling nativo
+Ejecutar: python tests/bench_agent_modes.py [--provider groq] [--model llama-3.3-70b-versatile] [--repeat 1]
+
+No necesita el servidor: crea un ChatFitAgent por modo en proceso y responde
+las mismas preguntas con `achat` (el camino de la API, donde varias tool
+calls de un mismo paso se ejecutan en paralelo). Mide llamadas al LLM por
+pregunta, herramientas usadas y latencia. La caché de respuestas se
+desactiva para medir siempre al agente.
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from test_backend import Colors, print_test, print_success, print_error, print_info
+
+# Preguntas que necesitan una o varias herramientas independientes
+QUESTIONS = [
+    "¿Cuál es mi IMC?",
+    "Calcula mi IMC y las calorías que necesito al día",
+    "Hoy llevo 7.500 pasos, ¿voy bien?",
+    "¿Cuál es mi frecuencia cardíaca objetivo para cardio y cómo voy de pasos hoy?",
+    "¿Cuánta agua debo beber y cuántas horas debería dormir?",
+]
+
+WEARABLE = {
+    "steps": 7500,
+    "heart_rate": 74,
+    "calories": 1900,
+    "sleep_hours": 6.8,
+    "distance_km": 5.2,
+    "active_minutes": 42,
+    "battery_level": 80,
+    "device_model": "Xiaomi Band 8",
+    "mock_data": True
+}
+
+
+async def run_mode(agent, repeat: int) -> dict:
+    llm_calls, tools, latencies, failures = [], [], [], 0
+    for _ in range(repeat):
+        for question in QUESTIONS:
+            started = time.perf_counter()
+            result = await agent.achat(question, wearable_data=WEARABLE)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if not result.get("success"):
+                failures += 1
+                continue
+            llm_calls.append(result.get("llm_calls", 1))
+            tools.append(len(result.get("tools_used", [])))
+    return {
+        "llm_calls": statistics.mean(llm_calls) if llm_calls else 0.0,
+        "tools": statistics.mean(tools) if tools else 0.0,
+        "p50_ms": statistics.median(latencies),
+        "mean_ms": statistics.mean(latencies),
+        "failures": failures
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Llamadas al LLM y latencia: agente ReAct vs tool calling nativo")
+    parser.add_argument("--provider", help="Proveedor LLM (por defecto el de settings)")
+    parser.add_argument("--model", help="Modelo del proveedor")
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    from app.config import settings
+    from app.llm.agent import ChatFitAgent
+
+    settings.response_cache_enabled = False
+
+    print(f"\n{Colors.BLUE}{'='*60}{Colors.END}")
+    print(f"{Colors.BLUE}🛠️ BENCHMARK MODOS DEL AGENTE (ReAct vs tools){Colors.END}")
+    print(f"{Colors.BLUE}{'='*60}{Colors.END}")
+
+    results = {}
+    for mode in ("react", "tools"):
+        agent = ChatFitAgent(llm_provider=args.provider, model_name=args.model, agent_mode=mode)
+        if agent.agent_executor is None or agent.agent_mode != mode:
+            print_error(f"Agente en modo {mode} no disponible con este proveedor/modelo")
+            return False
+        results[mode] = asyncio.run(run_mode(agent, args.repeat))
+
+    print_info(f"{agent.llm_provider}, {len(QUESTIONS) * args.repeat} preguntas por modo")
+    print_test("Resultados")
+    for mode, report in results.items():
+        print(
+            f"{mode:<6} llamadas LLM={report['llm_calls']:.2f}  herramientas={report['tools']:.2f}  "
+            f"p50={report['p50_ms']:.0f}ms  media={report['mean_ms']:.0f}ms  fallos={report['failures']}"
+        )
+
+    react, tools = results["react"], results["tools"]
+    if tools["llm_calls"] < react["llm_calls"] and tools["p50_ms"] < react["p50_ms"]:
+        print_success(
+            f"Tool calling nativo: {react['llm_calls'] - tools['llm_calls']:.2f} llamadas menos por pregunta, "
+            f"p50 {react['p50_ms'] / tools['p50_ms']:.1f}x menor"
+        )
+        return True
+    print_error("El tool calling nativo no reduce llamadas y latencia con este modelo")
+    return False
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
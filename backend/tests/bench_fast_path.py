@@ -0,0 +1,118 @@
+"""
+Benchmark de la ruta rápida (calculadoras sin el bucle del agente)
+Ejecutar: python tests/bench_fast_path.py [--provider ollama] [--model llama3.1:8b] [--router-only]
+
+No necesita el servidor. Con un tráfico mixto de preguntas mide:
+- qué parte del tráfico responde la ruta rápida (solo el enrutador, sin LLM)
+- p50 de las preguntas enrutadas con la ruta rápida frente al agente
+  completo (`achat` con FAST_PATH_ENABLED desactivado)
+
+La caché de respuestas se desactiva para medir siempre al agente.
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from test_backend import Colors, print_test, print_success, print_error, print_info
+
+# Tráfico mixto: calculadoras, información general y peticiones abiertas
+TRAFFIC = [
+    "¿Cuál es mi IMC?",
+    "Calcula mi IMC si peso 82 kg y mido 1,80",
+    "¿Cuántas calorías necesito al día?",
+    "¿Cuál es mi frecuencia cardíaca máxima?",
+    "Dime mis zonas de entrenamiento, en reposo tengo 58",
+    "Hoy llevo 7.500 pasos, ¿voy bien?",
+    "¿Cómo voy de pasos hoy?",
+    "¿Cuántas horas debería dormir?",
+    "¿Cuánta agua tengo que beber si entreno una hora?",
+    "Dame un plan de dieta para perder grasa",
+    "¿Por qué es importante el entrenamiento de fuerza?",
+    "¿Qué es el sueño REM?",
+]
+
+WEARABLE = {
+    "steps": 7500,
+    "heart_rate": 74,
+    "calories": 1900,
+    "sleep_hours": 6.8,
+    "distance_km": 5.2,
+    "active_minutes": 42,
+    "battery_level": 80,
+    "device_model": "Xiaomi Band 8",
+    "mock_data": True
+}
+
+
+async def latencies(agent, questions) -> list:
+    timings = []
+    for question in questions:
+        started = time.perf_counter()
+        await agent.achat(question, wearable_data=WEARABLE)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cuota de tráfico y latencia de la ruta rápida")
+    parser.add_argument("--provider", help="Proveedor LLM (por defecto el de settings)")
+    parser.add_argument("--model", help="Modelo del proveedor")
+    parser.add_argument("--router-only", action="store_true", help="Solo la cuota de tráfico (sin LLM)")
+    args = parser.parse_args()
+
+    from app.config import settings
+    from app.llm.fast_path import CalculatorRouter
+
+    settings.response_cache_enabled = False
+
+    print(f"\n{Colors.BLUE}{'='*60}{Colors.END}")
+    print(f"{Colors.BLUE}⚡ BENCHMARK RUTA RÁPIDA (calculadoras sin agente){Colors.END}")
+    print(f"{Colors.BLUE}{'='*60}{Colors.END}")
+
+    print_test("Enrutado")
+    router = CalculatorRouter(max_chars=settings.fast_path_max_chars)
+    profile = settings.mock_user_profile
+    routed = []
+    for question in TRAFFIC:
+        match = router.route(question, WEARABLE, lambda: profile)
+        if match:
+            routed.append(question)
+            router.record(match)
+        target = ", ".join(name for name, _ in match.calls) if match else "agente"
+        print(f"  {question[:55]:<55} → {target}")
+    stats = router.stats()
+    print_info(f"{stats['routed']}/{stats['requests']} preguntas por la ruta rápida ({stats['share']:.0%} del tráfico)")
+
+    if args.router_only:
+        return bool(routed)
+
+    from app.llm.agent import ChatFitAgent
+
+    agent = ChatFitAgent(llm_provider=args.provider, model_name=args.model)
+    if agent.llm is None:
+        print_error("LLM no disponible con este proveedor")
+        return False
+
+    print_test("Latencia de las preguntas enrutadas")
+    settings.fast_path_enabled = False
+    agent_p50 = statistics.median(asyncio.run(latencies(agent, routed)))
+    settings.fast_path_enabled = True
+    fast_p50 = statistics.median(asyncio.run(latencies(agent, routed)))
+    print(f"agente completo p50={agent_p50:.0f}ms")
+    print(f"ruta rápida     p50={fast_p50:.1f}ms (redacción con LLM: {'sí' if settings.fast_path_phrasing else 'no'})")
+
+    if fast_p50 < agent_p50:
+        print_success(f"p50 {agent_p50 / fast_p50:.0f}x menor con la ruta rápida")
+        return True
+    print_error("La ruta rápida no reduce la latencia")
+    return False
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
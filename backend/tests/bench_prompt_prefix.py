@@ -0,0 +1,140 @@
+"""
+Benchmark del tiempo hasta el primer token (TTFT) en un chat multiturno
+Ejecutar: python tests/bench_prompt_prefix.py [--provider ollama] [--model llama3.1:8b] [--turns 6]
+
+No necesita el servidor: crea el ChatFitAgent en proceso y envía al LLM el
+primer paso del bucle ReAct de cada turno con dos disposiciones del prompt:
+
+- volátil: wearable y RAG delante de las instrucciones (lo que cambia en
+  cada turno invalida la caché KV de todo lo que viene detrás)
+- estable: el prompt actual del agente (instrucciones + herramientas + perfil
+  idénticos entre turnos, después wearable, historial, RAG y pregunta)
+
+Cada disposición se mide en una conversación completa propia para que no se
+pisen la caché del backend. Solo tiene sentido con backends locales (Ollama,
+HuggingFace); con HuggingFace no hay streaming y se mide la respuesta entera.
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from test_backend import Colors, print_test, print_success, print_error, print_info
+
+QUESTIONS = [
+    "¿Cuántos pasos debería dar al día?",
+    "¿Y cuántas calorías quemo con eso?",
+    "¿Cuál es mi frecuencia cardíaca máxima?",
+    "¿En qué zona debería entrenar para perder grasa?",
+    "¿Cuántas horas debería dormir?",
+    "¿Cuánta agua tengo que beber si entreno una hora?",
+    "¿Cuántas series hago para ganar fuerza?",
+    "¿Cuál es mi IMC?",
+]
+
+ASSISTANT_REPLY = "Depende de tu objetivo; con tus datos de hoy vas por buen camino. 💪"
+
+
+def wearable_for_turn(turn: int) -> dict:
+    """Datos del wearable que avanzan entre turnos, como con la sincronización real"""
+    return {
+        "steps": 6200 + 350 * turn,
+        "heart_rate": 72 + turn % 3,
+        "calories": 1850 + 20 * turn,
+        "sleep_hours": 7.2,
+        "distance_km": round(4.1 + 0.25 * turn, 2),
+        "active_minutes": 38 + 3 * turn,
+        "battery_level": 81 - turn,
+        "device_model": "Xiaomi Band 8",
+        "mock_data": True
+    }
+
+
+def stable_prompt(agent, message, history, docs, wearable) -> str:
+    return agent.format_prompt(agent._build_input(message, history, docs), agent._user_context(wearable))
+
+
+def volatile_prompt(agent, message, history, docs, wearable) -> str:
+    """Mismo contenido, con lo que cambia en cada turno al principio"""
+    context = agent._user_context(wearable)
+    rag_context = agent._format_rag_context(docs)
+    return (
+        f"{context['wearable_context']}\n{rag_context}"
+        + agent.format_prompt(
+            agent._build_input(message, history),
+            {"profile_context": context["profile_context"], "wearable_context": ""}
+        )
+    )
+
+
+def first_token_ms(llm, prompt: str) -> float:
+    started = time.perf_counter()
+    for _ in llm.stream(prompt, stop=["\nObservation"]):
+        break
+    return (time.perf_counter() - started) * 1000
+
+
+def run_conversation(agent, build_prompt, turns, docs_by_turn):
+    history, timings = [], []
+    for turn in range(turns):
+        message = QUESTIONS[turn % len(QUESTIONS)]
+        prompt = build_prompt(agent, message, history, docs_by_turn[turn], wearable_for_turn(turn))
+        timings.append(first_token_ms(agent.llm, prompt))
+        history += [{"role": "user", "content": message}, {"role": "assistant", "content": ASSISTANT_REPLY}]
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TTFT multiturno: prompt con prefijo estable vs volátil")
+    parser.add_argument("--provider", help="Proveedor LLM (por defecto el de settings)")
+    parser.add_argument("--model", help="Modelo del proveedor")
+    parser.add_argument("--turns", type=int, default=6)
+    args = parser.parse_args()
+
+    from app.llm.agent import ChatFitAgent
+
+    print(f"\n{Colors.BLUE}{'='*60}{Colors.END}")
+    print(f"{Colors.BLUE}⏱️ BENCHMARK TTFT (prefijo estable vs volátil){Colors.END}")
+    print(f"{Colors.BLUE}{'='*60}{Colors.END}")
+
+    agent = ChatFitAgent(llm_provider=args.provider, model_name=args.model)
+    if agent.llm is None or agent.prompt is None:
+        print_error("Agente no disponible con este proveedor")
+        return False
+
+    docs_by_turn = [ChatFitAgent._retrieve(QUESTIONS[turn % len(QUESTIONS)]) for turn in range(args.turns)]
+    print_info(f"{agent.llm_provider}, {args.turns} turnos")
+
+    print_test("Resultados")
+    results = {}
+    for name, build_prompt in [("volátil", volatile_prompt), ("estable", stable_prompt)]:
+        timings = run_conversation(agent, build_prompt, args.turns, docs_by_turn)
+        results[name] = timings
+        warm = timings[1:] or timings
+        print(
+            f"{name:<8} turno 1={timings[0]:.0f}ms  "
+            f"turnos 2+: p50={statistics.median(warm):.0f}ms  max={max(warm):.0f}ms"
+        )
+
+    try:
+        from app.llm.hf_server import hf_server_stats
+        for stats in hf_server_stats():
+            print_info(f"HF {stats['model']}: {stats['prefix_hits']} reutilizaciones, {stats['prefix_tokens_reused']} tokens")
+    except Exception:
+        pass
+
+    volatile_p50 = statistics.median(results["volátil"][1:] or results["volátil"])
+    stable_p50 = statistics.median(results["estable"][1:] or results["estable"])
+    if stable_p50 < volatile_p50:
+        print_success(f"TTFT {volatile_p50 / stable_p50:.1f}x menor con el prefijo estable")
+        return True
+    print_error("El prefijo estable no reduce el TTFT con este backend")
+    return False
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,159 @@
+"""
+Evaluación de la recuperación RAG: densa (actual) frente a híbrida (BM25 + RRF)
+Ejecutar: python tests/eval_retrieval.py [--k 1 3 5] [--queries consultas.jsonl] [--persist-dir ./data/chroma]
+
+No necesita el servidor: crea el VectorStore en proceso. Sin --persist-dir usa
+una colección temporal con solo el conocimiento inicial, así los resultados
+son reproducibles.
+
+Formato de --queries (una consulta por línea):
+    {"query": "...", "expected": {"topic": "calorias"}, "filter": {"category": "nutrition"}}
+Un resultado es relevante si sus metadatos contienen todos los campos de "expected".
+"""
+
+import argparse
+import json
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from test_backend import Colors, print_test, print_success, print_error, print_info
+
+# Consultas sobre el conocimiento inicial (VectorStore._populate_initial_knowledge)
+DEFAULT_QUERIES = [
+    {"query": "¿Cómo calculo mis calorías con la fórmula Mifflin-St Jeor?", "expected": {"topic": "calorias"}},
+    {"query": "TDEE hombres 10 × peso", "expected": {"topic": "calorias"}},
+    {"query": "déficit de 500 kcal para perder peso", "expected": {"topic": "calorias"}},
+    {"query": "¿Qué es el IMC?", "expected": {"topic": "IMC"}},
+    {"query": "IMC 27 sobrepeso", "expected": {"topic": "IMC"}},
+    {"query": "¿cuántos pasos debo dar al día?", "expected": {"topic": "pasos"}},
+    {"query": "10,000 pasos diarios", "expected": {"topic": "pasos"}},
+    {"query": "150 minutos de actividad aeróbica a la semana", "expected": {"topic": "pasos"}},
+    {"query": "frecuencia cardíaca máxima 220 - edad", "expected": {"topic": "frecuencia_cardiaca"}},
+    {"query": "pulso en reposo normal bpm", "expected": {"topic": "frecuencia_cardiaca"}},
+    {"query": "zonas de entrenamiento 70-80%", "expected": {"topic": "frecuencia_cardiaca"}},
+    {"query": "¿cuántas horas debo dormir?", "expected": {"topic": "sueno"}},
+    {"query": "fase REM y sueño profundo", "expected": {"topic": "sueno"}},
+    {"query": "¿cuánta agua tengo que beber?", "expected": {"topic": "hidratacion"}},
+    {"query": "500ml por hora de ejercicio", "expected": {"topic": "hidratacion"}},
+    {"query": "series y repeticiones para hipertrofia", "expected": {"topic": "fuerza"}},
+    {"query": "entrenamiento de fuerza 2 sesiones", "expected": {"topic": "fuerza"}},
+    {"query": "descanso entre series", "expected": {"topic": "fuerza"}},
+    {"query": "recomendaciones ACSM de pesas", "expected": {"topic": "fuerza"}, "filter": {"category": "exercise"}},
+    {"query": "National Sleep Foundation", "expected": {"topic": "sueno"}, "filter": {"category": "health"}},
+]
+
+
+def load_queries(path):
+    if not path:
+        return DEFAULT_QUERIES
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def is_relevant(document: dict, expected: dict) -> bool:
+    metadata = document.get("metadata") or {}
+    return all(metadata.get(key) == value for key, value in expected.items())
+
+
+def evaluate(name: str, retrieve, queries, ks):
+    """recall@k (al menos un resultado relevante en los k primeros) y latencia por consulta"""
+    max_k = max(ks)
+    hits = {k: 0 for k in ks}
+    latencies = []
+    misses = []
+
+    for item in queries:
+        started = time.perf_counter()
+        results = retrieve(item["query"], max_k, item.get("filter"))
+        latencies.append((time.perf_counter() - started) * 1000)
+
+        ranks = [i for i, doc in enumerate(results) if is_relevant(doc, item["expected"])]
+        first = ranks[0] + 1 if ranks else None
+        for k in ks:
+            if first is not None and first <= k:
+                hits[k] += 1
+        if first is None or first > 1:
+            misses.append((item["query"], first))
+
+    latencies.sort()
+    return {
+        "name": name,
+        "recall": {k: hits[k] / len(queries) for k in ks},
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))],
+        "misses": misses
+    }
+
+
+def print_report(report, ks):
+    recalls = "  ".join(f"R@{k}={report['recall'][k]:.2f}" for k in ks)
+    print(f"{report['name']:<8} {recalls}  p50={report['p50_ms']:.1f}ms  p95={report['p95_ms']:.1f}ms")
+    for query, first in report["misses"]:
+        where = f"posición {first}" if first else "no encontrado"
+        print(f"         · {query!r}: {where}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="recall@k y latencia de la recuperación RAG")
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 3, 5])
+    parser.add_argument("--queries", help="JSONL con consultas etiquetadas")
+    parser.add_argument("--persist-dir", help="Colección existente (por defecto una temporal)")
+    args = parser.parse_args()
+
+    from app.config import settings
+
+    temp_dir = None
+    if args.persist_dir:
+        settings.chroma_persist_dir = args.persist_dir
+    else:
+        temp_dir = tempfile.mkdtemp(prefix="chatfit-eval-")
+        settings.chroma_persist_dir = temp_dir
+        settings.embedding_cache_path = ""
+
+    print(f"\n{Colors.BLUE}{'='*60}{Colors.END}")
+    print(f"{Colors.BLUE}🔎 EVALUACIÓN DE RECUPERACIÓN (densa vs híbrida){Colors.END}")
+    print(f"{Colors.BLUE}{'='*60}{Colors.END}")
+
+    try:
+        from app.rag.vector_store import vector_store
+        if vector_store is None:
+            print_error("Vector store no disponible")
+            return False
+
+        queries = load_queries(args.queries)
+        print_info(f"{len(queries)} consultas, {len(vector_store.bm25)} chunks en la colección")
+
+        def dense(query, k, filter):
+            return vector_store.similarity_search(query, k=k, filter=vector_store._chroma_where(filter))
+
+        def hybrid(query, k, filter):
+            return vector_store.hybrid_search(query, k=k, filter=filter)
+
+        # Calentar modelo y caché de embeddings para comparar solo la recuperación
+        for item in queries:
+            vector_store.embeddings.embed_query(item["query"])
+
+        print_test("Resultados")
+        reports = [evaluate("dense", dense, queries, args.k), evaluate("hybrid", hybrid, queries, args.k)]
+        for report in reports:
+            print_report(report, args.k)
+
+        dense_report, hybrid_report = reports
+        if all(hybrid_report["recall"][k] >= dense_report["recall"][k] for k in args.k):
+            print_success("La recuperación híbrida iguala o mejora a la densa en todos los k")
+            return True
+        print_error("La recuperación híbrida empeora en algún k")
+        return False
+    finally:
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
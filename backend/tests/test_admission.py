@@ -0,0 +1,202 @@
+"""
+Prueba del control de admisión con un backend LLM simulado
+Ejecutar: python tests/test_admission.py [--capacity 2] [--requests 60]
+
+No necesita el servidor ni un LLM: las peticiones ocupan un backend simulado
+que, como Ollama en una sola GPU, reparte su capacidad entre las peticiones
+activas y pierde eficiencia cuando hay demasiadas a la vez. Se comparan:
+
+- sin admisión: todas entran a la vez y agotan su plazo
+- con admisión: entran `capacity` a la vez, el resto espera o se rechaza pronto
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from test_backend import Colors, print_test, print_success, print_error, print_info
+
+from app.config import settings
+from app.core.deadline import Deadline
+from app.llm.admission import AdmissionController, AdmissionRejected
+
+PROVIDER = "simulado"
+MODEL = "backend"
+SERVICE_SECONDS = 0.2  # una petición sola
+DEADLINE_SECONDS = 3.0
+
+
+class SimulatedBackend:
+    """Procesador compartido: con n > capacity activas cada una avanza más despacio (y se pierde eficiencia)"""
+
+    def __init__(self, capacity: int, service_seconds: float, thrash: float = 0.1):
+        self.capacity = capacity
+        self.service_seconds = service_seconds
+        self.thrash = thrash
+        self.active = 0
+
+    def _rate(self) -> float:
+        share = self.capacity / max(self.capacity, self.active)
+        overload = max(0, self.active - self.capacity)
+        return share / (1 + self.thrash * overload) / self.service_seconds
+
+    async def generate(self, deadline: Deadline):
+        self.active += 1
+        try:
+            progress = 0.0
+            while progress < 1.0:
+                if deadline.expired:
+                    raise TimeoutError("plazo agotado")
+                await asyncio.sleep(0.01)
+                progress += 0.01 * self._rate()
+        finally:
+            self.active -= 1
+
+
+async def run_load(backend, controller, requests: int, sessions: int) -> dict:
+    """Ráfaga de peticiones simultáneas repartidas entre sesiones"""
+    outcome = {"ok": 0, "timeout": 0, 429: 0, 503: 0}
+    latencies = []
+
+    async def one(index: int):
+        deadline = Deadline(DEADLINE_SECONDS)
+        started = time.perf_counter()
+        try:
+            if controller is None:
+                await backend.generate(deadline)
+            else:
+                async with controller.slot(PROVIDER, MODEL, f"s{index % sessions}", deadline):
+                    await backend.generate(deadline)
+            outcome["ok"] += 1
+            latencies.append(time.perf_counter() - started)
+        except AdmissionRejected as e:
+            outcome[e.status_code] += 1
+        except TimeoutError:
+            outcome["timeout"] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*[one(i) for i in range(requests)])
+    outcome["elapsed"] = time.perf_counter() - started
+    outcome["goodput"] = outcome["ok"] / outcome["elapsed"]
+    outcome["p50"] = sorted(latencies)[len(latencies) // 2] if latencies else 0.0
+    return outcome
+
+
+def describe(name: str, outcome: dict):
+    print(
+        f"{name:<14} ok={outcome['ok']:<3} plazo={outcome['timeout']:<3} 429={outcome[429]:<3} 503={outcome[503]:<3} "
+        f"goodput={outcome['goodput']:.1f}/s p50={outcome['p50']:.2f}s"
+    )
+
+
+async def test_overload(capacity: int, requests: int) -> bool:
+    """Con sobrecarga, las respuestas a tiempo por segundo se mantienen en la capacidad del backend"""
+    print_test(f"Sobrecarga: {requests} peticiones simultáneas, capacidad {capacity}")
+    ideal = capacity / SERVICE_SECONDS
+    print_info(f"Capacidad del backend: {ideal:.1f} respuestas/s; plazo {DEADLINE_SECONDS:.0f}s")
+
+    without = await run_load(SimulatedBackend(capacity, SERVICE_SECONDS), None, requests, sessions=8)
+    describe("sin admisión", without)
+
+    controller = AdmissionController(max_queue=requests, max_queue_per_session=requests)
+    with_admission = await run_load(SimulatedBackend(capacity, SERVICE_SECONDS), controller, requests, sessions=8)
+    describe("con admisión", with_admission)
+
+    if with_admission["goodput"] >= 0.7 * ideal and with_admission["ok"] > without["ok"]:
+        print_success("El rendimiento útil se mantiene cerca de la capacidad del backend")
+        return True
+    print_error("El rendimiento útil cae con la sobrecarga")
+    return False
+
+
+async def test_fairness(capacity: int) -> bool:
+    """Una sesión con muchas peticiones no deja sin servicio a otra que llega después"""
+    print_test("Reparto justo entre sesiones")
+    backend = SimulatedBackend(capacity, SERVICE_SECONDS)
+    controller = AdmissionController(max_queue=64, max_queue_per_session=16)
+    order = []
+
+    async def one(session_id: str, index: int):
+        deadline = Deadline(30)
+        async with controller.slot(PROVIDER, MODEL, session_id, deadline):
+            await backend.generate(deadline)
+        order.append(f"{session_id}{index}")
+
+    flood = [asyncio.create_task(one("A", i)) for i in range(12)]
+    await asyncio.sleep(0.05)
+    late = [asyncio.create_task(one("B", i)) for i in range(2)]
+    await asyncio.gather(*flood, *late)
+
+    last_b = max(order.index("B0"), order.index("B1"))
+    print_info(f"Orden de finalización: {' '.join(order)}")
+    if last_b < capacity + 4:
+        print_success(f"Las peticiones de B terminan en la posición {last_b + 1} de {len(order)}")
+        return True
+    print_error(f"B espera detrás de A (posición {last_b + 1} de {len(order)})")
+    return False
+
+
+async def test_rejections() -> bool:
+    """Cola llena → 503, demasiadas peticiones de una sesión → 429, ambas con Retry-After"""
+    print_test("Rechazos anticipados")
+    backend = SimulatedBackend(1, 1.0)
+    controller = AdmissionController(max_queue=3, max_queue_per_session=2)
+    errors = []
+
+    async def one(session_id: str):
+        deadline = Deadline(30)
+        try:
+            async with controller.slot(PROVIDER, MODEL, session_id, deadline):
+                await backend.generate(deadline)
+        except AdmissionRejected as e:
+            errors.append((session_id, e.status_code, e.retry_after))
+
+    tasks = [asyncio.create_task(one(session)) for session in ["A", "A", "A", "A", "B", "C", "D"]]
+    await asyncio.sleep(0.1)
+    rejected = list(errors)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    statuses = sorted(status for _, status, _ in rejected)
+    print_info(f"Rechazos: {rejected}")
+    lane = controller.stats()["lanes"][f"{PROVIDER}/{MODEL}"]
+    if statuses == [429, 503, 503] and all(retry >= 1 for _, _, retry in rejected) and lane["active"] == 0 and lane["queued"] == 0:
+        print_success("429 por sesión y 503 con la cola llena, con Retry-After; huecos liberados al cancelar")
+        return True
+    print_error(f"Rechazos inesperados: {statuses}; estado final {lane}")
+    return False
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Control de admisión con backend simulado")
+    parser.add_argument("--capacity", type=int, default=2)
+    parser.add_argument("--requests", type=int, default=60)
+    args = parser.parse_args()
+
+    settings.admission_model_limits = {f"{PROVIDER}/{MODEL}": args.capacity}
+    settings.admission_initial_service_seconds = SERVICE_SECONDS
+
+    print(f"\n{Colors.BLUE}{'='*60}{Colors.END}")
+    print(f"{Colors.BLUE}🚦 CONTROL DE ADMISIÓN{Colors.END}")
+    print(f"{Colors.BLUE}{'='*60}{Colors.END}")
+
+    results = [await test_overload(args.capacity, args.requests), await test_fairness(args.capacity)]
+    settings.admission_model_limits = {f"{PROVIDER}/{MODEL}": 1}
+    results.append(await test_rejections())
+
+    print(f"\n{Colors.BLUE}{'='*60}{Colors.END}")
+    if all(results):
+        print(f"{Colors.GREEN}✅ TODAS LAS PRUEBAS DE ADMISIÓN PASARON{Colors.END}")
+    else:
+        print(f"{Colors.RED}❌ {results.count(False)} PRUEBAS FALLARON{Colors.END}")
+    print(f"{Colors.BLUE}{'='*60}{Colors.END}\n")
+    return all(results)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(main()) else 1)
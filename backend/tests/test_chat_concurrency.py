@@ -0,0 +1,203 @@
+"""
+Prueba de estrés de escrituras concurrentes en el historial de chats
+Ejecutar: python tests/test_chat_concurrency.py [--backend sqlite|json]
+
+No necesita el servidor: usa ChatMemoryDB en proceso sobre un directorio
+temporal. Los mensajes se añaden con la misma ruta que ChatMemoryDB.add_message
+(ChatCache.append_message) pero sin la indexación RAG, para medir solo el
+almacenamiento.
+"""
+
+import argparse
+import asyncio
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from test_backend import Colors, print_test, print_success, print_error, print_info
+
+from app.database import chat_db
+from app.database.chat_db import ChatMemoryDB
+from app.database.models import Message
+
+NUM_CHATS = 20
+MESSAGES_PER_CHAT = 25
+WORKERS = 32
+
+
+def reset_db(data_dir: Path):
+    """Apunta ChatMemoryDB a `data_dir` y descarta el backend/caché actuales"""
+    chat_db.CHATS_FILE = data_dir / "chats.json"
+    chat_db.MEMORY_FILE = data_dir / "memory.json"
+    chat_db.CHATS_DB_FILE = data_dir / "chats.db"
+    chat_db.CHATS_JOURNAL_FILE = data_dir / "chats.journal.jsonl"
+    chat_db._store = None
+    chat_db._cache = None
+
+
+def add_message(chat_id: str, content: str) -> bool:
+    message = Message(role="user", content=content)
+    return chat_db.get_cache().append_message(chat_id, message, datetime.now().isoformat())
+
+
+def expected_contents(chat_index: int):
+    return {f"chat{chat_index}-msg{i}" for i in range(MESSAGES_PER_CHAT)}
+
+
+def check_chats(chat_ids, label: str) -> bool:
+    ok = True
+    for index, chat_id in enumerate(chat_ids):
+        chat = ChatMemoryDB.get_chat(chat_id)
+        contents = [m.content for m in chat.messages] if chat else []
+        if len(contents) != MESSAGES_PER_CHAT or set(contents) != expected_contents(index):
+            print_error(f"{label}: chat {chat_id} tiene {len(contents)}/{MESSAGES_PER_CHAT} mensajes")
+            ok = False
+    if ok:
+        print_success(f"{label}: {len(chat_ids) * MESSAGES_PER_CHAT} mensajes sin pérdidas")
+    return ok
+
+
+def test_parallel_threads(data_dir: Path) -> bool:
+    """Cientos de add_message en paralelo (hilos) repartidos entre chats"""
+    print_test(f"{NUM_CHATS * MESSAGES_PER_CHAT} mensajes desde {WORKERS} hilos")
+
+    chat_ids = [ChatMemoryDB.create_chat(f"Estrés {i}") for i in range(NUM_CHATS)]
+    jobs = [
+        (chat_id, f"chat{index}-msg{i}")
+        for i in range(MESSAGES_PER_CHAT)
+        for index, chat_id in enumerate(chat_ids)
+    ]
+
+    with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+        results = list(pool.map(lambda job: add_message(*job), jobs))
+
+    if not all(results):
+        print_error(f"{results.count(False)} add_message devolvieron False")
+        return False
+
+    ok = check_chats(chat_ids, "En caché")
+    ChatMemoryDB.flush()
+
+    # Releer desde disco con un backend nuevo
+    reset_db(data_dir)
+    return check_chats(chat_ids, "Tras recargar de disco") and ok
+
+
+async def test_parallel_tasks(data_dir: Path) -> bool:
+    """Lo mismo desde corrutinas (asyncio.to_thread), como en los endpoints"""
+    print_test(f"{NUM_CHATS * MESSAGES_PER_CHAT} mensajes desde tareas asyncio")
+
+    chat_ids = [ChatMemoryDB.create_chat(f"Async {i}") for i in range(NUM_CHATS)]
+    results = await asyncio.gather(*[
+        asyncio.to_thread(add_message, chat_id, f"chat{index}-msg{i}")
+        for i in range(MESSAGES_PER_CHAT)
+        for index, chat_id in enumerate(chat_ids)
+    ])
+
+    if not all(results):
+        print_error(f"{results.count(False)} add_message devolvieron False")
+        return False
+
+    ChatMemoryDB.flush()
+    reset_db(data_dir)
+    return check_chats(chat_ids, "Tareas asyncio")
+
+
+def test_turns_stay_together() -> bool:
+    """Con lock_chat, pregunta y respuesta de cada turno quedan consecutivas"""
+    print_test("Turnos concurrentes sobre el mismo chat")
+
+    chat_id = ChatMemoryDB.create_chat("Turnos")
+    turns = 200
+
+    def turn(i: int):
+        with ChatMemoryDB.lock_chat(chat_id):
+            add_message(chat_id, f"q{i}")
+            time.sleep(0)  # cede el GIL entre los dos mensajes
+            add_message(chat_id, f"a{i}")
+
+    with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+        list(pool.map(turn, range(turns)))
+
+    contents = [m.content for m in ChatMemoryDB.get_chat(chat_id).messages]
+    pairs = list(zip(contents[::2], contents[1::2]))
+    broken = [p for p in pairs if p[0][1:] != p[1][1:] or p[0][0] != "q"]
+
+    if len(contents) == turns * 2 and not broken:
+        print_success(f"{turns} turnos sin intercalar")
+        return True
+    print_error(f"{len(contents)} mensajes, {len(broken)} turnos intercalados")
+    return False
+
+
+def test_throughput() -> bool:
+    """Mensajes/s con 1, 4 y 16 hilos; los locks por chat no deben colapsar el rendimiento"""
+    print_test("Rendimiento según número de hilos")
+
+    total = 2000
+    rates = {}
+    for workers in (1, 4, 16):
+        chat_ids = [ChatMemoryDB.create_chat(f"Bench {workers}-{i}") for i in range(50)]
+        jobs = [(chat_ids[i % len(chat_ids)], f"m{i}") for i in range(total)]
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(lambda job: add_message(*job), jobs))
+        elapsed = time.perf_counter() - start
+
+        rates[workers] = total / elapsed
+        print_info(f"{workers:>2} hilos: {rates[workers]:,.0f} mensajes/s")
+
+    ChatMemoryDB.flush()
+
+    # Con el GIL no se espera escalado lineal de trabajo en memoria; lo que se
+    # comprueba es que más hilos no degraden el rendimiento por contención
+    if rates[16] >= rates[1] * 0.5:
+        print_success("El rendimiento se mantiene al aumentar la concurrencia")
+        return True
+    print_error("El rendimiento cae con la concurrencia (contención de locks)")
+    return False
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Estrés de escrituras concurrentes en chats")
+    parser.add_argument("--backend", choices=["sqlite", "json"], default="sqlite")
+    args = parser.parse_args()
+
+    from app.config import settings
+    settings.chat_storage_backend = args.backend
+
+    print(f"\n{Colors.BLUE}{'='*60}{Colors.END}")
+    print(f"{Colors.BLUE}🧵 CONCURRENCIA DEL HISTORIAL DE CHATS ({args.backend}){Colors.END}")
+    print(f"{Colors.BLUE}{'='*60}{Colors.END}")
+
+    data_dir = Path(tempfile.mkdtemp(prefix="chatfit-stress-"))
+    reset_db(data_dir)
+    try:
+        results = [
+            test_parallel_threads(data_dir),
+            await test_parallel_tasks(data_dir),
+            test_turns_stay_together(),
+            test_throughput(),
+        ]
+    finally:
+        ChatMemoryDB.flush()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    print(f"\n{Colors.BLUE}{'='*60}{Colors.END}")
+    if all(results):
+        print(f"{Colors.GREEN}✅ TODAS LAS PRUEBAS DE CONCURRENCIA PASARON{Colors.END}")
+    else:
+        print(f"{Colors.RED}❌ {results.count(False)} PRUEBAS FALLARON{Colors.END}")
+    print(f"{Colors.BLUE}{'='*60}{Colors.END}\n")
+    return all(results)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(main()) else 1)
@@ -0,0 +1,104 @@
+"""
+Prueba del enrutado de la ruta rápida (intención y argumentos de cada pregunta)
+Ejecutar: python tests/test_fast_path.py
+
+No necesita el servidor ni un LLM: se comprueba qué herramientas y con qué
+argumentos elige `CalculatorRouter.route` para cada pregunta, con un perfil
+y datos del wearable fijos. Incluye casos negativos: cifras que son metas,
+de otra persona, del pasado o en otras unidades, y preguntas generales o de
+valoración, deben ir al agente (None), no a la calculadora.
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from test_backend import Colors, print_test, print_success, print_error, print_info
+
+from app.llm.fast_path import CalculatorRouter
+
+PROFILE = {"age": 25, "weight_kg": 70, "height_cm": 175, "gender": "male", "activity_level": "moderado"}
+WEARABLE = {"steps": 4000, "heart_rate": 72}
+
+BMI_PROFILE = [("calculate_bmi", {"weight_kg": 70, "height_cm": 175})]
+
+# (pregunta, llamadas esperadas o None si debe responder el agente)
+CASES = [
+    # Se enrutan
+    ("¿Cuál es mi IMC?", BMI_PROFILE),
+    ("Calcula mi IMC si peso 82 kg y mido 1,80", [("calculate_bmi", {"weight_kg": 82.0, "height_cm": 180.0})]),
+    ("Peso 82,5 kilos, mido 180 cm, ¿cuál es mi IMC?", [("calculate_bmi", {"weight_kg": 82.5, "height_cm": 180.0})]),
+    ("Mi peso es de 64 kg, ¿qué IMC tengo?", [("calculate_bmi", {"weight_kg": 64.0, "height_cm": 175})]),
+    ("¿Cuál es mi frecuencia cardíaca máxima?", [("calculate_target_heart_rate", {"age": 25})]),
+    ("Tengo 40 años, ¿cuál es mi frecuencia cardíaca máxima?", [("calculate_target_heart_rate", {"age": 40})]),
+    ("Dime mis zonas de entrenamiento, en reposo tengo 58", [("calculate_target_heart_rate", {"age": 25, "resting_hr": 58})]),
+    (
+        "¿Cuántas calorías necesito al día? Tengo 40 años y soy mujer sedentaria",
+        [("calculate_daily_calories", {"weight_kg": 70, "height_cm": 175, "age": 40, "gender": "mujer", "activity_level": "sedentario"})]
+    ),
+    ("Hoy llevo 7.500 pasos, ¿voy bien?", [("analyze_steps", {"steps": 7500})]),
+    ("llevo 8 mil pasos hoy", [("analyze_steps", {"steps": 8000})]),
+    ("¿Cómo voy de pasos hoy?", [("analyze_steps", {"steps": 4000})]),
+    ("Mi objetivo es 10 mil pasos, ¿cómo voy con mis pasos?", [("analyze_steps", {"steps": 4000, "goal": 10000})]),
+    ("¿Cómo voy de pasos? mi meta es 12.000", [("analyze_steps", {"steps": 4000, "goal": 12000})]),
+    # Al agente: la cifra es una meta, de otra persona o del pasado
+    ("Quiero perder 5 kilos, ¿cuántas calorías debo comer?", None),
+    ("Quiero bajar 10 kg, ¿cuál es mi IMC?", None),
+    ("¿Cuál sería mi IMC si gano 3 kilos?", None),
+    ("¿Cuál es mi frecuencia cardíaca máxima si tengo 3 años entrenando?", None),
+    ("¿Cuál es el IMC de mi hijo de 8 años que pesa 30 kg?", None),
+    ("¿Cuál era mi IMC hace 2 años cuando pesaba 95 kg?", None),
+    ("¿Cuántos pasos di ayer?", None),
+    ("Peso 82 libras, ¿mi IMC?", None),
+    # Al agente: preguntas generales, valoraciones o el valor ya dado
+    ("¿Qué es el IMC?", None),
+    ("¿Cuál es el IMC normal?", None),
+    ("¿Cuál es un buen IMC para un hombre?", None),
+    ("¿El IMC sirve para deportistas?", None),
+    ("¿Cuál es la diferencia entre IMC y porcentaje de grasa?", None),
+    ("Mi IMC es 31, ¿es peligroso?", None),
+    ("Tengo un IMC de 27, ¿qué opinas?", None),
+    ("¿Qué zona de frecuencia cardíaca es mejor para quemar grasa?", None),
+    ("¿Cuántas calorías necesito para correr una maratón?", None),
+    # Al agente: piden algo más que el cálculo
+    ("Dame un plan de dieta según mi IMC", None),
+    ("¿Qué es el sueño REM?", None),
+]
+
+
+def describe(calls) -> str:
+    if calls is None:
+        return "agente"
+    return "; ".join(f"{name}({', '.join(f'{k}={v}' for k, v in args.items())})" for name, args in calls)
+
+
+def main():
+    print(f"\n{Colors.BLUE}{'='*60}{Colors.END}")
+    print(f"{Colors.BLUE}⚡ ENRUTADO DE LA RUTA RÁPIDA{Colors.END}")
+    print(f"{Colors.BLUE}{'='*60}{Colors.END}")
+
+    print_test(f"{len(CASES)} preguntas con perfil y wearable fijos")
+    router = CalculatorRouter()
+    failures = 0
+    for question, expected in CASES:
+        match = router.route(question, WEARABLE, lambda: PROFILE)
+        calls = match.calls if match else None
+        if calls == expected:
+            print(f"  ✓ {question[:60]:<60} → {describe(calls)}")
+        else:
+            failures += 1
+            print_error(f"{question}\n     esperado: {describe(expected)}\n     obtenido: {describe(calls)}")
+
+    print_info(f"{len(CASES) - failures}/{len(CASES)} casos correctos")
+    print(f"\n{Colors.BLUE}{'='*60}{Colors.END}")
+    if failures == 0:
+        print_success("Todas las preguntas se enrutan como se espera")
+    else:
+        print(f"{Colors.RED}❌ {failures} PREGUNTAS MAL ENRUTADAS{Colors.END}")
+    print(f"{Colors.BLUE}{'='*60}{Colors.END}\n")
+    return failures == 0
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,199 @@
+"""
+Prueba del enrutado entre proveedores con backends LLM simulados
+Ejecutar: python tests/test_llm_router.py
+
+No necesita el servidor ni un LLM real: cada backend simulado tarda un
+tiempo configurable en dar el primer token, emite unos cuantos tokens y
+puede fallar con un código HTTP (429, 503, 400). Se comprueba:
+
+- failover: un 429 se repite en el siguiente backend y el primero se enfría
+- hedging: si el primario tarda en empezar, responde el segundo y solo sus
+  tokens llegan al cliente
+- reparto: con latencias medidas, el tráfico va al backend más rápido
+- un error de la petición (400) no se repite en otros backends
+"""
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+from typing import Any, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from test_backend import Colors, print_test, print_success, print_error, print_info
+
+from langchain_core.callbacks import AsyncCallbackHandler
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from app.config import settings
+from app.llm.llm_router import RoutedBackend, RoutingChatModel, llm_router
+
+
+class SimulatedError(Exception):
+    """Error HTTP de un proveedor (mismo atributo que openai/groq APIStatusError)"""
+
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class SimulatedBackend(BaseChatModel):
+    """Backend con latencia de primer token, tokens emitidos y fallo configurables"""
+    label: str
+    first_token_seconds: float = 0.05
+    tokens: int = 5
+    fail_status: Optional[int] = None
+    calls: int = 0
+    cancelled: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "simulated"
+
+    def _generate(self, messages: List[Any], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        self.calls += 1
+        time.sleep(self.first_token_seconds)
+        if self.fail_status:
+            raise SimulatedError(self.fail_status)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.label))])
+
+    async def _agenerate(self, messages: List[Any], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.first_token_seconds)
+            if self.fail_status:
+                raise SimulatedError(self.fail_status)
+            for index in range(self.tokens):
+                if run_manager:
+                    await run_manager.on_llm_new_token(f"{self.label}{index} ")
+                await asyncio.sleep(0.01)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.label))])
+
+
+class TokenCollector(AsyncCallbackHandler):
+    def __init__(self):
+        self.tokens: List[str] = []
+
+    async def on_llm_new_token(self, token: str, **kwargs):
+        self.tokens.append(token)
+
+
+def routing_model(name: str, *backends: SimulatedBackend) -> RoutingChatModel:
+    """Pool con proveedores únicos por prueba (la salud de llm_router es global)"""
+    return RoutingChatModel([
+        RoutedBackend(f"{name}-{backend.label}", "sim", 1.0, backend, llm_router.health(f"{name}-{backend.label}", "sim"))
+        for backend in backends
+    ])
+
+
+async def ask(model: RoutingChatModel) -> tuple:
+    collector = TokenCollector()
+    started = time.perf_counter()
+    message = await model.ainvoke([HumanMessage(content="hola")], config={"callbacks": [collector]})
+    return message.content, collector.tokens, time.perf_counter() - started
+
+
+async def test_failover() -> bool:
+    """429 en el primario → responde el segundo; el primario no recibe tráfico durante el enfriamiento"""
+    print_test("Failover ante 429")
+    settings.llm_routing_hedge_seconds = 0
+    limited = SimulatedBackend(label="A", fail_status=429)
+    healthy = SimulatedBackend(label="B")
+    model = routing_model("failover", limited, healthy)
+
+    answers = [(await ask(model))[0] for _ in range(3)]
+    print_info(f"Respuestas: {answers}; llamadas A={limited.calls} B={healthy.calls}")
+    if answers == ["B", "B", "B"] and limited.calls == 1:
+        print_success("El 429 se repite en B y A queda fuera mientras se enfría")
+        return True
+    print_error("El failover no se comporta como se espera")
+    return False
+
+
+async def test_hedging() -> bool:
+    """Primario lento en empezar → el hedge responde antes y solo sus tokens llegan al cliente"""
+    print_test("Hedging del primer token")
+    slow = dict(label="A", first_token_seconds=1.5)
+    fast = dict(label="B", first_token_seconds=0.1)
+
+    settings.llm_routing_hedge_seconds = 0
+    _, _, without_hedge = await ask(routing_model("nohedge", SimulatedBackend(**slow), SimulatedBackend(**fast)))
+
+    settings.llm_routing_hedge_seconds = 0.2
+    primary = SimulatedBackend(**slow)
+    model = routing_model("hedge", primary, SimulatedBackend(**fast))
+    answer, tokens, with_hedge = await ask(model)
+    await asyncio.sleep(0.05)
+
+    print_info(f"Sin hedging {without_hedge:.2f}s, con hedging {with_hedge:.2f}s; tokens: {''.join(tokens).strip()}")
+    if answer == "B" and with_hedge < without_hedge / 2 and all(token.startswith("B") for token in tokens) and primary.cancelled == 1:
+        print_success("Gana el hedge, el primario se cancela y no se mezclan tokens")
+        return True
+    print_error("El hedging no reduce la latencia o mezcla respuestas")
+    return False
+
+
+async def test_fastest() -> bool:
+    """Con latencias medidas, casi todo el tráfico va al backend más rápido"""
+    print_test("Reparto al backend más rápido")
+    settings.llm_routing_hedge_seconds = 0
+    slow = SimulatedBackend(label="A", first_token_seconds=0.3)
+    fast = SimulatedBackend(label="B", first_token_seconds=0.05)
+    model = routing_model("fastest", slow, fast)
+
+    answers = [(await ask(model))[0] for _ in range(10)]
+    print_info(f"Respuestas: {''.join(answers)}")
+    if answers.count("B") >= 9:
+        print_success(f"{answers.count('B')}/10 peticiones en el backend rápido (A solo mientras no había medidas)")
+        return True
+    print_error("El tráfico no se concentra en el backend más rápido")
+    return False
+
+
+async def test_no_failover_on_bad_request() -> bool:
+    """Un 400 es un error de la petición: se propaga sin probar otros backends"""
+    print_test("Sin failover ante errores de la petición")
+    settings.llm_routing_hedge_seconds = 0
+    invalid = SimulatedBackend(label="A", fail_status=400)
+    other = SimulatedBackend(label="B")
+    try:
+        await ask(routing_model("badrequest", invalid, other))
+    except SimulatedError as e:
+        if e.status_code == 400 and other.calls == 0:
+            print_success("El 400 llega al llamador y B no recibe la petición")
+            return True
+    print_error(f"Comportamiento inesperado: llamadas B={other.calls}")
+    return False
+
+
+async def main():
+    print(f"\n{Colors.BLUE}{'='*60}{Colors.END}")
+    print(f"{Colors.BLUE}🔀 ENRUTADO ENTRE PROVEEDORES{Colors.END}")
+    print(f"{Colors.BLUE}{'='*60}{Colors.END}")
+
+    results = [
+        await test_failover(),
+        await test_hedging(),
+        await test_fastest(),
+        await test_no_failover_on_bad_request()
+    ]
+    print_info(f"Estadísticas: {llm_router.stats()['requests']} peticiones, "
+               f"{llm_router.stats()['failovers']} failovers, {llm_router.stats()['hedges']} hedges")
+
+    print(f"\n{Colors.BLUE}{'='*60}{Colors.END}")
+    if all(results):
+        print(f"{Colors.GREEN}✅ TODAS LAS PRUEBAS DE ENRUTADO PASARON{Colors.END}")
+    else:
+        print(f"{Colors.RED}❌ {results.count(False)} PRUEBAS FALLARON{Colors.END}")
+    print(f"{Colors.BLUE}{'='*60}{Colors.END}\n")
+    return all(results)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(main()) else 1)